@@ -0,0 +1,78 @@
+# Copyright 2020 Numbers Co., Ltd.
+#
+# This file is part of pyc2pa.
+#
+# pyc2pa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyc2pa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyc2pa.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Compare the CBOR backends on Claim-like objects.
+
+Usage
+    $ python3 benchmarks/bench_cbor.py [-n NUMBER]
+'''
+
+import argparse
+import hashlib
+import os
+import timeit
+
+from c2pa.codec import Cbor_backends
+from c2pa.codec import get_codec
+
+
+def create_claim(assertion_number=20):
+    return {
+        'dc:title': 'meimei-fried-chicken.jpg',
+        'dc:format': 'image/jpeg',
+        'instanceID': 'xmp:fakeid:4124fae1-1da7-4a3f-95c8-d8ae071bd048',
+        'claim_generator': 'Starling Capture',
+        'signature': 'self#jumbf=c2pa/numbersprotocol/c2pa.signature',
+        'assertions': [{
+            'url': 'self#jumbf=c2pa/numbersprotocol/c2pa.assertions/assertion.{}'.format(i),
+            'alg': 'sha256',
+            'hash': hashlib.sha256(str(i).encode('utf-8')).digest(),
+        } for i in range(assertion_number)],
+        'alg': 'sha256',
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-n', '--number', type=int, default=20000, help='Iterations per case.')
+    args = ap.parse_args()
+
+    claim = create_claim()
+    signature = [b'\xa1\x01\x38\x24', {'x5chain': os.urandom(1500)}, None, os.urandom(256)]
+
+    print('{:<8} {:<20} {:>12}'.format('backend', 'case', 'us/op'))
+    for backend in Cbor_backends:
+        try:
+            codec = get_codec(backend)
+        except ImportError:
+            print('{:<8} not installed'.format(backend))
+            continue
+        encoded = codec.dumps(claim)
+        cases = [
+            ('dumps claim', lambda: codec.dumps(claim)),
+            ('dumps canonical', lambda: codec.dumps(claim, canonical=True)),
+            ('loads claim', lambda: codec.loads(encoded)),
+            ('dumps COSE_Sign1', lambda: codec.dumps(codec.tag(18, signature))),
+        ]
+        for name, func in cases:
+            seconds = min(timeit.repeat(func, number=args.number, repeat=3))
+            print('{:<8} {:<20} {:>12.2f}'.format(backend, name, seconds / args.number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# Copyright 2020 Numbers Co., Ltd.
+#
+# This file is part of pyc2pa.
+#
+# pyc2pa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyc2pa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyc2pa.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Measure Claim creation latency with Assertions hashed one after another
+or in parallel on a ThreadPoolExecutor.
+
+Assertions are large CBOR boxes (e.g. depth maps): the hash of an
+Assertion covers its first content box only, which for codestream
+Assertions is the small embedded file description box.
+
+Usage
+    $ python3 benchmarks/bench_hashing.py [-a ASSERTIONS] [-s SIZE_MB] [-n NUMBER]
+'''
+
+import argparse
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from c2pa.core import C2paAssertionStore
+from c2pa.core import C2paClaim
+from c2pa.jumbf import create_cbor_superbox
+
+
+def measure(contents, number, executor=None):
+    '''Return the best Claim creation time in seconds.'''
+    best = None
+    for _ in range(number):
+        # new boxes every round, digests are cached by the boxes
+        assertions = [create_cbor_superbox(content, 'c2pa.depthmap.{}'.format(i))
+                      for i, content in enumerate(contents)]
+        assertion_store = C2paAssertionStore(assertions)
+        start = time.perf_counter()
+        C2paClaim(assertion_store, 'manifest', 'media.jpg', executor=executor)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-a', '--assertions', type=int, default=4, help='Number of Assertions.')
+    ap.add_argument('-s', '--size', type=float, default=16, help='Assertion size in MB.')
+    ap.add_argument('-n', '--number', type=int, default=5, help='Rounds per case.')
+    args = ap.parse_args()
+
+    contents = [os.urandom(int(args.size * 1024 * 1024)) for _ in range(args.assertions)]
+    print('{} Assertions of {} MB'.format(args.assertions, args.size))
+
+    baseline = measure(contents, args.number)
+    print('{:<24} {:>8.1f} ms'.format('sequential', baseline * 1000))
+
+    workers = 2
+    while workers <= max(2, min(args.assertions, os.cpu_count() or 1)):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            elapsed = measure(contents, args.number, executor)
+        print('{:<24} {:>8.1f} ms  x{:.2f}'.format(
+            'ThreadPoolExecutor({})'.format(workers), elapsed * 1000, baseline / elapsed))
+        workers *= 2
+
+
+if __name__ == '__main__':
+    main()
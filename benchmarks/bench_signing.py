@@ -0,0 +1,80 @@
+# Copyright 2020 Numbers Co., Ltd.
+#
+# This file is part of pyc2pa.
+#
+# pyc2pa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyc2pa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyc2pa.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Measure Claim signing throughput of Signer and SigningPool.
+
+Usage
+    $ python3 benchmarks/bench_signing.py [-n NUMBER] [-k KEY] [--password PASSWORD]
+
+KEY defaults to the PKCS#12 bundle data/Keys/demo2_user1.p12.
+'''
+
+import argparse
+import os
+import time
+
+from c2pa.signer import Signer
+from c2pa.signer import SigningPool
+
+
+def main():
+    default_key = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               '..', 'data', 'Keys', 'demo2_user1.p12')
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-n', '--number', type=int, default=2000, help='Signatures per case.')
+    ap.add_argument('-k', '--key', default=default_key, help='Key filepath.')
+    ap.add_argument('-c', '--cert', default=None, help='Certificate filepath.')
+    ap.add_argument('--password', default='1234')
+    args = ap.parse_args()
+
+    with open(args.key, 'rb') as f:
+        key = f.read()
+    certificate = None
+    if args.cert is not None:
+        with open(args.cert, 'rb') as f:
+            certificate = f.read()
+    password = args.password.encode('utf-8')
+
+    # Sig_structures are a few hundred bytes
+    sig_structures = [os.urandom(512) for _ in range(args.number)]
+
+    signer = Signer.load(key, certificate, password)
+    start = time.perf_counter()
+    for data in sig_structures:
+        signer.sign(data)
+    baseline = args.number / (time.perf_counter() - start)
+    print('{:<16} {:>10.1f} signatures/s'.format('Signer', baseline))
+
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        with SigningPool(key, certificate, password, max_workers=workers) as pool:
+            # start the workers before measuring
+            for future in [pool.submit(b'warm up') for _ in range(workers)]:
+                future.result()
+            start = time.perf_counter()
+            futures = [pool.submit(data) for data in sig_structures]
+            for future in futures:
+                future.result()
+            throughput = args.number / (time.perf_counter() - start)
+        print('{:<16} {:>10.1f} signatures/s  x{:.2f}'.format(
+            'SigningPool({})'.format(workers), throughput, throughput / baseline))
+        workers *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# Copyright 2020 Numbers Co., Ltd.
+#
+# This file is part of pyc2pa.
+#
+# pyc2pa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyc2pa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyc2pa.  If not, see <http://www.gnu.org/licenses/>.
+
+'''
+Measure the startup time of the c2pa CLI against a budget.
+
+The import time of c2pa.starling is read from `python -X importtime`,
+and the wall time of `c2pa --help` is the best of several runs minus
+the one of a bare interpreter. It exits with status 1 if either one
+is over budget.
+
+Usage
+    $ python3 benchmarks/bench_startup.py [-n NUMBER] [--budget MS] [--top N]
+'''
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# Budget of the import time of c2pa.starling and of `c2pa --help`
+# on top of the interpreter startup, in milliseconds.
+# It is about 3 times the time measured when it was set, to leave room
+# for slower machines while catching a heavy import at module level.
+Startup_budget_ms = 100
+
+Root_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def run(args):
+    env = dict(os.environ, PYTHONPATH=Root_dir)
+    return subprocess.run([sys.executable] + args, env=env, check=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def get_import_times(module):
+    '''Return [(cumulative_us, name)] of the imports of module,
+    from `python -X importtime`, the slowest first.
+    '''
+    result = run(['-X', 'importtime', '-c', 'import {}'.format(module)])
+    times = []
+    for line in result.stderr.decode('utf-8').splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times.append((int(cumulative), name.rstrip()))
+    times.sort(reverse=True)
+    return times
+
+
+def get_wall_time(args, number):
+    '''Return the best wall time in seconds of running python with args.
+    '''
+    best = None
+    for _ in range(number):
+        start = time.perf_counter()
+        run(args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('-n', '--number', type=int, default=10, help='Runs per case.')
+    ap.add_argument('--budget', type=float, default=Startup_budget_ms,
+                    help='Budget in ms. Default: {}'.format(Startup_budget_ms))
+    ap.add_argument('--top', type=int, default=10, help='Slowest imports listed.')
+    args = ap.parse_args()
+
+    # warm up the bytecode cache
+    run(['-c', 'import c2pa.starling'])
+
+    times = get_import_times('c2pa.starling')
+    print('{:>12}  {}'.format('cumul. ms', 'import'))
+    for cumulative, name in times[:args.top]:
+        print('{:>12.2f}  {}'.format(cumulative / 1000, name))
+
+    import_ms = min(get_import_times('c2pa.starling')[0][0] for _ in range(args.number)) / 1000
+    python_ms = get_wall_time(['-c', 'pass'], args.number) * 1000
+    help_ms = get_wall_time(['-m', 'c2pa.starling', '--help'], args.number) * 1000 - python_ms
+
+    print()
+    print('{:<24} {:>10}'.format('case', 'ms'))
+    print('{:<24} {:>10.2f}'.format('python -c pass', python_ms))
+    print('{:<24} {:>10.2f}'.format('import c2pa.starling', import_ms))
+    print('{:<24} {:>10.2f}'.format('c2pa --help', help_ms))
+    print('{:<24} {:>10.2f}'.format('budget', args.budget))
+
+    if import_ms > args.budget or help_ms > args.budget:
+        print('Over budget')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
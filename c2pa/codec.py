@@ -0,0 +1,171 @@
+# Copyright 2020 Numbers Co., Ltd.
+#
+# This file is part of pyc2pa.
+#
+# pyc2pa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyc2pa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyc2pa.  If not, see <http://www.gnu.org/licenses/>.
+
+import abc
+import types
+
+'''CBOR codec used for Claims, Assertions and Claim Signatures.
+
+Two backends are supported:
+    cbor: the default dependency, C-accelerated if its extension is built.
+    cbor2: C-accelerated in recent releases (pip install c2pa[fast]).
+The first C-accelerated backend is used by default, see benchmarks/bench_cbor.py.
+'''
+
+# Backend names in order of preference
+Cbor_backends = ['cbor', 'cbor2']
+
+
+class CborCodec(abc.ABC):
+    '''
+    name: backend name, one of Cbor_backends.
+
+    canonical: encode maps with keys sorted by length and then bytewise
+        (RFC 7049 section 3.9), so that equal objects always encode to
+        equal bytes. Used for Claims, see c2pa.core.C2paClaim.
+    '''
+    name = None
+
+    @property
+    def accelerated(self):
+        '''True if the backend runs as a C extension.'''
+        return False
+
+    @abc.abstractmethod
+    def dumps(self, obj, canonical=False):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def loads(self, data):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def tag(self, tag, value):
+        '''Return a tagged value which can be encoded.'''
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def untag(self, obj):
+        '''Return (tag, value) of a decoded tagged value,
+        or (None, obj) if it is not tagged.'''
+        raise NotImplementedError
+
+
+class Cbor2Codec(CborCodec):
+    name = 'cbor2'
+
+    def __init__(self):
+        import cbor2
+        self.cbor2 = cbor2
+
+    @property
+    def accelerated(self):
+        return isinstance(self.cbor2.dumps, types.BuiltinFunctionType)
+
+    def dumps(self, obj, canonical=False):
+        return self.cbor2.dumps(obj, canonical=canonical)
+
+    def loads(self, data):
+        return self.cbor2.loads(data)
+
+    def tag(self, tag, value):
+        return self.cbor2.CBORTag(tag, value)
+
+    def untag(self, obj):
+        if isinstance(obj, self.cbor2.CBORTag):
+            # arrays inside tags may be decoded as immutable tuples
+            value = list(obj.value) if isinstance(obj.value, tuple) else obj.value
+            return obj.tag, value
+        return None, obj
+
+
+class CborPackageCodec(CborCodec):
+    name = 'cbor'
+
+    def __init__(self):
+        import cbor
+        self.cbor = cbor
+
+    @property
+    def accelerated(self):
+        return isinstance(self.cbor.dumps, types.BuiltinFunctionType)
+
+    def _canonicalize(self, obj):
+        # The cbor package keeps the order of dict items,
+        # so canonical order is obtained by sorting them beforehand.
+        if isinstance(obj, dict):
+            items = [(self.cbor.dumps(k), k, self._canonicalize(v)) for k, v in obj.items()]
+            items.sort(key=lambda item: (len(item[0]), item[0]))
+            return {k: v for _, k, v in items}
+        if isinstance(obj, (list, tuple)):
+            return [self._canonicalize(v) for v in obj]
+        if isinstance(obj, self.cbor.Tag):
+            return self.cbor.Tag(obj.tag, self._canonicalize(obj.value))
+        return obj
+
+    def dumps(self, obj, canonical=False):
+        if canonical:
+            obj = self._canonicalize(obj)
+        return self.cbor.dumps(obj)
+
+    def loads(self, data):
+        return self.cbor.loads(bytes(data))
+
+    def tag(self, tag, value):
+        return self.cbor.Tag(tag, value)
+
+    def untag(self, obj):
+        if isinstance(obj, self.cbor.Tag):
+            return obj.tag, obj.value
+        return None, obj
+
+
+_codec_classes = {
+    'cbor2': Cbor2Codec,
+    'cbor': CborPackageCodec,
+}
+
+_codec = None
+
+
+def get_codec(name=None):
+    '''Return the CBOR codec of the given backend, or the default one:
+    the first C-accelerated backend of Cbor_backends, or else the first
+    installed one.
+    '''
+    global _codec
+    if name is not None:
+        return _codec_classes[name]()
+    if _codec is None:
+        codecs = []
+        for backend in Cbor_backends:
+            try:
+                codecs.append(_codec_classes[backend]())
+            except ImportError:
+                continue
+        if len(codecs) == 0:
+            raise ImportError('No CBOR backend installed, one of {} is required'.format(Cbor_backends))
+        accelerated = [codec for codec in codecs if codec.accelerated]
+        _codec = (accelerated or codecs)[0]
+    return _codec
+
+
+def set_codec(name):
+    '''Select the default CBOR backend by name.'''
+    global _codec
+    _codec = get_codec(name)
+    return _codec
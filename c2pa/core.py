@@ -19,63 +19,38 @@ import hashlib
 import uuid
 import datetime
 
-import multibase
-import multihash
-import pyexiv2
-import cbor
-import pytz
-
-from cryptography.hazmat.backends import default_backend
-from cryptography import x509
-from cryptography.hazmat.primitives.serialization import Encoding
-from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import padding
+from concurrent.futures import Future
 
+from c2pa.codec import get_codec
 from c2pa.jumbf import ContentBox
 from c2pa.jumbf import DescriptionBox
 from c2pa.jumbf import SuperBox
 
 from c2pa.jumbf import json_to_cbor_bytes
+from c2pa.signer import Signer
+from c2pa.signer import SigningPool
+from c2pa.xmp import Xmp_namespaces
+from c2pa.xmp import read_xmp_property
+from c2pa.xmp import set_provenance
 
 '''Implementation of C2PA Whitepaper
 Content Authenticity Initiative
 '''
 
 Cai_content_types = {
-    'manifest_block'    : '6332706100110010800000aa00389b71',
-    'manifest'          : '63326D6100110010800000aa00389b71',
-    'assertion_store'   : '6332617300110010800000aa00389b71',
-    'claim'             : '6332636C00110010800000aa00389b71',
-    'claim_signature'   : '6332637300110010800000aa00389b71',
+    'manifest_block'    : bytes.fromhex('6332706100110010800000aa00389b71'),
+    'manifest'          : bytes.fromhex('63326D6100110010800000aa00389b71'),
+    'assertion_store'   : bytes.fromhex('6332617300110010800000aa00389b71'),
+    'claim'             : bytes.fromhex('6332636C00110010800000aa00389b71'),
+    'claim_signature'   : bytes.fromhex('6332637300110010800000aa00389b71'),
 }
 
 
-Claim_asset_hashes_mockup = [
-        {
-            'length': '0x0000000000009959',
-            'name': 'JFIF SOI-APP0',
-            'start': '0x0000000000000000',
-            'url': '',
-            'value': 'EiAuxjtmax46cC2N3Y9aFmBO9Jfay8LEwJWzBUtZ0sUM8gA='
-        },
-        {
-            'length': '0x000000000000027d',
-            'name': 'JFIF APP1/XMP',
-            'start': '0x0000000000009959',
-            'url': '',
-            'value': 'EiDjZifCgG2iKxcYeChKTOcWlJ9I/UC9/c5XFiJREqJFpwA='
-        },
-        {
-            'length': '0x00000000000215e6',
-            'name': 'JFIF DQT-EOI',
-            'start': '0x000000000000a90c',
-            'url': '',
-            'value': 'EiArx031oA0N5KOEG6n9R/bJJFYJvmGlDoLtuwbRipLTKAA='
-        }
-]
-
-
 def encode_hashlink(binary_content, codec='base64', to_hexstr=False):
+    # only needed for hashlinks, not imported with the module
+    import multibase
+    import multihash
+
     mh = multihash.Multihash(multihash.Func.sha2_256,
                              hashlib.sha256(binary_content).digest())
     mb = multibase.encode(codec, mh.encode())
@@ -93,21 +68,29 @@ def compute_hash(binary_content):
 
 
 def insert_xmp_key(data_bytes, manifest_label):
-    metadata = pyexiv2.ImageMetadata.from_buffer(data_bytes)
-    metadata.read()
-    metadata['Xmp.dcterms.provenance'] = pyexiv2.XmpTag(
-        'Xmp.dcterms.provenance', 'self#jumbf=c2pa/{}/c2pa.claim'.format(manifest_label))
-    metadata.write()
-    return metadata.buffer
-
-
-def get_xmp_tag(data_bytes, tag='Xmp.dcterms.provenance'):
-    metadata = pyexiv2.ImageMetadata.from_buffer(data_bytes)
-    metadata.read()
-    if tag in metadata.xmp_keys:
-        return metadata[tag].raw_value
-    else:
-        return ''
+    # only the XMP APP1 segment is rewritten, see c2pa.xmp
+    return set_provenance(data_bytes, manifest_label)
+
+
+def get_xmp_tag(data_bytes, tag='Xmp.dcterms.provenance', segments=None):
+    '''Return the value of a simple XMP property of a JPEG file,
+    or '' if it is not set.
+
+    tag: Xmp.<prefix>.<name>, prefix being one of c2pa.xmp.Xmp_namespaces.
+    '''
+    _, prefix, name = tag.split('.', 2)
+    if prefix not in Xmp_namespaces:
+        raise ValueError('Unknown XMP namespace prefix {}'.format(prefix))
+    value = read_xmp_property(data_bytes, Xmp_namespaces[prefix], name, segments=segments)
+    return '' if value is None else value
+
+
+def create_manifest_label(provider='numbersprotocol'):
+    return '{}:urn:uuid:{}'.format(provider, uuid.uuid4())
+
+
+def hash_assertion(assertion):
+    return assertion.content_boxes[0].get_payload_digest('sha256')
 
 
 class C2paAssertionStore(SuperBox):
@@ -124,17 +107,26 @@ class C2paClaim(SuperBox):
                  assertion_store,
                  manifest_label,
                  media_name,
-                 recorder='Starling Capture using Numbers Protocol'):
+                 recorder='Starling Capture using Numbers Protocol',
+                 executor=None):
+        '''
+        executor: concurrent.futures.Executor hashing the Assertions in
+            parallel, e.g. a ThreadPoolExecutor since hashlib releases
+            the GIL. Default to hashing them one after another.
+        '''
         super(C2paClaim, self).__init__()
         self.description_box = DescriptionBox(
                                     content_type=Cai_content_types['claim'],
                                     label='c2pa.claim')
         content_box = ContentBox(t_box_type='cbor')
+        # the signed Claim is encoded deterministically, whatever the backend
         content_box.payload = json_to_cbor_bytes(
             self.create_claim(assertion_store,
                               manifest_label,
                               recorder=recorder,
-                              media_name=media_name)
+                              media_name=media_name,
+                              executor=executor),
+            canonical=True
         )
         self.content_boxes.append(content_box)
 
@@ -142,9 +134,18 @@ class C2paClaim(SuperBox):
                      assertion_store,
                      manifest_label,
                      media_name,
-                     recorder='Starling Capture'):
+                     recorder='Starling Capture',
+                     executor=None):
         '''Create a Claim JSON object
         '''
+        assertions = assertion_store.content_boxes
+        # the hash of an Assertion covers its first content box without header
+        if executor is None:
+            hashes = [hash_assertion(assertion) for assertion in assertions]
+        else:
+            # map keeps the order of the Assertions
+            hashes = list(executor.map(hash_assertion, assertions))
+
         claim = {}
         claim['dc:title'] = media_name
         claim['dc:format'] = 'image/jpeg'
@@ -159,53 +160,115 @@ class C2paClaim(SuperBox):
                 assertion_label=assertion.description_box.db_label,
             ),
             'alg': 'sha256',
-            'hash': compute_hash(assertion.content_boxes[0].convert_bytes()[8:]),
-        } for assertion in assertion_store.content_boxes]
+            'hash': assertion_hash,
+        } for assertion, assertion_hash in zip(assertions, hashes)]
         claim['alg'] = 'sha256'
         return claim
 
 
 class C2paClaimSignature(SuperBox):
-    def __init__(self, claim, key, certificate):
+    '''
+    key, certificate: PEM bytes, only used if signer is not given.
+    alg: COSE algorithm name (see c2pa.signer.Cose_algorithms) used with
+        key. Default to the one of the key type.
+    signer: c2pa.signer.Signer, reusable across Claims,
+        or c2pa.signer.SigningPool to sign on another process.
+        With a SigningPool, the payload keeps a placeholder signature of
+        the same size until the future completes, so the box size is
+        final from the start.
+    reserve_size: size of the payload padded with zeros, e.g. to keep a
+        fixed layout across signers. Default to the exact COSE_Sign1 size.
+        ValueError is raised if the COSE_Sign1 does not fit.
+
+    future: future of this box, completed once the signature is set.
+    '''
+    def __init__(self, claim, key='', certificate='', signer=None, alg=None, reserve_size=None):
         super(C2paClaimSignature, self).__init__()
         self.description_box = DescriptionBox(
             content_type=Cai_content_types['claim_signature'],
             label='c2pa.signature')
+        if signer is None:
+            signer = Signer.from_pem(key, certificate, alg=alg)
+        self.reserve_size = reserve_size
         content_box = ContentBox(t_box_type='cbor')
-        content_box.payload = self.create_signature(claim, key, certificate)
         self.content_boxes.append(content_box)
-
-    def create_signature(self, claim, key, certificate):
-        '''Create a Claim Signature payload in bytes.
+        if isinstance(signer, SigningPool):
+            content_box.payload = self.create_cose_sign1(signer)
+            self.future = self.submit_signature(claim, signer)
+        else:
+            content_box.payload = self.create_signature(claim, signer)
+            self.future = Future()
+            self.future.set_result(self)
+
+    def create_sig_structure(self, claim, signer):
+        '''Create the Sig_structure to be signed, in bytes.
         '''
-        # -37 stands for PS256 (RSASSA-PSS using SHA-256 and MGF1 with SHA-256)
-        phdr = cbor.dumps({1: -37})
-        cert = x509.load_pem_x509_certificate(certificate, default_backend())
+        # Sig_structure of COSE_Sign1 (RFC 8152 section 4.4), an array of 4:
+        # context, protected header, external_aad and payload (the claim)
+        return get_codec().dumps(['Signature1', signer.protected_header, b'', claim])
+
+    def create_cose_sign1(self, signer, signature=None):
+        '''Create a Claim Signature payload in bytes from the signature.
+        signature: default to signer.signature_size zero bytes,
+            to be replaced by patch_signature.
+        '''
+        codec = get_codec()
+        if signature is None:
+            signature = bytes(signer.signature_size)
+        phdr = signer.protected_header
         uhdr = {
-            'x5chain': cert.public_bytes(Encoding.DER),
-            'temp_signing_time': str(datetime.datetime.now(pytz.utc)),
+            'x5chain': signer.x5chain,
+            # always with microseconds, so that the size does not vary
+            'temp_signing_time': datetime.datetime.now(datetime.timezone.utc).isoformat(sep=' ', timespec='microseconds'),
         }
 
-        private_key = serialization.load_pem_private_key(key, password=None)
-        sig_structure_data = cbor.dumps(['Signature1', phdr, b'' b'', claim])
-        sig_structure_data = b'\x84' + sig_structure_data[1:]
-        signature = private_key.sign(
-            sig_structure_data,
-            padding.PSS(
-                mgf=padding.MGF1(hashes.SHA256()),
-                salt_length=32
-            ),
-            hashes.SHA256()
-        )
-
         payload = None
         message = [phdr, uhdr, payload, signature]
-        tag = cbor.Tag(18, message)
-        cose_tag = cbor.dumps(tag)
+        # 18 stands for COSE_Sign1
+        cose_tag = codec.dumps(codec.tag(18, message))
+        # the signature bstr ends the encoding
+        self.signature_offset = len(cose_tag) - len(signature)
+        self.signature_size = len(signature)
+
+        if self.reserve_size is None:
+            return cose_tag
+        if len(cose_tag) > self.reserve_size:
+            raise ValueError('COSE_Sign1 of {} bytes exceeds the reserved size of {} bytes'.format(
+                len(cose_tag), self.reserve_size))
+        return cose_tag + bytes(self.reserve_size - len(cose_tag))
+
+    def patch_signature(self, signature):
+        '''Replace the placeholder signature of the payload in place.
+        '''
+        if len(signature) != self.signature_size:
+            raise ValueError('Signature of {} bytes does not match the placeholder of {} bytes'.format(
+                len(signature), self.signature_size))
+        payload = bytearray(self.content_boxes[0].payload)
+        payload[self.signature_offset:self.signature_offset + self.signature_size] = signature
+        self.content_boxes[0].payload = bytes(payload)
+
+    def create_signature(self, claim, signer):
+        '''Create a Claim Signature payload in bytes.
+        '''
+        signature = signer.sign(self.create_sig_structure(claim, signer))
+        return self.create_cose_sign1(signer, signature)
+
+    def submit_signature(self, claim, pool):
+        '''Sign on a SigningPool.
+        Return a future of this box, completed once the signature is patched.
+        '''
+        future = Future()
+
+        def set_signature(signature_future):
+            try:
+                self.patch_signature(signature_future.result())
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(self)
 
-        pad = b'\x00' * (4096 - len(cose_tag))
-        payload = cose_tag + pad
-        return payload
+        pool.submit(self.create_sig_structure(claim, pool)).add_done_callback(set_signature)
+        return future
 
 
 class C2paManifest(SuperBox):
@@ -215,9 +278,28 @@ class C2paManifest(SuperBox):
                  assertions=[],
                  recorder='Starling Capture',
                  key='',
-                 certificate=''):
+                 certificate='',
+                 signer=None,
+                 alg=None,
+                 reserve_size=None,
+                 executor=None,
+                 manifest_label=None):
+        '''
+        key, certificate: PEM bytes, only used if signer is not given.
+        alg: COSE algorithm name used with key, see C2paClaimSignature.
+        reserve_size: payload size of the Claim Signature, see C2paClaimSignature.
+        executor: executor hashing the Assertions, see C2paClaim.
+        manifest_label: default to a new label, see create_manifest_label.
+        signer: c2pa.signer.Signer, reusable across Manifests,
+            or c2pa.signer.SigningPool. With a SigningPool, wait for
+            future before serializing the Manifest.
+
+        future: future of this Manifest, completed once it is signed.
+        '''
         super(C2paManifest, self).__init__()
-        self.manifest_label = '{}:urn:uuid:{}'.format(provider, uuid.uuid4())
+        if manifest_label is None:
+            manifest_label = create_manifest_label(provider)
+        self.manifest_label = manifest_label
         self.description_box = DescriptionBox(
             content_type=Cai_content_types['manifest'],
             label=self.manifest_label)
@@ -225,13 +307,27 @@ class C2paManifest(SuperBox):
         self.claim = C2paClaim(self.assertion_store,
                                self.manifest_label,
                                media_name,
-                               recorder=recorder)
-        self.signature = C2paClaimSignature(self.claim.content_boxes[0].payload, key, certificate)
+                               recorder=recorder,
+                               executor=executor)
+        self.signature = C2paClaimSignature(self.claim.content_boxes[0].payload,
+                                            key,
+                                            certificate,
+                                            signer=signer,
+                                            alg=alg,
+                                            reserve_size=reserve_size)
+        self.future = Future()
+        self.signature.future.add_done_callback(self._set_signed)
 
         self.content_boxes.append(self.assertion_store)
         self.content_boxes.append(self.claim)
         self.content_boxes.append(self.signature)
 
+    def _set_signed(self, signature_future):
+        if signature_future.exception() is not None:
+            self.future.set_exception(signature_future.exception())
+        else:
+            self.future.set_result(self)
+
 
 class C2paManifestBlock(SuperBox):
     def __init__(self):
@@ -0,0 +1,139 @@
+# Copyright 2020 Numbers Co., Ltd.
+#
+# This file is part of pyc2pa.
+#
+# pyc2pa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyc2pa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyc2pa.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+
+from c2pa.jumbf import create_cbor_superbox
+from c2pa.jumbf import json_to_cbor_bytes
+
+'''Hard binding of a Manifest to the asset: the c2pa.hash.data Assertion.
+
+The asset is hashed except for the exclusion ranges, which cover the
+App11 segments carrying the Manifest Store in the output file.
+'''
+
+# Read size of hash_data for file objects
+Default_hash_chunk_size = 1024 * 1024
+
+# Placeholder of the exclusion length while the layout is planned.
+# Any actual length encodes to at most as many CBOR bytes.
+Max_exclusion_length = 2**64 - 1
+
+
+def iter_ranges(size, exclusions):
+    '''Yield (start, end) of the byte ranges of [0, size)
+    which are not covered by exclusions, a list of (start, length).
+    '''
+    offset = 0
+    for start, length in sorted(exclusions):
+        if start > offset:
+            yield offset, min(start, size)
+        offset = max(offset, start + length)
+        if offset >= size:
+            return
+    if offset < size:
+        yield offset, size
+
+
+def hash_data(data, exclusions=(), name='sha256', chunk_size=Default_hash_chunk_size):
+    '''Return the digest of data without the exclusion ranges.
+
+    data: bytes-like object (bytes, memoryview, mmap of a large file),
+        hashed without copies, or binary file object, read in chunks
+        of chunk_size bytes into a single buffer.
+    exclusions: list of (start, length) byte ranges.
+    '''
+    m = hashlib.new(name)
+    if hasattr(data, 'readinto'):
+        size = data.seek(0, 2)
+        buffer = memoryview(bytearray(chunk_size))
+        for start, end in iter_ranges(size, exclusions):
+            data.seek(start)
+            while start < end:
+                n = data.readinto(buffer[:min(chunk_size, end - start)])
+                if not n:
+                    raise ValueError('Unexpected end of file at offset {}'.format(start))
+                m.update(buffer[:n])
+                start += n
+    else:
+        with memoryview(data) as view:
+            for start, end in iter_ranges(len(view), exclusions):
+                m.update(view[start:end])
+    return m.digest()
+
+
+def hash_pieces(pieces, name='sha256'):
+    '''Return the digest of the concatenation of bytes-like pieces,
+    e.g. of the output of c2pa.jpeg.iter_spliced before it is written.
+    '''
+    m = hashlib.new(name)
+    for piece in pieces:
+        m.update(piece)
+    return m.digest()
+
+
+class DataHash(object):
+    '''
+    start: offset of the App11 segments of the Manifest Store in the output.
+    digest: hash of the output without the App11 segments. Since they
+        are excluded, it is known before the Manifest is created.
+    alg: hash algorithm name.
+
+    The Assertion box has the same size whatever the exclusion length,
+    so the length can be set once the layout is planned (see set_length):
+    the CBOR encoding of smaller lengths is compensated by the pad field.
+    '''
+    label = 'c2pa.hash.data'
+
+    def __init__(self, start, digest, alg='sha256', name='jumbf manifest'):
+        self.start = start
+        self.digest = digest
+        self.alg = alg
+        self.name = name
+        self.length = None
+        self.box = create_cbor_superbox(content=self.create_payload(), label=self.label)
+
+    @property
+    def exclusions(self):
+        return [(self.start, self.length)]
+
+    def _encode(self, length, pad):
+        return json_to_cbor_bytes({
+            'exclusions': [{'start': self.start, 'length': length}],
+            'name': self.name,
+            'alg': self.alg,
+            'hash': self.digest,
+            'pad': pad,
+        })
+
+    def create_payload(self):
+        '''Create the Assertion payload in bytes,
+        with a placeholder length if it is not set yet.
+        '''
+        size = len(self._encode(Max_exclusion_length, b''))
+        if self.length is None:
+            return self._encode(Max_exclusion_length, b'')
+        payload = self._encode(self.length, b'')
+        # pad is shorter than 24 bytes, so its header stays 1 byte long
+        return self._encode(self.length, bytes(size - len(payload)))
+
+    def set_length(self, length):
+        '''Set the exclusion length, i.e. the size of the App11 segments.
+        The Assertion size does not change.
+        '''
+        self.length = length
+        self.box.content_boxes[0].payload = self.create_payload()
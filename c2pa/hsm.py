@@ -0,0 +1,154 @@
+# Copyright 2020 Numbers Co., Ltd.
+#
+# This file is part of pyc2pa.
+#
+# pyc2pa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyc2pa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyc2pa.  If not, see <http://www.gnu.org/licenses/>.
+
+import queue
+
+from cryptography import x509
+
+from c2pa.signer import Signer
+from c2pa.signer import load_certificates
+
+try:
+    import pkcs11
+    from pkcs11 import Attribute, Mechanism, MGF, ObjectClass
+except ImportError:
+    # optional dependency: pip install c2pa[hsm]
+    pkcs11 = None
+
+'''Claim signer backed by a PKCS#11 token (HSM, smart card, SoftHSM).
+
+The private key never leaves the token. Pkcs11Signer keeps a pool of
+logged-in sessions, so that concurrent injections neither share one
+session nor log in for every signature.
+'''
+
+
+def get_mechanism(alg):
+    '''Return (mechanism, mechanism_param) of a COSE algorithm name.
+    '''
+    # PKCS#11 ECDSA signatures are already r || s as COSE requires
+    mechanisms = {
+        'ES256': (Mechanism.ECDSA_SHA256, None),
+        'ES384': (Mechanism.ECDSA_SHA384, None),
+        'ES512': (Mechanism.ECDSA_SHA512, None),
+        'EdDSA': (Mechanism.EDDSA, None),
+        'PS256': (Mechanism.SHA256_RSA_PKCS_PSS, (Mechanism.SHA256, MGF.SHA256, 32)),
+        'PS384': (Mechanism.SHA384_RSA_PKCS_PSS, (Mechanism.SHA384, MGF.SHA384, 48)),
+        'PS512': (Mechanism.SHA512_RSA_PKCS_PSS, (Mechanism.SHA512, MGF.SHA512, 64)),
+    }
+    return mechanisms[alg]
+
+
+class Pkcs11Signer(Signer):
+    '''
+    module: path of the PKCS#11 library, e.g. /usr/lib/softhsm/libsofthsm2.so
+    token_label: label of the token holding the key.
+    pin: user PIN of the token.
+    key_label, key_id: label and/or CKA_ID (bytes) of the private key.
+    certificate: PEM or DER bytes of the signer certificate (PEM may contain
+        the whole chain). Default to the certificate object of the token
+        having the same label as the key.
+    alg: COSE algorithm name, default to the one of the key type.
+    pool_size: number of sessions, i.e. of signatures made concurrently.
+
+    It can be used wherever a Signer is accepted, and from several threads.
+    '''
+    def __init__(self,
+                 module,
+                 token_label,
+                 pin,
+                 key_label=None,
+                 key_id=None,
+                 certificate=None,
+                 alg=None,
+                 pool_size=4):
+        if pkcs11 is None:
+            raise ImportError('Pkcs11Signer requires python-pkcs11 (pip install c2pa[hsm])')
+        if key_label is None and key_id is None:
+            raise ValueError('Pkcs11Signer requires key_label or key_id')
+        if pool_size < 1:
+            raise ValueError('pool_size must be at least 1')
+        self.private_key = None
+        self.key_label = key_label
+        self.key_id = key_id
+        self.token = pkcs11.lib(module).get_token(token_label=token_label)
+
+        # Login is shared by all the sessions of the application (PKCS#11
+        # section 5.6), so only the first one logs in. It stays open until
+        # close() to keep the others logged in.
+        self.sessions = queue.Queue()
+        self._opened = []
+        try:
+            for i in range(pool_size):
+                session = self.token.open(user_pin=pin if i == 0 else None)
+                self._opened.append(session)
+                self.sessions.put((session, self._get_key(session)))
+
+            if certificate is None:
+                certificates = [self._get_certificate(self._opened[0])]
+            else:
+                certificates = load_certificates(certificate)
+            self._set_certificates(certificates[0].public_key(), certificates, alg)
+            self.mechanism, self.mechanism_param = get_mechanism(self.alg)
+        except Exception:
+            # e.g. the key is not found: do not leave the token logged in
+            self.close()
+            raise
+
+    def _get_key(self, session):
+        attrs = {'object_class': ObjectClass.PRIVATE_KEY}
+        if self.key_label is not None:
+            attrs['label'] = self.key_label
+        if self.key_id is not None:
+            attrs['id'] = self.key_id
+        return session.get_key(**attrs)
+
+    def _get_certificate(self, session):
+        attrs = {Attribute.CLASS: ObjectClass.CERTIFICATE}
+        if self.key_label is not None:
+            attrs[Attribute.LABEL] = self.key_label
+        if self.key_id is not None:
+            attrs[Attribute.ID] = self.key_id
+        for cert in session.get_objects(attrs):
+            return x509.load_der_x509_certificate(cert[Attribute.VALUE])
+        raise ValueError('Certificate of key {} not found on token {}'.format(
+            self.key_label or self.key_id.hex(), self.token.label))
+
+    def sign(self, data):
+        '''Return the signature of data in bytes, as encoded by COSE.
+        Block until a session of the pool is free.
+        '''
+        session, key = self.sessions.get()
+        try:
+            return key.sign(bytes(data),
+                            mechanism=self.mechanism,
+                            mechanism_param=self.mechanism_param)
+        finally:
+            self.sessions.put((session, key))
+
+    def close(self):
+        '''Close the sessions, which logs out of the token.
+        '''
+        for session in reversed(self._opened):
+            session.close()
+        self._opened = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,328 @@
+# Copyright 2020 Numbers Co., Ltd.
+#
+# This file is part of pyc2pa.
+#
+# pyc2pa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyc2pa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyc2pa.  If not, see <http://www.gnu.org/licenses/>.
+
+import contextlib
+import errno
+import mmap
+import os
+import warnings
+
+'''Implementation of ITU-T T.81 | ISO/IEC 10918-1
+Information technology - Digital compression and coding of
+continuous-tone still images, Annex B: Compressed data formats
+'''
+
+# Spec B.1.1.3, Table B.1
+Jpeg_markers = {
+    'SOI'   : 0xFFD8,
+    'EOI'   : 0xFFD9,
+    'SOS'   : 0xFFDA,
+    'APP0'  : 0xFFE0,
+    'APP1'  : 0xFFE1,
+    'APP11' : 0xFFEB,
+}
+
+# Markers without a length field: TEM, RST0-RST7, SOI and EOI
+Standalone_markers = {0xFF01} | set(range(0xFFD0, 0xFFDA))
+
+Xmp_namespace = b'http://ns.adobe.com/xap/1.0/\x00'
+Xmp_extension_namespace = b'http://ns.adobe.com/xmp/extension/\x00'
+
+# Buffer of copy_range when the kernel can not copy the files
+Default_copy_chunk_size = 1024 * 1024
+
+# Errors of os.copy_file_range and os.sendfile on files they do not support,
+# e.g. across file systems on older kernels, special files or non-Linux
+# systems, on which copy_range falls back to the next method
+Copy_fallback_errors = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP,
+                        errno.ENOTSUP, errno.ENOTSOCK, errno.EPERM}
+
+try:
+    Iov_max = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    Iov_max = 1024
+
+
+class JpegSegment(object):
+    '''
+    marker: marker code, e.g. 0xFFEB for APP11
+    offset: offset of the marker in the file
+    length: the Le/Lp parameter, i.e. segment size without the marker.
+        0 for standalone markers.
+    '''
+    def __init__(self, marker, offset, length=0):
+        self.marker = marker
+        self.offset = offset
+        self.length = length
+
+    @property
+    def size(self):
+        return 2 + self.length
+
+    @property
+    def end(self):
+        return self.offset + self.size
+
+    @property
+    def payload_offset(self):
+        # marker (2B) + length (2B)
+        return self.offset + 4 if self.length else self.offset + 2
+
+    def get_payload(self, data_bytes):
+        return memoryview(data_bytes)[self.payload_offset:self.end]
+
+    def __repr__(self):
+        return 'JpegSegment(marker={}, offset={}, length={})'.format(
+            hex(self.marker), self.offset, self.length)
+
+
+def get_jpeg_segments(data_bytes):
+    '''Walk the marker segments of a JPEG file from SOI up to SOS.
+
+    Entropy-coded scan data is never visited, so the cost depends on
+    the size of the headers instead of the size of the image.
+    return: list of JpegSegments in file order, ending with SOS (or EOI).
+        The list is empty if data_bytes is not a JPEG file.
+    '''
+    view = memoryview(data_bytes)
+    if bytes(view[0:2]) != b'\xff\xd8':
+        return []
+
+    segments = [JpegSegment(Jpeg_markers['SOI'], 0)]
+    offset = 2
+    while offset + 2 <= len(view):
+        if view[offset] != 0xFF:
+            warnings.warn('Unexpected byte {} at offset {}, stop walking JPEG markers'.format(
+                hex(view[offset]), hex(offset)), stacklevel=2)
+            break
+        # Spec B.1.1.2: any marker may be preceded by fill bytes 0xFF
+        if view[offset + 1] == 0xFF:
+            offset += 1
+            continue
+
+        marker = int.from_bytes(view[offset:offset + 2], byteorder='big')
+        if marker in Standalone_markers:
+            segments.append(JpegSegment(marker, offset))
+            offset += 2
+        else:
+            if offset + 4 > len(view):
+                break
+            length = int.from_bytes(view[offset + 2:offset + 4], byteorder='big')
+            if length < 2 or offset + 2 + length > len(view):
+                warnings.warn('Truncated JPEG segment {} at offset {}'.format(hex(marker), hex(offset)),
+                              stacklevel=2)
+                break
+            segments.append(JpegSegment(marker, offset, length))
+            offset += 2 + length
+
+        if marker in (Jpeg_markers['SOS'], Jpeg_markers['EOI']):
+            break
+    return segments
+
+
+def get_app11_segments(segments):
+    return [s for s in segments if s.marker == Jpeg_markers['APP11']]
+
+
+def get_xmp_segments(data_bytes, segments, namespace=Xmp_namespace):
+    '''Return the APP1 segments carrying a standard XMP packet,
+    or the Extended XMP chunks with namespace=Xmp_extension_namespace.
+    '''
+    view = memoryview(data_bytes)
+    return [s for s in segments
+            if s.marker == Jpeg_markers['APP1']
+            and bytes(view[s.payload_offset:s.payload_offset + len(namespace)]) == namespace]
+
+
+def create_jpeg_segment(marker, payload):
+    '''Return a marker segment in bytes: marker, length and payload.
+    '''
+    length = 2 + len(payload)
+    if length > 0xFFFF:
+        raise ValueError('Segment payload of {} bytes exceeds 65533 bytes'.format(len(payload)))
+    return marker.to_bytes(2, byteorder='big') + length.to_bytes(2, byteorder='big') + payload
+
+
+def _sort_edits(edits):
+    # by range, and insertions at the same offset in the given order
+    return sorted(enumerate(edits), key=lambda item: (item[1][0], item[1][1], item[0]))
+
+
+def get_output_offset(edits, index):
+    '''Return the offset of the replacement of edits[index]
+    in the output of iter_spliced.
+    '''
+    shift = 0
+    for i, (start, end, replacement) in _sort_edits(edits):
+        if i == index:
+            return start + shift
+        shift += _get_replacement_size(replacement) - (end - start)
+    raise IndexError(index)
+
+
+def _get_replacement_size(replacement):
+    if isinstance(replacement, (list, tuple)):
+        return sum(len(piece) for piece in replacement)
+    return len(replacement)
+
+
+@contextlib.contextmanager
+def map_file(f):
+    '''Memory-map the file object f read-only for the duration of the
+    context, so that only the pages accessed are read. Empty files can
+    not be mapped and are b''.
+
+    The map is closed on exit, unless a view of it is still referenced,
+    in which case it is closed once collected.
+    '''
+    if os.fstat(f.fileno()).st_size == 0:
+        yield b''
+        return
+    data_bytes = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield data_bytes
+    finally:
+        try:
+            data_bytes.close()
+        except BufferError:
+            pass
+
+
+def iter_splice_plan(size, edits):
+    '''Yield the output of iter_spliced for data of size bytes, as the
+    slices of the data kept and the bytes-like replacement pieces,
+    so that the data kept can be copied without being read.
+    '''
+    offset = 0
+    for _, (start, end, replacement) in _sort_edits(edits):
+        if start < offset or end < start:
+            raise ValueError('Overlapping edit [{}, {}) of JPEG data'.format(start, end))
+        if start > offset:
+            yield slice(offset, start)
+        if isinstance(replacement, (list, tuple)):
+            yield from replacement
+        elif len(replacement) > 0:
+            yield replacement
+        offset = end
+    if offset < size:
+        yield slice(offset, size)
+
+
+def iter_spliced(data_bytes, edits):
+    '''Yield data_bytes as bytes-like pieces with byte ranges replaced,
+    so that several segments are edited in a single pass without copies.
+
+    edits: list of (start, end, replacement). [start, end) ranges must not
+        overlap, start == end inserts. replacement is bytes-like or a list
+        of bytes-like pieces. Insertions at the same offset keep their order.
+    '''
+    view = memoryview(data_bytes)
+    for piece in iter_splice_plan(len(view), edits):
+        yield view[piece] if isinstance(piece, slice) else piece
+
+
+def write_spliced(src_fd, dst_fd, edits, size=None):
+    '''Write the output of iter_spliced for the file src_fd to dst_fd.
+
+    Only the replacements go through user space: the ranges of the file
+    kept, i.e. the image data, are copied by copy_range.
+    size: size of the file src_fd, read with fstat by default.
+    return: number of bytes written.
+    '''
+    if size is None:
+        size = os.fstat(src_fd).st_size
+    written = 0
+    pieces = []
+    for piece in iter_splice_plan(size, edits):
+        if not isinstance(piece, slice):
+            pieces.append(piece)
+            continue
+        if pieces:
+            written += write_all(dst_fd, pieces)
+            pieces = []
+        written += copy_range(src_fd, dst_fd, piece.start, piece.stop - piece.start)
+    if pieces:
+        written += write_all(dst_fd, pieces)
+    return written
+
+
+def copy_range(src_fd, dst_fd, offset, count, chunk_size=Default_copy_chunk_size):
+    '''Copy count bytes of src_fd from offset to the current position
+    of dst_fd, in the kernel with os.copy_file_range or else os.sendfile
+    where the files support it, and through a single buffer of
+    chunk_size bytes otherwise. The position of src_fd is not used.
+    return: number of bytes copied.
+    '''
+    end = offset + count
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while offset < end:
+                n = os.copy_file_range(src_fd, dst_fd, end - offset, offset)
+                if n == 0:
+                    break
+                offset += n
+        except OSError as e:
+            if e.errno not in Copy_fallback_errors:
+                raise
+    if offset < end and hasattr(os, 'sendfile'):
+        try:
+            while offset < end:
+                n = os.sendfile(dst_fd, src_fd, offset, end - offset)
+                if n == 0:
+                    break
+                offset += n
+        except OSError as e:
+            if e.errno not in Copy_fallback_errors:
+                raise
+    if offset < end:
+        buffer = memoryview(bytearray(min(chunk_size, end - offset)))
+        while offset < end:
+            n = _read_into(src_fd, buffer[:end - offset], offset)
+            if n == 0:
+                raise ValueError('Unexpected end of file at offset {}'.format(offset))
+            write_all(dst_fd, [buffer[:n]])
+            offset += n
+    return count
+
+
+def _read_into(fd, buffer, offset):
+    if hasattr(os, 'preadv'):
+        return os.preadv(fd, [buffer], offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    data = os.read(fd, len(buffer))
+    buffer[:len(data)] = data
+    return len(data)
+
+
+def write_all(fd, pieces):
+    '''Write all the pieces to fd with scatter/gather writes
+    (os.writev) where available, retrying on partial writes.
+    return: number of bytes written.
+    '''
+    pieces = [memoryview(piece).cast('B') for piece in pieces]
+    total = sum(len(piece) for piece in pieces)
+    while pieces:
+        if hasattr(os, 'writev'):
+            n = os.writev(fd, pieces[:Iov_max])
+        else:
+            n = os.write(fd, pieces[0])
+        while pieces and n >= len(pieces[0]):
+            n -= len(pieces[0])
+            pieces.pop(0)
+        if pieces and n > 0:
+            pieces[0] = pieces[0][n:]
+    return total
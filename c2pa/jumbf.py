@@ -15,9 +15,18 @@
 # You should have received a copy of the GNU General Public License
 # along with pyc2pa.  If not, see <http://www.gnu.org/licenses/>.
 
-import cbor
+import bisect
+import hashlib
+import itertools
 import json
-import re
+import os
+import warnings
+
+from c2pa.codec import get_codec
+from c2pa.jpeg import Iov_max
+from c2pa.jpeg import get_app11_segments
+from c2pa.jpeg import get_jpeg_segments
+from c2pa.jpeg import write_all
 
 '''Implementation of ISO/IEC 19566-5:2019(E)
 Information technologies - JPEG systems
@@ -26,53 +35,274 @@ Part 5: JPEG universal metadata box format (JUMBF)
 
 # Spec B.1
 Jumbf_content_types = {
-    'codestream': '40cb0c32bb8a489da70b2ad6f47f4369',
-    'xml'       : '786d6c2000110010800000aa00389b71',
-    'json'      : '6a736f6e00110010800000aa00389b71',
-    'uuid'      : '7575696400110010800000aa00389b71',
-    'cbor'      : '63626f7200110010800000aa00389b71',
+    'codestream': bytes.fromhex('40cb0c32bb8a489da70b2ad6f47f4369'),
+    'xml'       : bytes.fromhex('786d6c2000110010800000aa00389b71'),
+    'json'      : bytes.fromhex('6a736f6e00110010800000aa00389b71'),
+    'uuid'      : bytes.fromhex('7575696400110010800000aa00389b71'),
+    'cbor'      : bytes.fromhex('63626f7200110010800000aa00389b71'),
 }
 
+# Upper bound of the chunks handed to file-like objects by write_to
+Default_chunk_size = 64 * 1024
+
+# Largest box size which fits in LBox; larger boxes use XLBox
+Max_lbox = 0xFFFFFFFF
+
+
+def get_box_size(payload_size):
+    '''Return the size of a box carrying payload_size bytes.
+    Spec A.2: LBox is set to 1 and the size is stored in the 8-byte XLBox
+    if it does not fit in LBox, which makes the header 16 bytes long.
+    '''
+    if payload_size + 8 <= Max_lbox:
+        return payload_size + 8
+    return payload_size + 16
+
+
+def create_box_header(type_code, size):
+    '''Return LBox + TBox (+ XLBox) of a box of the given size.
+    '''
+    if size <= Max_lbox:
+        return size.to_bytes(4, byteorder='big') + type_code
+    return (1).to_bytes(4, byteorder='big') + type_code + size.to_bytes(8, byteorder='big')
+
+
+def get_box_header_size(data_bytes):
+    '''Return the header size (8 or 16) of the serialized box
+    starting at data_bytes.
+    '''
+    if int.from_bytes(data_bytes[0:4], byteorder='big') == 1:
+        return 16
+    return 8
+
+
+# Every modification of a box is stamped with the next value of this clock,
+# so that a cached serialization is valid as long as the latest stamp
+# of the box and its children is unchanged.
+_modification_clock = itertools.count(1)
+
+
+def to_binary_code(value):
+    '''Return a box type code or a content type UUID as bytes.
+    value: bytes, or HEX string as used by earlier versions.
+    '''
+    if isinstance(value, str):
+        return bytes.fromhex(value)
+    return bytes(value)
+
+
+class BoxList(list):
+    '''List of child boxes which invalidates the cache of its owner
+    whenever it is modified.
+    '''
+    __slots__ = ('owner',)
+
+    def __init__(self, owner, boxes=()):
+        super(BoxList, self).__init__(boxes)
+        self.owner = owner
+
+
+def _touch_owner(method):
+    def wrapper(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self.owner._touch()
+        return result
+    wrapper.__name__ = method.__name__
+    return wrapper
+
+
+for _method in ['append', 'extend', 'insert', 'remove', 'pop', 'clear', 'sort',
+                'reverse', '__setitem__', '__delitem__', '__iadd__', '__imul__']:
+    setattr(BoxList, _method, _touch_owner(getattr(list, _method)))
+
 
 class Box(object):
     '''
-    t_box: HEX string
-    payload: bytes
+    t_box: HEX string (stored as the 4-byte type code, see type_code)
+    payload: bytes, or any bytes-like object such as a memoryview or mmap
+        of a large file, which is then streamed by write_to without being
+        loaded into memory.
+
+    The serialized form and the size are cached until the payload,
+    the type or (for a superbox) the label or the children change.
+    Assign a new payload instead of mutating it in place.
     '''
+    __slots__ = ('_modified', '_cache', '_t_box', '_payload')
+
     def __init__(self):
+        self._modified = 0
+        self._cache = None
         self.t_box = ''
         self.payload = b''
 
+    @property
+    def t_box(self):
+        return self._t_box.hex()
+
+    @t_box.setter
+    def t_box(self, value):
+        self._t_box = to_binary_code(value)
+        self._touch()
+
+    @property
+    def type_code(self):
+        return self._t_box
+
+    @property
+    def payload(self):
+        return self._payload
+
+    @payload.setter
+    def payload(self, value):
+        self._payload = value
+        self._touch()
+
+    def _touch(self):
+        self._modified = next(_modification_clock)
+
+    def get_modified(self):
+        '''Return a stamp which changes whenever the box
+        or any of its children is modified.
+        '''
+        return self._modified
+
+    def _get_cache(self):
+        modified = self.get_modified()
+        if self._cache is None or self._cache['modified'] != modified:
+            self._cache = {'modified': modified}
+        return self._cache
+
     def get_size(self):
-        # Calculate box size dynamically.
-        # 8 is from l_box (4) + t_box (4)
-        return 8 + len(self.payload)
+        cache = self._get_cache()
+        if 'size' not in cache:
+            # Calculate box size dynamically.
+            # 8 is from l_box (4) + t_box (4), or 16 if xl_box (8) is needed
+            self.set_payload()
+            cache = self._get_cache()
+            cache['size'] = get_box_size(len(self.payload))
+        return cache['size']
 
     def set_payload(self):
         pass
 
-    def convert_bytes(self):
-        self.set_payload()
-
-        # Calculate box size dynamically.
-        # 8 is from l_box (4) + t_box (4)
-        l_box = self.get_size().to_bytes(4, byteorder='big')
-        t_box = bytes.fromhex(self.t_box)
+    def _header_bytes(self, size):
+        return create_box_header(self._t_box, size)
+
+    def _iter_chunks(self, chunk_size):
+        # The first chunk is always the box header (LBox and TBox).
+        cache = self._get_cache()
+        if 'bytes' in cache:
+            view = memoryview(cache['bytes'])
+            header_size = len(self._header_bytes(self.get_size()))
+            yield view[:header_size]
+            view = view[header_size:]
+        else:
+            yield self._header_bytes(self.get_size())
+            view = memoryview(self.payload)
+        for start in range(0, len(view), chunk_size):
+            yield view[start:start + chunk_size]
+
+    def iter_chunks(self, chunk_size=Default_chunk_size):
+        '''Yield the serialized box as bytes-like chunks
+        of at most chunk_size bytes. The first chunk is the box header.
+        '''
+        return self._iter_chunks(chunk_size)
+
+    def write_to(self, fp, chunk_size=Default_chunk_size):
+        '''Write the serialized box to a file-like object (anything with
+        a write method, e.g. a file, BytesIO or socket.makefile()).
+        Return the number of bytes written.
+        '''
+        written = 0
+        for chunk in self.iter_chunks(chunk_size):
+            fp.write(chunk)
+            written += len(chunk)
+        return written
+
+    def get_payload_digest(self, name='sha256'):
+        '''Return the digest of the box without its header, i.e. of the
+        payload of a content box or of the children of a superbox.
+
+        The chunks are fed to hashlib as memoryviews, so large payloads are
+        neither serialized nor copied. The digest is cached like the
+        serialized form.
+        '''
+        cache = self._get_cache()
+        key = 'digest_' + name
+        if key not in cache:
+            m = hashlib.new(name)
+            chunks = self._iter_chunks(Default_chunk_size)
+            next(chunks)  # box header
+            for chunk in chunks:
+                m.update(chunk)
+            cache = self._get_cache()
+            cache[key] = m.digest()
+        return cache[key]
 
-        return l_box + t_box + self.payload
+    def convert_bytes(self):
+        cache = self._get_cache()
+        if 'bytes' not in cache:
+            # The chunks are memoryviews of the payloads, which join copies
+            # once into the bytes it allocates for the whole box tree.
+            data_bytes = b''.join(self._iter_chunks(Default_chunk_size))
+            cache = self._get_cache()
+            cache['bytes'] = data_bytes
+        return cache['bytes']
 
 
 class SuperBox(Box):
+    __slots__ = ('_description_box', '_content_boxes')
+
     def __init__(self):
         super(SuperBox, self).__init__()
-        self.t_box = 'jumb'.encode('utf-8').hex()
+        self.t_box = b'jumb'
         self.description_box = None
         self.content_boxes = []
 
-    def set_payload(self):
-        self.payload = self.description_box.convert_bytes()
+    @property
+    def description_box(self):
+        return self._description_box
+
+    @description_box.setter
+    def description_box(self, value):
+        self._description_box = value
+        self._touch()
+
+    @property
+    def content_boxes(self):
+        return self._content_boxes
+
+    @content_boxes.setter
+    def content_boxes(self, value):
+        self._content_boxes = BoxList(self, value)
+        self._touch()
+
+    def get_modified(self):
+        modified = self._modified
+        if self.description_box is not None:
+            modified = max(modified, self.description_box.get_modified())
         for content_box in self.content_boxes:
-            self.payload += content_box.convert_bytes()
+            modified = max(modified, content_box.get_modified())
+        return modified
+
+    def get_size(self):
+        cache = self._get_cache()
+        if 'size' not in cache:
+            payload_size = self.description_box.get_size()
+            for content_box in self.content_boxes:
+                payload_size += content_box.get_size()
+            cache['size'] = get_box_size(payload_size)
+        return cache['size']
+
+    def _iter_chunks(self, chunk_size):
+        cache = self._get_cache()
+        if 'bytes' in cache:
+            yield from super(SuperBox, self)._iter_chunks(chunk_size)
+            return
+        yield self._header_bytes(self.get_size())
+        yield from self.description_box._iter_chunks(chunk_size)
+        for content_box in self.content_boxes:
+            yield from content_box._iter_chunks(chunk_size)
 
     def print_box(self):
         print('\nSuperboxBox')
@@ -82,24 +312,61 @@ class SuperBox(Box):
 
 class DescriptionBox(Box):
     '''
-    db_type: HEX string
+    db_type: HEX string (stored as the 16-byte UUID, see db_type_code)
     db_toggle: integer
     db_label: string
+
+    content_type: 16-byte UUID, as bytes or HEX string.
     '''
+    __slots__ = ('_db_type', '_db_toggle', '_db_label')
+
     def __init__(self, content_type=Jumbf_content_types['json'], label=''):
         super(DescriptionBox, self).__init__()
-        self.t_box = 'jumd'.encode('utf-8').hex()
+        self.t_box = b'jumd'
         self.db_type = content_type
         # Spec A.3, Table A.2
         self.db_toggle = 3
         # Add 0 for CAI spec
         self.db_label = label
 
+    @property
+    def db_type(self):
+        return self._db_type.hex()
+
+    @db_type.setter
+    def db_type(self, value):
+        self._db_type = to_binary_code(value)
+        self._touch()
+
+    @property
+    def db_type_code(self):
+        return self._db_type
+
+    @property
+    def db_toggle(self):
+        return self._db_toggle
+
+    @db_toggle.setter
+    def db_toggle(self, value):
+        self._db_toggle = value
+        self._touch()
+
+    @property
+    def db_label(self):
+        return self._db_label
+
+    @db_label.setter
+    def db_label(self, value):
+        self._db_label = value
+        self._touch()
+
     def set_payload(self):
-        db_type = bytes.fromhex(self.db_type)
+        db_type = self._db_type
         db_toggle = (self.db_toggle).to_bytes(1, byteorder='big')
         db_label = self.db_label.encode('utf-8') + b'\x00'
-        self.payload = db_type + db_toggle + db_label
+        # The payload is derived from the fields above, which already
+        # invalidate the cache when they change.
+        self._payload = db_type + db_toggle + db_label
 
     def print_box(self):
         print('\nDescriptionBox')
@@ -112,9 +379,11 @@ class DescriptionBox(Box):
 
 
 class ContentBox(Box):
+    __slots__ = ()
+
     def __init__(self, t_box_type='json'):
         super(ContentBox, self).__init__()
-        self.t_box = t_box_type.encode('utf-8').hex()
+        self.t_box = t_box_type.encode('utf-8')
 
     def print_box(self):
         print('\nContentBox')
@@ -124,54 +393,394 @@ class ContentBox(Box):
 
 
 class App11Box(object):
+    '''
+    payload: bytes of the JUMBF superbox to be carried.
+    box: JUMBF superbox to be carried, used instead of payload if set.
+    '''
+    # Le (2B) + CI (2B) + En (2B) + Z (4B) + LBox (4B) + TBox (4B) = 18
+    # Le_max = 65535
+    # segment payload size = 65535 - 18 = 65517
+    # (65509 if the superbox uses XLBox (8B), which is repeated as well)
+    segment_payload_size = 65517
+
+    __slots__ = ('marker', 'ci', 'en', 'z', 'payload', 'box')
+
     def __init__(self, en=1, z=1):
         self.marker = 'FFEB'
         self.ci = 'JP'.encode('utf-8').hex()
         self.en = en
         self.z = z
         self.payload = b''
+        self.box = None
+
+    def _get_superbox_sizes(self):
+        '''Return sizes of the carried superbox header (LBox + TBox + XLBox)
+        and of the rest of the superbox.
+        '''
+        if self.box is not None:
+            size = self.box.get_size()
+            header_size = len(create_box_header(self.box.type_code, size))
+        else:
+            size = len(self.payload)
+            header_size = min(size, get_box_header_size(self.payload))
+        return header_size, size - header_size
 
-    def get_size(self):
-        return len(self.convert_bytes())
-
-    def _split_payload(self):
-        # Le (2B) + CI (2B) + En (4B) + Z (4B) + LBox (4B) + TBox (4B) = 18
-        # Le_max = 65535
-        # segment payload size = 65535 - 18 = 65517
+    def _get_segment_payload_size(self, header_size):
+        return self.segment_payload_size + 8 - max(header_size, 8)
 
-        segment_payload_size = 65517
+    def get_segment_number(self):
+        header_size, body_size = self._get_superbox_sizes()
+        segment_payload_size = self._get_segment_payload_size(header_size)
+        # there is always at least one segment, even for an empty payload
+        return max(1, -(-body_size // segment_payload_size))
 
-        # Preserve LBox and TBox
-        # We will split original payload to multiple sub-payloads,
-        # and add both LBox and TBox to each of the sub-payloads.
-        lbox = self.payload[:4]
-        tbox = self.payload[4:8]
-        payload = self.payload[8:]
+    def get_size(self):
+        # Marker (2B) + Le (2B) + CI (2B) + En (2B) + Z (4B) = 12,
+        # and LBox + TBox (+ XLBox) are repeated in every segment.
+        header_size, body_size = self._get_superbox_sizes()
+        return self.get_segment_number() * (12 + header_size) + body_size
+
+    def _get_segment_header(self, z, superbox_size):
+        marker = bytes.fromhex(self.marker)
+        ci = bytes.fromhex(self.ci)
+        en = self.en.to_bytes(2, byteorder='big')
+
+        # marker is not included
+        length = 2 + len(ci) + len(en) + 4 + superbox_size
+        le = length.to_bytes(2, byteorder='big')
+        return marker + le + ci + en + z.to_bytes(4, byteorder='big')
+
+    def iter_segments(self, chunk_size=None):
+        '''Yield the App11 marker segments as bytes-like pieces:
+        the segment header (with LBox and TBox of the carried superbox)
+        followed by memoryview slices of the superbox payload.
+        Payload slices are at most chunk_size bytes if it is given.
+        Nothing is copied but the segment headers.
+        '''
+        header_size, remaining = self._get_superbox_sizes()
+        segment_payload_size = self._get_segment_payload_size(header_size)
+        if self.box is not None:
+            # the first chunk of a serialized box is its header
+            chunks = self.box.iter_chunks(chunk_size or segment_payload_size)
+            header = bytes(next(chunks))
+            view = memoryview(b'')
+        else:
+            chunks = iter([])
+            view = memoryview(self.payload)
+            header = bytes(view[:header_size])
+            view = view[header_size:]
 
-        segment_superboxes = []
-        while len(payload) > segment_payload_size:
-            segment_superboxes.append(lbox + tbox + payload[:segment_payload_size])
-            payload = payload[segment_payload_size:]
-        segment_superboxes.append(lbox + tbox + payload)
-        return segment_superboxes
+        current_z = self.z
+        for _ in range(self.get_segment_number()):
+            segment_size = min(remaining, segment_payload_size)
+            yield self._get_segment_header(current_z, len(header) + segment_size) + header
+            remaining -= segment_size
+            while segment_size > 0:
+                if len(view) == 0:
+                    view = memoryview(next(chunks))
+                    continue
+                n = min(segment_size, len(view))
+                if chunk_size is not None:
+                    n = min(n, chunk_size)
+                yield view[:n]
+                view = view[n:]
+                segment_size -= n
+            current_z += 1
 
     def convert_bytes(self):
         # Reminder: Superbox = LBox + TBox + Payload
-        segment_superboxes = self._split_payload()
-        total_bytes = b''
-        current_z = self.z
-        for superbox in segment_superboxes:
-            marker = bytes.fromhex(self.marker)
-            ci = bytes.fromhex(self.ci)
-            en = self.en.to_bytes(2, byteorder='big')
-            z = current_z.to_bytes(4, byteorder='big')
-
-            # marker is not included
-            length = 2 + len(ci) + len(en) + len(z) + len(superbox)
-            le = length.to_bytes(2, byteorder='big')
-            total_bytes += marker + le + ci + en + z + superbox
-            current_z += 1
-        return total_bytes
+        return b''.join(self.iter_segments())
+
+    def write_to(self, fp, chunk_size=Default_chunk_size):
+        '''Write the App11 marker segments to a file-like object
+        without materializing the carried superbox.
+        Return the number of bytes written.
+        '''
+        written = 0
+        for piece in self.iter_segments(chunk_size):
+            fp.write(piece)
+            written += len(piece)
+        return written
+
+    def writev(self, fd):
+        '''Write the App11 marker segments to a file descriptor
+        with scatter/gather writes (os.writev) where available.
+        Return the number of bytes written.
+        '''
+        if not hasattr(os, 'writev'):
+            written = 0
+            for piece in self.iter_segments():
+                written += write_all(fd, [piece])
+            return written
+
+        written = 0
+        pieces = []
+        for piece in self.iter_segments():
+            pieces.append(piece)
+            if len(pieces) == Iov_max:
+                written += write_all(fd, pieces)
+                pieces = []
+        if pieces:
+            written += write_all(fd, pieces)
+        return written
+
+
+class SegmentedView(object):
+    '''Read-only view of bytes split across buffers, e.g. of a superbox
+    carried by several App11 marker segments, without copying them.
+
+    parts: list of memoryviews, concatenated in order.
+
+    A slice is a memoryview of a part if it fits in a single part, and
+    a SegmentedView of the parts it covers otherwise. Bytes are only
+    copied by bytes().
+    '''
+    __slots__ = ('parts', '_starts', '_size')
+
+    def __init__(self, parts):
+        self.parts = [part for part in parts if len(part) > 0]
+        self._starts = []
+        self._size = 0
+        for part in self.parts:
+            self._starts.append(self._size)
+            self._size += len(part)
+
+    def __len__(self):
+        return self._size
+
+    def _locate(self, offset):
+        # index of the part containing offset, and offset in that part
+        i = bisect.bisect_right(self._starts, offset) - 1
+        return i, offset - self._starts[i]
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            if key < 0:
+                key += self._size
+            if not 0 <= key < self._size:
+                raise IndexError('SegmentedView index out of range')
+            i, offset = self._locate(key)
+            return self.parts[i][offset]
+
+        start, stop, step = key.indices(self._size)
+        if step != 1:
+            raise ValueError('SegmentedView slices must be contiguous')
+        if start >= stop:
+            return memoryview(b'')
+        i, first_offset = self._locate(start)
+        j, last_offset = self._locate(stop - 1)
+        if i == j:
+            return self.parts[i][first_offset:last_offset + 1]
+        return SegmentedView([self.parts[i][first_offset:]]
+                             + self.parts[i + 1:j]
+                             + [self.parts[j][:last_offset + 1]])
+
+    def __bytes__(self):
+        return b''.join(self.parts)
+
+    def __eq__(self, other):
+        # compares with bytes-like objects as a memoryview does
+        try:
+            return bytes(self) == bytes(_as_view(other))
+        except TypeError:
+            return NotImplemented
+
+
+def get_parts(buffer):
+    '''Return the bytes-like parts of a buffer or of a SegmentedView,
+    e.g. to hash a box payload without copying it.
+    '''
+    if isinstance(buffer, SegmentedView):
+        return buffer.parts
+    return [buffer]
+
+
+def _as_view(buffer):
+    if isinstance(buffer, SegmentedView):
+        return buffer
+    return memoryview(buffer)
+
+
+class BoxView(object):
+    '''Read-only view of a serialized JUMBF box.
+
+    buffer: memoryview slice of the original bytes covering the whole box,
+        or a SegmentedView if the box spans several App11 segments.
+        Payloads are never copied, and the children of a superbox are
+        only parsed when they are accessed.
+    '''
+    __slots__ = ('buffer', 'header_size', 'type_code', '_children')
+
+    def __init__(self, buffer, header_size=8):
+        self.buffer = buffer
+        self.header_size = header_size
+        self.type_code = bytes(buffer[4:8])
+        self._children = None
+
+    @property
+    def t_box(self):
+        return self.type_code.hex()
+
+    @property
+    def box_type(self):
+        return self.type_code.decode('utf-8', errors='replace')
+
+    @property
+    def is_superbox(self):
+        return self.type_code == b'jumb'
+
+    @property
+    def size(self):
+        return len(self.buffer)
+
+    @property
+    def payload(self):
+        return self.buffer[self.header_size:]
+
+    @property
+    def boxes(self):
+        '''All child boxes of a superbox, description box included.
+        '''
+        if self._children is None:
+            self._children = parse_boxes(self.payload) if self.is_superbox else []
+        return self._children
+
+    @property
+    def description_box(self):
+        if self.boxes and isinstance(self.boxes[0], DescriptionBoxView):
+            return self.boxes[0]
+        return None
+
+    @property
+    def content_boxes(self):
+        if self.description_box is not None:
+            return self.boxes[1:]
+        return self.boxes
+
+    @property
+    def label(self):
+        if self.description_box is None:
+            return None
+        return self.description_box.db_label
+
+    def get(self, label):
+        '''Return the child superbox with the given label, or None.
+        '''
+        for content_box in self.content_boxes:
+            if content_box.is_superbox and content_box.label == label:
+                return content_box
+        return None
+
+    def find(self, path):
+        '''Return the descendant superbox addressed by a slash-separated
+        label path, e.g. '<manifest-label>/c2pa.claim', or None.
+        '''
+        box = self
+        for label in path.strip('/').split('/'):
+            box = box.get(label)
+            if box is None:
+                return None
+        return box
+
+    def print_box(self, indent=0):
+        print('{}{} ({} bytes) {}'.format('\t' * indent,
+                                          self.box_type,
+                                          self.size,
+                                          self.label or ''))
+        for box in self.content_boxes:
+            box.print_box(indent + 1)
+
+
+class DescriptionBoxView(BoxView):
+    '''Read-only view of a serialized JUMBF description box.
+    '''
+    __slots__ = ('db_type_code', 'db_toggle', 'db_label')
+
+    def __init__(self, buffer, header_size=8):
+        super(DescriptionBoxView, self).__init__(buffer, header_size)
+        payload = self.payload
+        if len(payload) < 17:
+            raise ValueError('Description box is too short: {} bytes'.format(len(payload)))
+        self.db_type_code = bytes(payload[:16])
+        self.db_toggle = payload[16]
+        self.db_label = None
+        # Spec A.3, Table A.2: label is present if bit 1 of toggle is set
+        if self.db_toggle & 0x02:
+            label = bytes(payload[17:])
+            end = label.find(b'\x00')
+            if end < 0:
+                raise ValueError('Description box label is not null-terminated')
+            self.db_label = label[:end].decode('utf-8')
+
+    @property
+    def db_type(self):
+        return self.db_type_code.hex()
+
+
+def parse_box(buffer, offset=0):
+    '''Parse the box starting at offset of buffer.
+    Return a BoxView backed by a slice of buffer.
+    buffer: bytes-like object or SegmentedView.
+    '''
+    view = _as_view(buffer)
+    if len(view) - offset < 8:
+        raise ValueError('Truncated box header at offset {}'.format(offset))
+    l_box = int.from_bytes(view[offset:offset + 4], byteorder='big')
+    header_size = 8
+    if l_box == 0:
+        # box extends to the end of the buffer
+        l_box = len(view) - offset
+    elif l_box == 1:
+        # the actual size is stored in XLBox
+        if len(view) - offset < 16:
+            raise ValueError('Truncated XLBox at offset {}'.format(offset))
+        l_box = int.from_bytes(view[offset + 8:offset + 16], byteorder='big')
+        header_size = 16
+    if l_box < header_size or offset + l_box > len(view):
+        raise ValueError('Invalid LBox {} at offset {}'.format(l_box, offset))
+
+    box_view = view[offset:offset + l_box]
+    if bytes(box_view[4:8]) == b'jumd':
+        return DescriptionBoxView(box_view, header_size)
+    return BoxView(box_view, header_size)
+
+
+def parse_boxes(buffer):
+    '''Parse consecutive boxes filling buffer.
+    Return a list of BoxViews.
+    '''
+    view = _as_view(buffer)
+    boxes = []
+    offset = 0
+    while offset < len(view):
+        box = parse_box(view, offset)
+        boxes.append(box)
+        offset += box.size
+    return boxes
+
+
+def reassemble_app11_payload(data_bytes, headers):
+    '''Concatenate the superbox carried by App11 marker segments.
+
+    headers: App11 headers of a single box, keyed by sequence number Z,
+        as returned by get_app11_marker_segment_headers.
+    return: memoryview of the superbox if it fits in a single segment,
+        SegmentedView of the segment payloads otherwise. Nothing is copied,
+        so parsing the boxes only reads their headers.
+    '''
+    view = memoryview(data_bytes)
+    segments = [headers[z] for z in sorted(headers)]
+    # Le (2B) + CI (2B) + En (2B) + Z (4B) = 10,
+    # and each segment repeats LBox (4B) + TBox (4B) (+ XLBox (8B))
+    spans = [(h['offset'] + 12, h['offset'] + 2 + h['le']) for h in segments]
+    if len(spans) == 1:
+        start, end = spans[0]
+        return view[start:end]
+
+    first_start, first_end = spans[0]
+    header_size = get_box_header_size(view[first_start:first_end])
+    return SegmentedView([view[first_start:first_end]]
+                         + [view[start + header_size:end] for start, end in spans[1:]])
 
 
 def create_single_content_superbox(content=b'',
@@ -225,24 +834,31 @@ def json_to_bytes(json_object):
     return json.dumps(json_object, separators=(',', ':')).encode('utf-8')
 
 
-def json_to_cbor_bytes(json_object):
-    return cbor.dumps(json_object, separators=(',',':'))
+def json_to_cbor_bytes(json_object, canonical=False):
+    return get_codec().dumps(json_object, canonical=canonical)
 
 
-def get_app11_marker_segment_headers(data_bytes):
-    marker = b'\xff\xeb'
-    offsets = [m.start() for m in re.finditer(marker, data_bytes)]
+def get_app11_marker_segment_headers(data_bytes, segments=None):
+    '''Return headers of the App11 marker segments carrying JUMBF,
+    keyed by the packet sequence number Z.
+
+    segments: JPEG segment index from get_jpeg_segments.
+        It is computed from data_bytes if not given.
+    '''
+    if segments is None:
+        segments = get_jpeg_segments(data_bytes)
     headers = {}
-    for offset in offsets:
+    for segment in get_app11_segments(segments):
+        offset = segment.offset
         try:
             ci = data_bytes[offset + 4: offset + 6].decode('utf-8')
         except Exception as e:
-            print(f'Find App11 marker, and fail to get CI. Exception: {e}')
+            warnings.warn(f'Find App11 marker, and fail to get CI. Exception: {e}', stacklevel=2)
             ci = None
         try:
             tbox = data_bytes[offset + 16: offset + 20].decode('utf-8')
         except Exception as e:
-            print(f'Find App11 marker, and fail to get TBox. Exception: {e}')
+            warnings.warn(f'Find App11 marker, and fail to get TBox. Exception: {e}', stacklevel=2)
             tbox = None
 
         if ci == 'JP' and tbox == 'jumb':
@@ -253,11 +869,14 @@ def get_app11_marker_segment_headers(data_bytes):
             header['z'] = int.from_bytes(data_bytes[offset + 8: offset + 12], byteorder='big')
             header['lbox'] = int.from_bytes(data_bytes[offset + 12: offset + 16], byteorder='big')
             header['tbox'] = data_bytes[offset + 16: offset + 20].decode('utf-8')
+            if header['lbox'] == 1:
+                header['xlbox'] = int.from_bytes(data_bytes[offset + 20: offset + 28], byteorder='big')
             header['offset'] = offset
 
             # passive protection to skip illegal or empty segment
             if header['le'] > 10:
                 headers[header['z']] = header
         else:
-            print('Unknown CI ({0}) or TBox ({1}) of offset {2}'.format(ci, tbox, hex(offset)))
+            warnings.warn('Unknown CI ({0}) or TBox ({1}) of offset {2}'.format(ci, tbox, hex(offset)),
+                          stacklevel=2)
     return headers
@@ -0,0 +1,317 @@
+# Copyright 2020 Numbers Co., Ltd.
+#
+# This file is part of pyc2pa.
+#
+# pyc2pa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyc2pa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyc2pa.  If not, see <http://www.gnu.org/licenses/>.
+
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric import ed448
+from cryptography.hazmat.primitives.asymmetric import ed25519
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+from cryptography.hazmat.primitives.serialization import Encoding
+from cryptography.hazmat.primitives.serialization import pkcs12
+
+from c2pa.codec import get_codec
+
+'''Claim signers.
+
+A Signer parses the key material once and can then sign any number of
+Claims, which is what batch jobs signing with one identity should use.
+A SigningPool does the same on several processes.
+'''
+
+# COSE algorithm identifiers, RFC 8152 section 8 and RFC 8230 section 2
+Cose_algorithms = {
+    'ES256' : -7,
+    'ES384' : -35,
+    'ES512' : -36,
+    'EdDSA' : -8,
+    'PS256' : -37,
+    'PS384' : -38,
+    'PS512' : -39,
+}
+
+Hash_algorithms = {
+    '256': hashes.SHA256,
+    '384': hashes.SHA384,
+    '512': hashes.SHA512,
+}
+
+# Default algorithm of each elliptic curve
+Ec_curve_algorithms = {
+    'secp256r1': 'ES256',
+    'secp384r1': 'ES384',
+    'secp521r1': 'ES512',
+}
+
+
+def get_key_algorithms(key):
+    '''Return the COSE algorithms usable with a private or public key,
+    the default one first.
+    '''
+    if isinstance(key, (rsa.RSAPrivateKey, rsa.RSAPublicKey)):
+        return ['PS256', 'PS384', 'PS512']
+    if isinstance(key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)):
+        if key.curve.name not in Ec_curve_algorithms:
+            raise ValueError('Unsupported elliptic curve {}'.format(key.curve.name))
+        return [Ec_curve_algorithms[key.curve.name]]
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey,
+                        ed448.Ed448PrivateKey, ed448.Ed448PublicKey)):
+        return ['EdDSA']
+    raise ValueError('Unsupported key type {}'.format(type(key).__name__))
+
+
+def get_signature_size(key):
+    '''Return the size in bytes of the COSE signatures made with a key.
+    It does not depend on the signed data for any of Cose_algorithms.
+    '''
+    if isinstance(key, (rsa.RSAPrivateKey, rsa.RSAPublicKey)):
+        return (key.key_size + 7) // 8
+    if isinstance(key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)):
+        return 2 * ((key.curve.key_size + 7) // 8)
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+        return 64
+    if isinstance(key, (ed448.Ed448PrivateKey, ed448.Ed448PublicKey)):
+        return 114
+    raise ValueError('Unsupported key type {}'.format(type(key).__name__))
+
+
+def load_certificates(data):
+    '''Return the x509 certificates of PEM (whole chain) or DER bytes.
+    '''
+    if data.lstrip().startswith(b'-----BEGIN'):
+        return x509.load_pem_x509_certificates(data)
+    return [x509.load_der_x509_certificate(data)]
+
+
+def verify_signature(public_key, alg, data, signature):
+    '''Return True if signature, as encoded by COSE, is the signature
+    of data made with alg and the private key of public_key.
+    ValueError is raised if alg can not be used with the key.
+    '''
+    if alg not in get_key_algorithms(public_key):
+        raise ValueError('Algorithm {} can not be used with {} keys'.format(
+            alg, type(public_key).__name__))
+    try:
+        if alg == 'EdDSA':
+            public_key.verify(signature, data)
+            return True
+
+        hash_algorithm = Hash_algorithms[alg[2:]]()
+        if alg.startswith('PS'):
+            public_key.verify(
+                signature,
+                data,
+                padding.PSS(
+                    mgf=padding.MGF1(hash_algorithm),
+                    salt_length=hash_algorithm.digest_size
+                ),
+                hash_algorithm
+            )
+            return True
+
+        # back from r || s to the DER encoding of cryptography
+        size = (public_key.curve.key_size + 7) // 8
+        if len(signature) != 2 * size:
+            return False
+        r = int.from_bytes(signature[:size], byteorder='big')
+        s = int.from_bytes(signature[size:], byteorder='big')
+        public_key.verify(encode_dss_signature(r, s), data, ec.ECDSA(hash_algorithm))
+        return True
+    except InvalidSignature:
+        return False
+
+
+class Signer(object):
+    '''
+    private_key: private key object of the cryptography package.
+    certificates: list of x509 certificates, the signer certificate first,
+        followed by the intermediate certificates if any.
+    alg: COSE algorithm name, one of Cose_algorithms.
+        Default to the one of the key type: PS256 for RSA keys,
+        ES256/ES384/ES512 for P-256/P-384/P-521 keys and EdDSA for Ed25519.
+    '''
+    def __init__(self, private_key, certificates, alg=None):
+        self.private_key = private_key
+        self._set_certificates(private_key, certificates, alg)
+
+    def _set_certificates(self, key, certificates, alg):
+        '''Set the certificates, the algorithm and the COSE headers.
+        key: private or public key of the signer, deciding the usable algorithms.
+        '''
+        if len(certificates) == 0:
+            raise ValueError('Signer requires at least one certificate')
+        algorithms = get_key_algorithms(key)
+        if alg is None:
+            alg = algorithms[0]
+        if alg not in algorithms:
+            raise ValueError('Algorithm {} can not be used with {} keys, use one of {}'.format(
+                alg, type(key).__name__, algorithms))
+        self.certificates = certificates
+        self.alg = alg
+
+        # e.g. -37 stands for PS256 (RSASSA-PSS using SHA-256 and MGF1 with SHA-256)
+        self.protected_header = get_codec().dumps({1: Cose_algorithms[alg]})
+        # RFC 9360: a single certificate is a bstr, a chain is an array of bstr
+        chain = [cert.public_bytes(Encoding.DER) for cert in certificates]
+        self.x5chain = chain[0] if len(chain) == 1 else chain
+        self.signature_size = get_signature_size(certificates[0].public_key())
+
+    @classmethod
+    def from_pem(cls, key, certificate, password=None, alg=None):
+        '''key and certificate are PEM bytes.
+        certificate may contain the whole chain.
+        '''
+        private_key = serialization.load_pem_private_key(key, password=password)
+        return cls(private_key, x509.load_pem_x509_certificates(certificate), alg)
+
+    @classmethod
+    def from_der(cls, key, certificate, password=None, alg=None):
+        '''key and certificate are DER bytes.
+        '''
+        private_key = serialization.load_der_private_key(key, password=password)
+        return cls(private_key, [x509.load_der_x509_certificate(certificate)], alg)
+
+    @classmethod
+    def from_pkcs12(cls, data, password=None, alg=None):
+        '''data is a PKCS#12 (.p12, .pfx) bundle with key and certificates.
+        '''
+        if isinstance(password, str):
+            password = password.encode('utf-8')
+        private_key, certificate, additional_certificates = \
+            pkcs12.load_key_and_certificates(data, password)
+        if private_key is None or certificate is None:
+            raise ValueError('PKCS#12 data does not contain a key and a certificate')
+        return cls(private_key, [certificate] + list(additional_certificates), alg)
+
+    @classmethod
+    def load(cls, key, certificate=None, password=None, alg=None):
+        '''Guess the format of the key material:
+        PKCS#12 if certificate is not given, PEM or DER otherwise.
+        '''
+        if certificate is None or len(certificate) == 0:
+            return cls.from_pkcs12(key, password, alg)
+        if key.lstrip().startswith(b'-----BEGIN'):
+            return cls.from_pem(key, certificate, password, alg)
+        return cls.from_der(key, certificate, password, alg)
+
+    def sign(self, data):
+        '''Return the signature of data in bytes, as encoded by COSE.
+        '''
+        if self.alg == 'EdDSA':
+            return self.private_key.sign(data)
+
+        hash_algorithm = Hash_algorithms[self.alg[2:]]()
+        if self.alg.startswith('PS'):
+            # RFC 8230 section 2: the salt length is the hash length
+            return self.private_key.sign(
+                data,
+                padding.PSS(
+                    mgf=padding.MGF1(hash_algorithm),
+                    salt_length=hash_algorithm.digest_size
+                ),
+                hash_algorithm
+            )
+
+        # RFC 8152 section 8.1: ECDSA signatures are r and s,
+        # each left-padded to the size of the curve
+        r, s = decode_dss_signature(self.private_key.sign(data, ec.ECDSA(hash_algorithm)))
+        size = (self.private_key.curve.key_size + 7) // 8
+        return r.to_bytes(size, byteorder='big') + s.to_bytes(size, byteorder='big')
+
+
+class PlaceholderSigner(object):
+    '''Stand-in for a signer which signs with zeros of the same size,
+    to plan the layout of a Manifest before it is actually signed.
+    '''
+    def __init__(self, signer):
+        self.alg = signer.alg
+        self.protected_header = signer.protected_header
+        self.x5chain = signer.x5chain
+        self.signature_size = signer.signature_size
+
+    def sign(self, data):
+        return bytes(self.signature_size)
+
+
+# Signer of a SigningPool worker process, loaded by _init_worker
+_worker_signer = None
+
+
+def _init_worker(key, certificate, password, alg):
+    global _worker_signer
+    _worker_signer = Signer.load(key, certificate, password, alg)
+
+
+def _sign_in_worker(data):
+    return _worker_signer.sign(data)
+
+
+class SigningPool(object):
+    '''Sign on a pool of processes, so that batch jobs can use all cores.
+
+    key, certificate, password, alg: as accepted by Signer.load.
+        Every worker parses the key material once when it starts.
+    max_workers: number of processes, default to the number of CPUs.
+
+    It can be used wherever a Signer is accepted. C2paManifest then
+    submits the Sig_structure and exposes a future (see C2paManifest.future).
+    '''
+    def __init__(self, key, certificate=None, password=None, alg=None, max_workers=None):
+        from concurrent.futures import ProcessPoolExecutor
+
+        # parsed here as well for the protected header and the x5chain
+        self.signer = Signer.load(key, certificate, password, alg)
+        self.executor = ProcessPoolExecutor(max_workers=max_workers,
+                                            initializer=_init_worker,
+                                            initargs=(key, certificate, password, self.signer.alg))
+
+    @property
+    def alg(self):
+        return self.signer.alg
+
+    @property
+    def signature_size(self):
+        return self.signer.signature_size
+
+    @property
+    def protected_header(self):
+        return self.signer.protected_header
+
+    @property
+    def x5chain(self):
+        return self.signer.x5chain
+
+    def submit(self, data):
+        '''Return a future of the signature of data in bytes.
+        '''
+        return self.executor.submit(_sign_in_worker, bytes(data))
+
+    def sign(self, data):
+        return self.submit(data).result()
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
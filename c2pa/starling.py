@@ -17,21 +17,35 @@
 
 import argparse
 import os
+import sys
 
-from c2pa.core import C2paManifestBlock
-from c2pa.core import C2paManifest
 from c2pa.jumbf import App11Box, json_to_cbor_bytes
 
-from c2pa.core import get_xmp_tag
-from c2pa.core import insert_xmp_key
+from c2pa.data_hash import DataHash
+from c2pa.data_hash import hash_pieces
+from c2pa.jpeg import get_jpeg_segments
+from c2pa.jpeg import get_output_offset
+from c2pa.jpeg import iter_spliced
+from c2pa.jpeg import map_file
+from c2pa.jpeg import write_spliced
+from c2pa.jumbf import create_box_header
 from c2pa.jumbf import create_codestream_superbox
 from c2pa.jumbf import create_json_superbox
 from c2pa.jumbf import create_cbor_superbox
 from c2pa.jumbf import get_app11_marker_segment_headers
+from c2pa.jumbf import get_box_size
+from c2pa.xmp import plan_provenance_edit
 
 '''Starling CLI tool to generate CAI metadata.
+
+c2pa.core, c2pa.signer and c2pa.hsm import cryptography (and pkcs11),
+so they are imported on first use: `c2pa --help` and argument errors
+do not pay for them. See benchmarks/bench_startup.py.
 '''
 
+# COSE algorithm names of c2pa.signer.Cose_algorithms, listed in --help
+Cose_algorithm_names = ['ES256', 'ES384', 'ES512', 'EdDSA', 'PS256', 'PS384', 'PS512']
+
 
 class Starling(object):
     def __init__(self,
@@ -41,9 +55,12 @@ class Starling(object):
                  provider,
                  recorder,
                  private_key='',
-                 certificate=''):
+                 certificate='',
+                 signer=None,
+                 executor=None):
         '''
-        raw_bytes: media content in bytes.
+        media_bytes: media content in bytes, or a memory-mapped file.
+            See inject_file to inject files without reading them in memory.
 
         raw_assertions: dict of assertion JSON objects, and keys are labels.
             refer to create_assertions for the details.
@@ -55,6 +72,14 @@ class Starling(object):
         private_key: private key bytes.
 
         certificate: certificate bytes.
+
+        signer: c2pa.signer.Signer, used instead of private_key and certificate.
+            Create it once to sign many media with the same identity.
+            A c2pa.signer.SigningPool signs on other processes, so that
+            injections running on several threads use all cores.
+
+        executor: concurrent.futures.Executor hashing the Assertions in
+            parallel, e.g. a ThreadPoolExecutor shared by the injections.
         '''
         self.raw_bytes = media_bytes
         self.media_name = media_name
@@ -63,10 +88,15 @@ class Starling(object):
         self.recorder = recorder
         self.private_key = private_key
         self.certificate = certificate
+        self.signer = signer
+        self.executor = executor
+        from c2pa.core import get_xmp_tag
+        # index the JPEG marker segments once
+        self.segments = get_jpeg_segments(self.raw_bytes)
         # get the label of the last Claim
-        self.parent_claim = get_xmp_tag(self.raw_bytes)
+        self.parent_claim = get_xmp_tag(self.raw_bytes, segments=self.segments)
         # get App11 marker segment headers
-        self.app11_headers = get_app11_marker_segment_headers(self.raw_bytes)
+        self.app11_headers = get_app11_marker_segment_headers(self.raw_bytes, segments=self.segments)
         self.has_app11_headers = True if len(self.app11_headers) > 0 else False
 
     def create_assertions(self, raw_assertions):
@@ -101,28 +131,82 @@ class Starling(object):
                     'Unknown assertion type {0} from {1}'.format(assertion_type, label))
         return assertions
 
-    def single_claim_injection(self):
-        # create a new manifest
+    def create_manifest(self, manifest_label, data_hash, signer):
+        from c2pa.core import C2paManifest
         c2pa_manifest = C2paManifest(provider=self.provider,
-                                     assertions=self.assertions,
+                                     assertions=self.assertions + [data_hash.box],
                                      recorder=self.recorder,
-                                     key=self.private_key,
+                                     signer=signer,
+                                     executor=self.executor,
                                      media_name=self.media_name,
-                                     certificate=self.certificate)
+                                     manifest_label=manifest_label)
+        c2pa_manifest.future.result()
+        return c2pa_manifest
 
-        # create a new Claim Block Box
-        c2pa_manifest_block = C2paManifestBlock()
-        c2pa_manifest_block.content_boxes.append(c2pa_manifest)
-        c2pa_segment = App11Box()
-        c2pa_segment.payload = c2pa_manifest_block.convert_bytes()
+    def plan_layout(self, create_app11_segment, data_hash):
+        '''Create the App11 segments of the Manifest Store, with the
+        exclusion of data_hash covering them.
 
-        # save CAI-injected media
-        data_bytes = self.raw_bytes[0:2] + c2pa_segment.convert_bytes() + self.raw_bytes[2:]
-        cai_data_bytes = insert_xmp_key(data_bytes, manifest_label=c2pa_manifest.manifest_label)
-        return cai_data_bytes
+        create_app11_segment: function of a signer returning the
+            (Manifest, App11Box) to be injected.
 
-    def multiple_claims_injection(self):
-        """Re-create a new Claim Block.
+        The Manifest is first created with a placeholder signature of the
+        final size to compute the size of the App11 segments, and is then
+        signed once with the exclusion length set.
+        '''
+        from c2pa.signer import PlaceholderSigner
+        from c2pa.signer import Signer
+        signer = self.signer
+        if signer is None:
+            signer = Signer.from_pem(self.private_key, self.certificate)
+        _, c2pa_segment = create_app11_segment(PlaceholderSigner(signer))
+        data_hash.set_length(c2pa_segment.get_size())
+
+        c2pa_manifest, c2pa_segment = create_app11_segment(signer)
+        if c2pa_segment.get_size() != data_hash.length:
+            raise ValueError('App11 segments of {} bytes do not match the planned {} bytes'.format(
+                c2pa_segment.get_size(), data_hash.length))
+        return c2pa_manifest, c2pa_segment
+
+    def plan_single_claim_injection(self):
+        '''Return the edits of the media inserting a new Manifest Store,
+        see c2pa.jpeg.iter_spliced.
+        '''
+        from c2pa.core import C2paManifestBlock
+        from c2pa.core import create_manifest_label
+
+        manifest_label = create_manifest_label(self.provider)
+        # The App11 segments are inserted right after SOI, and the XMP
+        # provenance is set in the same pass.
+        edits = [(2, 2, b''),
+                 plan_provenance_edit(self.raw_bytes, manifest_label, segments=self.segments)]
+
+        # the hash covers the output without the App11 segments
+        data_hash = DataHash(start=get_output_offset(edits, 0),
+                             digest=hash_pieces(iter_spliced(self.raw_bytes, edits)))
+
+        def create_app11_segment(signer):
+            # create a new manifest
+            c2pa_manifest = self.create_manifest(manifest_label, data_hash, signer)
+
+            # create a new Claim Block Box
+            c2pa_manifest_block = C2paManifestBlock()
+            c2pa_manifest_block.content_boxes.append(c2pa_manifest)
+            c2pa_segment = App11Box()
+            c2pa_segment.box = c2pa_manifest_block
+            return c2pa_manifest, c2pa_segment
+
+        c2pa_manifest, c2pa_segment = self.plan_layout(create_app11_segment, data_hash)
+
+        edits[0] = (2, 2, list(c2pa_segment.iter_segments()))
+        return edits
+
+    def single_claim_injection(self):
+        return b''.join(iter_spliced(self.raw_bytes, self.plan_single_claim_injection()))
+
+    def plan_multiple_claims_injection(self):
+        """Re-create a new Claim Block, and return the edits of the media
+        replacing the current one, see c2pa.jpeg.iter_spliced.
         The high-levle idea is to
         1. Re-construct current Claim Block by
            concatenating the payloads in the App11 segments.
@@ -130,6 +214,8 @@ class Starling(object):
         3. Re-create App11 segments based on the updated Claim Block.
         4. Replace the old App11 segments by the new App11 segments.
         """
+        from c2pa.core import create_manifest_label
+
         # generate acquisition assertion
         acquisition_assertion = {
             'dc:format': 'image/jpeg',
@@ -152,37 +238,27 @@ class Starling(object):
             content=json_to_cbor_bytes(acquisition_assertion),
             label='c2pa.ingredient'))
 
-        # create a new Store
-        c2pa_manifest = C2paManifest(provider=self.provider,
-                                     assertions=self.assertions,
-                                     recorder=self.recorder,
-                                     key=self.private_key,
-                                     certificate=self.certificate,
-                                     media_name=self.media_name)
+        manifest_label = create_manifest_label(self.provider)
+        data_bytes = self.raw_bytes
+        app11_headers = self.app11_headers
 
         # get last segment header information
-        header_number = len(self.app11_headers)
-        last_en = self.app11_headers[header_number]['en']
-        last_lbox = self.app11_headers[header_number]['lbox']
+        header_number = len(app11_headers)
+        last_en = app11_headers[header_number]['en']
+        # LBox + TBox (+ XLBox if LBox is 1) are repeated in every segment
+        box_header_size = 16 if app11_headers[header_number]['lbox'] == 1 else 8
 
         # re-construct Claim Block payload
         claim_block_payload = bytearray()
         # App11 Length of Marker Segment (the Le parameter) value is 8 ~ 65535.
         # App11 Packet Sequence number (the Z parameter) value is 1 ~ 2^32-1.
-        # The Claim Block maximum size will be ~= 2^48 B ~= 280 TB.
+        # The Claim Block maximum size will be ~= 2^48 B ~= 280 TB,
+        # which requires XLBox beyond 4 GB.
         for i in range(1, header_number + 1):
-            payload_start = self.app11_headers[i]['offset'] + 20
-            payload_end = payload_start + (self.app11_headers[i]['le'] - 18)
-            payload = self.raw_bytes[payload_start: payload_end]
+            payload_start = app11_headers[i]['offset'] + 12 + box_header_size
+            payload_end = app11_headers[i]['offset'] + 2 + app11_headers[i]['le']
+            payload = data_bytes[payload_start: payload_end]
             claim_block_payload += payload
-        store_bytes = c2pa_manifest.convert_bytes()
-
-        # append new Store bytes
-        updated_claim_block_payload = claim_block_payload + store_bytes
-        updated_lbox = last_lbox + len(store_bytes)
-        updated_claim_block_bytes = updated_lbox.to_bytes(4, byteorder='big') + b'jumb' + updated_claim_block_payload
-        updated_app11_segment = App11Box(en=last_en)
-        updated_app11_segment.payload = updated_claim_block_bytes
 
         # Assuming that current CAI data consists of 3 App11 segments.
         #
@@ -199,29 +275,97 @@ class Starling(object):
         #                                                               ending point --+
         #
         # starting point of current CAI data
-        update_range_s = self.app11_headers[1]['offset']
+        update_range_s = app11_headers[1]['offset']
         # ending point of current CAI data
-        update_range_e = self.app11_headers[header_number]['offset'] + self.app11_headers[header_number]['le'] + 2
+        update_range_e = app11_headers[header_number]['offset'] + app11_headers[header_number]['le'] + 2
 
-        # save CAI-injected media
-        data_bytes = (
-            self.raw_bytes[:update_range_s] +
-            updated_app11_segment.convert_bytes() +
-            self.raw_bytes[update_range_e:]
-        )
-        c2pa_data_bytes = insert_xmp_key(data_bytes, manifest_label=c2pa_manifest.manifest_label)
-        return c2pa_data_bytes
+        # The new App11 segments replace the current ones, and the XMP
+        # provenance is set in the same pass.
+        edits = [(update_range_s, update_range_e, b''),
+                 plan_provenance_edit(data_bytes, manifest_label, segments=self.segments)]
 
-    def c2pa_injection(self):
+        # the hash covers the output without the App11 segments
+        data_hash = DataHash(start=get_output_offset(edits, 0),
+                             digest=hash_pieces(iter_spliced(data_bytes, edits)))
+
+        def create_app11_segment(signer):
+            # create a new Store
+            c2pa_manifest = self.create_manifest(manifest_label, data_hash, signer)
+            store_bytes = c2pa_manifest.convert_bytes()
+
+            # append new Store bytes
+            updated_claim_block_payload = claim_block_payload + store_bytes
+            updated_size = get_box_size(len(updated_claim_block_payload))
+            updated_claim_block_bytes = create_box_header(b'jumb', updated_size) + updated_claim_block_payload
+            updated_app11_segment = App11Box(en=last_en)
+            updated_app11_segment.payload = updated_claim_block_bytes
+            return c2pa_manifest, updated_app11_segment
+
+        c2pa_manifest, updated_app11_segment = self.plan_layout(create_app11_segment, data_hash)
+
+        edits[0] = (update_range_s, update_range_e, list(updated_app11_segment.iter_segments()))
+        return edits
+
+    def multiple_claims_injection(self):
+        return b''.join(iter_spliced(self.raw_bytes, self.plan_multiple_claims_injection()))
+
+    def plan_c2pa_injection(self):
         if self.has_app11_headers:
-            c2pa_data_bytes = self.multiple_claims_injection()
-        else:
-            c2pa_data_bytes = self.single_claim_injection()
-        return c2pa_data_bytes
+            return self.plan_multiple_claims_injection()
+        return self.plan_single_claim_injection()
+
+    def c2pa_injection(self):
+        return b''.join(iter_spliced(self.raw_bytes, self.plan_c2pa_injection()))
+
+
+def inject_file(input_path,
+                output_path,
+                raw_assertions,
+                provider,
+                recorder,
+                signer=None,
+                executor=None,
+                media_name=None):
+    '''Write the media of input_path with a new Manifest to output_path,
+    without reading it in memory: the media is memory-mapped to be hashed,
+    and the image data is copied from file to file by the kernel where
+    possible, see c2pa.jpeg.write_spliced.
+
+    media_name: title of the Claim, the file name of input_path by default.
+    Other arguments are those of Starling.
+    return: number of bytes written.
+    '''
+    if os.path.exists(output_path) and os.path.samefile(input_path, output_path):
+        raise ValueError('Can not inject {} in place'.format(input_path))
+    if media_name is None:
+        media_name = os.path.basename(input_path)
+
+    with open(input_path, 'rb') as src:
+        with map_file(src) as media_bytes:
+            starling = Starling(media_bytes,
+                                media_name,
+                                raw_assertions,
+                                provider,
+                                recorder,
+                                signer=signer,
+                                executor=executor)
+            edits = starling.plan_c2pa_injection()
+            # no view of the map is left when it is closed
+            del starling
+
+        dst = open(output_path, 'wb')
+        try:
+            with dst:
+                return write_spliced(src.fileno(), dst.fileno(), edits)
+        except Exception:
+            # do not leave a partial output
+            os.remove(output_path)
+            raise
 
 
 def parse_args():
-    ap = argparse.ArgumentParser()
+    ap = argparse.ArgumentParser(
+        epilog='Use "c2pa verify --help" to verify files instead.')
     ap.add_argument(
         '-a', '--assertion',
         help=('Assertion filepath. '
@@ -244,7 +388,26 @@ def parse_args():
     ap.add_argument(
         '-c', '--cert',
         default='',
-        help='Public certificate filepath.')
+        help='Public certificate filepath. Omit it if the key is a PKCS#12 bundle.')
+    ap.add_argument(
+        '--password',
+        default=None,
+        help='Password of the private key or of the PKCS#12 bundle.')
+    ap.add_argument(
+        '--alg',
+        default=None,
+        help='COSE signing algorithm, one of {}. Default: PS256 for RSA keys, '
+             'ES256/ES384/ES512 for EC keys, EdDSA for Ed25519 keys'.format(
+                 ', '.join(Cose_algorithm_names)))
+    ap.add_argument(
+        '--pkcs11-module',
+        default=None,
+        help='PKCS#11 library filepath. If given, -k is the label of the key '
+             'on the token and --password its PIN.')
+    ap.add_argument(
+        '--pkcs11-token',
+        default=None,
+        help='Label of the PKCS#11 token holding the key.')
     ap.add_argument(
         '-i', '--inject',
         default='',
@@ -253,10 +416,20 @@ def parse_args():
         '-d', '--debug',
         action='store_true',
         help='Debug mode toggle')
-    return ap.parse_args()
+    args = ap.parse_args()
+    # checked here rather than with choices= to keep c2pa.signer out of --help
+    if args.alg is not None and args.alg not in Cose_algorithm_names:
+        ap.error('argument --alg: invalid choice: {!r} (choose from {})'.format(
+            args.alg, ', '.join(Cose_algorithm_names)))
+    return args
 
 
 def main():
+    # c2pa verify ... is run by c2pa.verify_tool
+    if sys.argv[1:2] == ['verify']:
+        from c2pa.verify_tool import main as verify_main
+        sys.exit(verify_main(sys.argv[2:]))
+
     args = parse_args()
 
     assertion_filepaths = args.assertion
@@ -273,10 +446,6 @@ def main():
         print(assertion_labels)
         print(provider)
 
-    # read media content if injection is enabled
-    with open(args.inject, 'rb') as f:
-        raw_bytes = f.read()
-
     # create CAI metadata
     raw_assertions = {}
     for filepath, label in zip(assertion_filepaths, assertion_labels):
@@ -290,35 +459,48 @@ def main():
         }
 
     # private key for signature
-    if key_filepath != '':
+    if args.pkcs11_module is not None:
+        key = b''
+    elif key_filepath != '':
         with open(key_filepath, 'rb') as f:
             key = f.read()
     else:
-        key = []
+        key = b''
 
     # public certificate for the public key
     if cert_filepath != '':
         with open(cert_filepath, 'rb') as f:
             certificate = f.read()
     else:
-        key = []
-
-    # create CAI-injected media
-    starling = Starling(raw_bytes,
-                        os.path.basename(args.inject),
-                        raw_assertions,
-                        provider,
-                        recorder,
-                        key,
-                        certificate)
-    starling_cai_bytes = starling.c2pa_injection()
-
-    # save CAI-injected media
+        certificate = None
+
+    if args.pkcs11_module is not None:
+        from c2pa.hsm import Pkcs11Signer
+
+        # the key stays on the token, the certificate may be read from it
+        signer = Pkcs11Signer(args.pkcs11_module,
+                              args.pkcs11_token,
+                              args.password,
+                              key_label=key_filepath,
+                              certificate=certificate,
+                              alg=args.alg)
+    else:
+        from c2pa.signer import Signer
+
+        # PEM, DER or PKCS#12 key material, parsed once
+        password = args.password.encode('utf-8') if args.password is not None else None
+        signer = Signer.load(key, certificate, password=password, alg=args.alg)
+
+    # save CAI-injected media, streamed from the input file
     if len(args.inject) > 0:
         fname, fext = os.path.splitext(args.inject)
         fpath = fname + '-cai' + fext
-        with open(fpath, 'wb') as f:
-            f.write(starling_cai_bytes)
+        inject_file(args.inject,
+                    fpath,
+                    raw_assertions,
+                    provider,
+                    recorder,
+                    signer=signer)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,602 @@
+# Copyright 2020 Numbers Co., Ltd.
+#
+# This file is part of pyc2pa.
+#
+# pyc2pa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyc2pa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyc2pa.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import threading
+
+from collections import OrderedDict
+
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.exceptions import UnsupportedAlgorithm
+from cryptography.hazmat.primitives import hashes
+
+from c2pa.codec import get_codec
+from c2pa.data_hash import hash_data
+from c2pa.jpeg import get_jpeg_segments
+from c2pa.jumbf import get_app11_marker_segment_headers
+from c2pa.jumbf import get_parts
+from c2pa.jumbf import parse_box
+from c2pa.jumbf import reassemble_app11_payload
+from c2pa.signer import Cose_algorithms
+from c2pa.signer import verify_signature
+
+'''Verification of the Manifest Store of JPEG files.
+
+The App11 segments are viewed as a single SegmentedView without copies
+and parsed lazily with BoxView, so that Assertions, Claims and Claim
+Signatures are hashed and decoded from the original bytes without
+re-serializing any box, and the payloads of the Assertions are not read
+below the assertions level. Each Claim is decoded once for all of its
+checks.
+
+Problems are reported as validation status codes instead of exceptions,
+so that a single pass lists all of them.
+
+Files are mostly signed by a few certificates, so the parsed x5chain
+certificates and the chain validation results are kept in a
+CertificateCache keyed by fingerprint.
+
+The checks are run up to a verification level (see Verification_levels),
+so that a cheap one can triage files inline and the full one run later.
+'''
+
+# Validation status codes of the C2PA specification (section Validation).
+# manifest.missing, manifest.malformed and claim.malformed are specific
+# to pyc2pa, for files which can not be verified at all.
+Success_codes = {
+    'claimSignature.validated'      : 'The Claim Signature is valid',
+    'signingCredential.trusted'     : 'The signer certificate chains to a trust anchor',
+    'assertion.hashedURI.match'     : 'The hash of the Assertion matches the Claim',
+    'assertion.dataHash.match'      : 'The hash of the asset matches the c2pa.hash.data Assertion',
+}
+
+Failure_codes = {
+    'manifest.missing'              : 'No Manifest Store was found',
+    'manifest.malformed'            : 'The Manifest Store is not valid JUMBF',
+    'claim.missing'                 : 'The Manifest has no Claim',
+    'claim.malformed'               : 'The Claim is not valid CBOR',
+    'claim.hardBindings.missing'    : 'The Claim has no c2pa.hash.data Assertion',
+    'claimSignature.missing'        : 'The Claim Signature was not found',
+    'claimSignature.mismatch'       : 'The Claim Signature does not match the Claim',
+    'signingCredential.invalid'     : 'The signer certificate is missing or invalid',
+    'signingCredential.untrusted'   : 'The signer certificate does not chain to a trust anchor',
+    'algorithm.unsupported'         : 'The algorithm is not supported',
+    'assertion.missing'             : 'The Assertion referenced by the Claim was not found',
+    'assertion.hashedURI.mismatch'  : 'The hash of the Assertion does not match the Claim',
+    'assertion.dataHash.malformed'  : 'The c2pa.hash.data Assertion is not valid',
+    'assertion.dataHash.mismatch'   : 'The hash of the asset does not match the c2pa.hash.data Assertion',
+}
+
+Jumbf_uri_prefix = 'self#jumbf='
+
+# Verification levels, each one adding checks to the previous one:
+#   structure: the Manifest Store, the Claims and their COSE_Sign1 and
+#       x5chain are decoded, and the referenced Assertions exist.
+#       Neither the Assertions nor the asset are read.
+#   signature: the Claim Signatures are verified, and the trust of the
+#       signers if the Verifier has trust anchors.
+#   assertions: the Assertions are hashed.
+#   full: the asset is hashed for its c2pa.hash.data binding.
+Verification_levels = ['structure', 'signature', 'assertions', 'full']
+
+# Entries of a CertificateCache: certificates and validated chains
+Default_certificate_cache_size = 256
+
+# COSE algorithm names by identifier
+Cose_algorithm_names = {v: k for k, v in Cose_algorithms.items()}
+
+
+def get_uri_labels(uri):
+    '''Return the labels of a JUMBF URI, e.g.
+    self#jumbf=c2pa/<manifest>/c2pa.claim -> ['c2pa', '<manifest>', 'c2pa.claim'],
+    or None if it does not address the asset itself.
+    '''
+    if not isinstance(uri, str) or not uri.startswith(Jumbf_uri_prefix):
+        return None
+    return uri[len(Jumbf_uri_prefix):].strip('/').split('/')
+
+
+def resolve_uri(store, uri):
+    '''Return the superbox of the Manifest Store (a BoxView)
+    addressed by a JUMBF URI, or None.
+    '''
+    labels = get_uri_labels(uri)
+    if labels is None or len(labels) < 2 or labels[0] != store.label:
+        return None
+    return store.find('/'.join(labels[1:]))
+
+
+def is_issued_by(certificate, issuer):
+    '''Return True if certificate is signed by the key of issuer.
+    '''
+    try:
+        certificate.verify_directly_issued_by(issuer)
+    except (ValueError, TypeError, InvalidSignature):
+        return False
+    return True
+
+
+def get_store_range(headers):
+    '''Return (start, length) of the App11 segments of the Manifest Store.
+    '''
+    first = headers[min(headers)]
+    last = headers[max(headers)]
+    return first['offset'], last['offset'] + 2 + last['le'] - first['offset']
+
+
+class CertificateCache(object):
+    '''Bounded LRU cache of the parsed certificates of x5chains, with
+    their public keys, and of chain validation results.
+
+    maxsize: number of entries, certificates and chains together.
+
+    Certificates are keyed by the SHA-256 fingerprint of their DER bytes,
+    so that they are looked up without being parsed. It can be shared by
+    Verifiers, even with different trust anchors, and by threads.
+    '''
+    def __init__(self, maxsize=Default_certificate_cache_size):
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key, create):
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+        # created without the lock, e.g. a chain validation
+        value = create()
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def get_certificate(self, der):
+        '''Return (fingerprint, certificate, public_key) of DER bytes.
+        ValueError is raised if they are not a valid certificate, and
+        UnsupportedAlgorithm if its key type is not supported.
+        '''
+        fingerprint = hashlib.sha256(der).digest()
+
+        def create():
+            certificate = x509.load_der_x509_certificate(bytes(der))
+            return fingerprint, certificate, certificate.public_key()
+
+        return self._get(('certificate', fingerprint), create)
+
+    def get_chain_result(self, key, validate):
+        '''Return the result of validate() for the chain key, e.g. the
+        fingerprints of the chain and of the trust anchors.
+        '''
+        return self._get(('chain', key), validate)
+
+    def cache_info(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'maxsize': self.maxsize,
+                'currsize': len(self._entries),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class ValidationStatus(object):
+    '''
+    code: one of Success_codes or Failure_codes.
+    url: JUMBF URI of the box concerned, if any.
+    explanation: details, default to the description of the code.
+    '''
+    __slots__ = ('code', 'url', 'explanation')
+
+    def __init__(self, code, url=None, explanation=None):
+        self.code = code
+        self.url = url
+        if explanation is None:
+            explanation = Success_codes.get(code) or Failure_codes.get(code)
+        self.explanation = explanation
+
+    @property
+    def success(self):
+        return self.code in Success_codes
+
+    def to_json(self):
+        status = {'code': self.code}
+        if self.url is not None:
+            status['url'] = self.url
+        if self.explanation is not None:
+            status['explanation'] = self.explanation
+        return status
+
+    def __repr__(self):
+        return 'ValidationStatus({!r}, url={!r})'.format(self.code, self.url)
+
+
+class ManifestResult(object):
+    '''
+    label: Manifest label.
+    active: True for the active Manifest, the last one of the store.
+        The asset is only checked against its c2pa.hash.data Assertion,
+        since the earlier ones were bound to the asset before it was
+        edited.
+    statuses: list of ValidationStatus, in the order of the checks.
+    alg: COSE algorithm of the Claim Signature, if it could be read.
+    certificates: x509 certificates of the x5chain, the signer first.
+    '''
+    def __init__(self, label, active=False):
+        self.label = label
+        self.active = active
+        self.statuses = []
+        self.alg = None
+        self.certificates = []
+
+    def add(self, code, url=None, explanation=None):
+        self.statuses.append(ValidationStatus(code, url, explanation))
+
+    @property
+    def failures(self):
+        return [status for status in self.statuses if not status.success]
+
+    @property
+    def valid(self):
+        return len(self.failures) == 0
+
+    def to_json(self):
+        return {
+            'label': self.label,
+            'active': self.active,
+            'valid': self.valid,
+            'alg': self.alg,
+            'signer': self.certificates[0].subject.rfc4514_string() if self.certificates else None,
+            'statuses': [status.to_json() for status in self.statuses],
+        }
+
+
+class VerificationResult(object):
+    '''
+    manifests: list of ManifestResult, in the order of the Manifest Store.
+    statuses: list of ValidationStatus of the Manifest Store itself,
+        e.g. manifest.missing.
+    level: verification level, one of Verification_levels.
+        valid only covers the checks of this level.
+    '''
+    def __init__(self, level='full'):
+        self.level = level
+        self.manifests = []
+        self.statuses = []
+
+    @property
+    def active_manifest(self):
+        return self.manifests[-1] if self.manifests else None
+
+    @property
+    def valid(self):
+        '''True if the active Manifest is valid.
+        '''
+        if any(not status.success for status in self.statuses):
+            return False
+        return self.active_manifest is not None and self.active_manifest.valid
+
+    def to_json(self):
+        return {
+            'valid': self.valid,
+            'level': self.level,
+            'active_manifest': self.active_manifest.label if self.active_manifest else None,
+            'statuses': [status.to_json() for status in self.statuses],
+            'manifests': [manifest.to_json() for manifest in self.manifests],
+        }
+
+
+class Verifier(object):
+    '''Verify the Manifest Store of JPEG files.
+
+    trust_anchors: list of x509 certificates (see c2pa.signer.load_certificates)
+        the x5chain of the Claim Signatures must lead to. Default to not
+        checking the trust of signers.
+    certificate_cache: CertificateCache, default to a new one.
+        Pass the same one to share it between Verifiers.
+
+    The trust anchors are indexed once. Apart from the certificate cache,
+    the Verifier keeps no state of the files it verifies, so a single one
+    can be shared by threads verifying many files.
+    '''
+    def __init__(self, trust_anchors=None, certificate_cache=None):
+        self.trust_anchors = trust_anchors
+        if certificate_cache is None:
+            certificate_cache = CertificateCache()
+        self.certificate_cache = certificate_cache
+        self._anchor_fingerprints = set()
+        self._anchors_by_subject = {}
+        for anchor in trust_anchors or []:
+            self._anchor_fingerprints.add(anchor.fingerprint(hashes.SHA256()))
+            self._anchors_by_subject.setdefault(anchor.subject.public_bytes(), []).append(anchor)
+        # chain validation results depend on the anchors
+        self._anchors_key = tuple(sorted(self._anchor_fingerprints))
+
+    def verify(self, data_bytes, segments=None, level='full'):
+        '''Return the VerificationResult of a JPEG file.
+
+        data_bytes: bytes-like object, e.g. an mmap of the file.
+        segments: JPEG segment index from get_jpeg_segments.
+        level: one of Verification_levels.
+        '''
+        if level not in Verification_levels:
+            raise ValueError('Unknown verification level {}, use one of {}'.format(
+                level, Verification_levels))
+        result = VerificationResult(level)
+        if segments is None:
+            segments = get_jpeg_segments(data_bytes)
+        headers = get_app11_marker_segment_headers(data_bytes, segments=segments)
+        if len(headers) == 0:
+            result.statuses.append(ValidationStatus('manifest.missing'))
+            return result
+
+        try:
+            store = parse_box(reassemble_app11_payload(data_bytes, headers))
+            manifests = [box for box in store.content_boxes if box.is_superbox]
+        except ValueError as e:
+            result.statuses.append(ValidationStatus('manifest.malformed', explanation=str(e)))
+            return result
+        if len(manifests) == 0:
+            result.statuses.append(ValidationStatus('manifest.missing'))
+            return result
+
+        store_range = get_store_range(headers)
+        for i, manifest in enumerate(manifests):
+            active = i == len(manifests) - 1
+            result.manifests.append(self.verify_manifest(
+                store,
+                manifest,
+                data_bytes=data_bytes if active else None,
+                store_range=store_range,
+                level=level))
+        return result
+
+    def verify_manifest(self, store, manifest, data_bytes=None, store_range=None, level='full'):
+        '''Return the ManifestResult of a Manifest.
+
+        store, manifest: BoxViews of the Manifest Store and the Manifest.
+        data_bytes: the asset if the Manifest is the active one. It must
+            have a c2pa.hash.data Assertion, checked at the full level.
+        store_range: (start, length) of the App11 segments in data_bytes,
+            which the exclusions must cover.
+        level: one of Verification_levels.
+        '''
+        rank = Verification_levels.index(level)
+        try:
+            label = manifest.label
+        except ValueError as e:
+            result = ManifestResult(None, active=data_bytes is not None)
+            result.add('manifest.malformed', explanation=str(e))
+            return result
+        result = ManifestResult(label, active=data_bytes is not None)
+        claim_url = '{}{}/{}/c2pa.claim'.format(Jumbf_uri_prefix, store.label, label)
+
+        try:
+            claim_box = manifest.get('c2pa.claim')
+            if claim_box is None or len(claim_box.content_boxes) == 0:
+                result.add('claim.missing', claim_url)
+                return result
+            # the Claim may span App11 segments, it is small enough to copy
+            claim_bytes = bytes(claim_box.content_boxes[0].payload)
+            try:
+                claim = get_codec().loads(claim_bytes)
+            except Exception as e:
+                # the CBOR backends raise different exceptions
+                result.add('claim.malformed', claim_url, str(e))
+                return result
+            if not isinstance(claim, dict) or not isinstance(claim.get('assertions', []), list):
+                result.add('claim.malformed', claim_url, 'The Claim is not a map')
+                return result
+
+            self.verify_claim_signature(store, manifest, claim, claim_bytes, result,
+                                        check_signature=rank >= Verification_levels.index('signature'))
+            assertion_boxes = self.verify_assertions(store, manifest, claim, result,
+                                                     check_hashes=rank >= Verification_levels.index('assertions'))
+            if data_bytes is not None:
+                bindings = [(url, box) for url, box in assertion_boxes.items()
+                            if box.label.startswith('c2pa.hash.data')]
+                if len(bindings) == 0:
+                    result.add('claim.hardBindings.missing')
+                elif level == 'full':
+                    self.verify_data_hash(claim, bindings, data_bytes, store_range, result)
+        except Exception as e:
+            # the boxes are parsed and the Claim decoded as they are accessed,
+            # and a single Manifest must not stop the verification of the others
+            result.add('manifest.malformed', explanation='{}: {}'.format(type(e).__name__, e))
+        return result
+
+    def verify_claim_signature(self, store, manifest, claim, claim_bytes, result, check_signature=True):
+        '''Check the COSE_Sign1 of the Claim with the signer certificate
+        of its x5chain, or only decode them unless check_signature.
+        '''
+        codec = get_codec()
+        url = claim.get('signature')
+        signature_box = resolve_uri(store, url)
+        if signature_box is None:
+            # fall back to the box of the Manifest
+            signature_box = manifest.get('c2pa.signature')
+        if signature_box is None or len(signature_box.content_boxes) == 0:
+            result.add('claimSignature.missing', url)
+            return
+
+        try:
+            tag, message = codec.untag(codec.loads(bytes(signature_box.content_boxes[0].payload)))
+            phdr, uhdr, _, signature = message
+            alg_id = codec.loads(phdr)[1]
+            # e.g. a list or a map can not be looked up
+            if not isinstance(alg_id, int):
+                raise TypeError('alg {!r} is not an integer'.format(alg_id))
+        except Exception as e:
+            result.add('claimSignature.mismatch', url, 'Invalid COSE_Sign1: {}'.format(e))
+            return
+        if tag != 18:
+            result.add('claimSignature.mismatch', url, 'Invalid COSE_Sign1 tag {}'.format(tag))
+            return
+        if alg_id not in Cose_algorithm_names:
+            result.add('algorithm.unsupported', url, 'Unsupported COSE algorithm {}'.format(alg_id))
+            return
+        result.alg = Cose_algorithm_names[alg_id]
+
+        # 33 is the x5chain label of RFC 9360
+        x5chain = uhdr.get('x5chain', uhdr.get(33)) if isinstance(uhdr, dict) else None
+        chain = [x5chain] if isinstance(x5chain, bytes) else x5chain
+        try:
+            entries = [self.certificate_cache.get_certificate(der) for der in chain]
+        except UnsupportedAlgorithm as e:
+            result.add('algorithm.unsupported', url, 'Unsupported x5chain key: {}'.format(e))
+            return
+        except Exception as e:
+            result.add('signingCredential.invalid', url, 'Invalid x5chain: {}'.format(e))
+            return
+        result.certificates = [certificate for _, certificate, _ in entries]
+        if len(result.certificates) == 0:
+            result.add('signingCredential.invalid', url, 'Empty x5chain')
+            return
+        if not check_signature:
+            return
+
+        # the Sig_structure is rebuilt from the Claim bytes as stored
+        sig_structure = codec.dumps(['Signature1', phdr, b'', claim_bytes])
+        try:
+            valid = verify_signature(entries[0][2],
+                                     result.alg,
+                                     sig_structure,
+                                     signature)
+        except ValueError as e:
+            result.add('signingCredential.invalid', url, str(e))
+            return
+        except Exception as e:
+            # e.g. a signature which is not a bstr
+            result.add('claimSignature.mismatch', url, 'Invalid signature: {}'.format(e))
+            return
+        result.add('claimSignature.validated' if valid else 'claimSignature.mismatch', url)
+        if self.trust_anchors is not None:
+            self.verify_trust(entries, url, result)
+
+    def verify_trust(self, entries, url, result):
+        '''Check the x5chain against the trust anchors, once per chain
+        and set of anchors thanks to the certificate cache.
+        entries: (fingerprint, certificate, public_key) of the x5chain.
+        '''
+        key = (self._anchors_key, tuple(fingerprint for fingerprint, _, _ in entries))
+        certificates = [certificate for _, certificate, _ in entries]
+        code, explanation = self.certificate_cache.get_chain_result(
+            key, lambda: self.validate_chain(certificates))
+        result.add(code, url, explanation)
+
+    def validate_chain(self, certificates):
+        '''Return (code, explanation) of an x5chain, the signer first.
+        It is trusted if it contains a trust anchor, or if its last
+        certificate is issued by one.
+        '''
+        # each certificate is issued by the next one
+        for certificate, issuer in zip(certificates, certificates[1:]):
+            if not is_issued_by(certificate, issuer):
+                return 'signingCredential.untrusted', '{} is not issued by {}'.format(
+                    certificate.subject.rfc4514_string(), issuer.subject.rfc4514_string())
+        for certificate in certificates:
+            if certificate.fingerprint(hashes.SHA256()) in self._anchor_fingerprints:
+                return 'signingCredential.trusted', None
+        last = certificates[-1]
+        for anchor in self._anchors_by_subject.get(last.issuer.public_bytes(), []):
+            if is_issued_by(last, anchor):
+                return 'signingCredential.trusted', None
+        return 'signingCredential.untrusted', None
+
+    def verify_assertions(self, store, manifest, claim, result, check_hashes=True):
+        '''Check the hashes of the Assertions referenced by the Claim,
+        or only that they exist unless check_hashes.
+        return: dict of the Assertion boxes found, keyed by URI.
+        '''
+        assertion_boxes = {}
+        # index the Assertion Store of the Manifest, which most URIs address
+        assertion_store = manifest.get('c2pa.assertions')
+        local_boxes = {}
+        if assertion_store is not None:
+            local_boxes = {box.label: box for box in assertion_store.content_boxes if box.is_superbox}
+        local_labels = [store.label, manifest.label, 'c2pa.assertions']
+
+        for reference in claim.get('assertions', []):
+            url = reference.get('url') if isinstance(reference, dict) else None
+            labels = get_uri_labels(url)
+            if labels is not None and len(labels) == 4 and labels[:3] == local_labels:
+                box = local_boxes.get(labels[3])
+            else:
+                box = resolve_uri(store, url)
+            if box is None or len(box.content_boxes) == 0:
+                result.add('assertion.missing', url)
+                continue
+            assertion_boxes[url] = box
+            if not check_hashes:
+                continue
+
+            # the hash covers the first content box without header,
+            # see c2pa.core.hash_assertion
+            try:
+                m = hashlib.new(reference.get('alg', claim.get('alg', 'sha256')))
+            except (TypeError, ValueError):
+                result.add('algorithm.unsupported', url)
+                continue
+            for part in get_parts(box.content_boxes[0].payload):
+                m.update(part)
+            if m.digest() == reference.get('hash'):
+                result.add('assertion.hashedURI.match', url)
+            else:
+                result.add('assertion.hashedURI.mismatch', url)
+        return assertion_boxes
+
+    def verify_data_hash(self, claim, bindings, data_bytes, store_range, result):
+        '''Check the asset against the c2pa.hash.data Assertions of the Claim.
+        The exclusions must cover the Manifest Store and nothing else.
+        bindings: list of (URI, BoxView) of the Assertions.
+        '''
+        codec = get_codec()
+        for url, box in bindings:
+            try:
+                data_hash = codec.loads(bytes(box.content_boxes[0].payload))
+                exclusions = [(e['start'], e['length']) for e in data_hash.get('exclusions', [])]
+                alg = data_hash.get('alg', claim.get('alg', 'sha256'))
+                expected = data_hash['hash']
+            except Exception as e:
+                result.add('assertion.dataHash.malformed', url, str(e))
+                continue
+            if store_range is not None and exclusions != [store_range]:
+                result.add('assertion.dataHash.mismatch', url,
+                           'The exclusions {} do not match the Manifest Store at {}'.format(
+                               exclusions, store_range))
+                continue
+            try:
+                digest = hash_data(data_bytes, exclusions, name=alg)
+            except (TypeError, ValueError):
+                result.add('algorithm.unsupported', url)
+                continue
+            result.add('assertion.dataHash.match' if digest == expected else 'assertion.dataHash.mismatch', url)
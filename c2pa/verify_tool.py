@@ -0,0 +1,330 @@
+# Copyright 2020 Numbers Co., Ltd.
+#
+# This file is part of pyc2pa.
+#
+# pyc2pa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyc2pa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyc2pa.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+
+from c2pa.jpeg import map_file
+from c2pa.signer import load_certificates
+from c2pa.verify import CertificateCache
+from c2pa.verify import Verification_levels
+from c2pa.verify import Verifier
+
+'''CLI verifying the Manifest Stores of a corpus of JPEG files:
+
+    $ c2pa verify [-j JOBS] [--level LEVEL] [--trust PEM] [--files-from LIST] [PATH ...]
+
+Files are verified in batches on a pool of processes. The trust anchors
+are parsed once and sent to the processes as DER certificates, and each
+process keeps a certificate cache for all of its files. Results are written as JSON lines as soon
+as a batch is done, and a summary with throughput, latency percentiles
+and certificate cache hits is printed to stderr at the end.
+
+Files are memory-mapped, so that the cheaper verification levels only
+read the pages of the JPEG headers and of the Manifest Store.
+'''
+
+# File extensions verified when walking directories
+Jpeg_extensions = ('.jpg', '.jpeg')
+
+# Files per task sent to a worker, amortizing the inter-process calls
+Default_batch_size = 16
+
+# Latency percentiles of the summary
+Percentiles = [50, 90, 99]
+
+# Entries of the certificate cache of each worker
+Default_cache_size = 256
+
+
+def iter_paths(paths, files_from=None):
+    '''Yield the files to verify: the given files, the JPEG files found
+    under the given directories, then the lines of files_from
+    (a file object), lazily so that millions of paths are never listed
+    in memory.
+    '''
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(Jpeg_extensions):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+    if files_from is not None:
+        for line in files_from:
+            line = line.rstrip('\r\n')
+            if line:
+                yield line
+
+
+def iter_batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def get_percentile(sorted_values, percentile):
+    '''Return the nearest-rank percentile of sorted values.
+    '''
+    if len(sorted_values) == 0:
+        return None
+    rank = max(1, -(-percentile * len(sorted_values) // 100))
+    return sorted_values[rank - 1]
+
+
+# Verifier of a worker process, created by _init_worker
+_worker_verifier = None
+
+
+def _init_worker(trust_ders, cache_size):
+    '''trust_ders: list of DER bytes of the trust anchors, parsed and
+        validated once by verify_files, or None not to check the trust.
+    cache_size: entries of the certificate cache of the worker.
+    '''
+    from cryptography import x509
+
+    global _worker_verifier
+    trust_anchors = None
+    if trust_ders is not None:
+        trust_anchors = [x509.load_der_x509_certificate(der) for der in trust_ders]
+    _worker_verifier = Verifier(trust_anchors=trust_anchors,
+                                certificate_cache=CertificateCache(cache_size))
+
+
+def verify_file(verifier, path, level='full'):
+    '''Return the JSON object of the verification of a file,
+    with its size and latency. Errors are reported, not raised.
+    '''
+    start = time.perf_counter()
+    record = {'path': path}
+    try:
+        with open(path, 'rb') as f, map_file(f) as data_bytes:
+            record['size'] = len(data_bytes)
+            record.update(verifier.verify(data_bytes, level=level).to_json())
+    except Exception as e:
+        # keep auditing the rest of the corpus
+        record['valid'] = False
+        record['error'] = '{}: {}'.format(type(e).__name__, e)
+    record['latency_ms'] = (time.perf_counter() - start) * 1000
+    return record
+
+
+def _verify_batch(paths, level):
+    '''Return (pid, cache_info, records) of a batch of files,
+    cache_info being the counters of the worker so far.
+    '''
+    records = [verify_file(_worker_verifier, path, level) for path in paths]
+    return os.getpid(), _worker_verifier.certificate_cache.cache_info(), records
+
+
+class Summary(object):
+    '''Counters and latencies of a verification run.
+    '''
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.files = 0
+        self.valid = 0
+        self.errors = 0
+        self.bytes = 0
+        self.latencies = []
+        # latest certificate cache counters by worker
+        self.cache_infos = {}
+
+    def add(self, record):
+        self.files += 1
+        self.valid += 1 if record['valid'] else 0
+        self.errors += 1 if 'error' in record else 0
+        self.bytes += record.get('size', 0)
+        self.latencies.append(record['latency_ms'])
+
+    def add_cache_info(self, pid, cache_info):
+        # batches complete out of order, and the counters only grow
+        latest = self.cache_infos.get(pid)
+        if latest is None or latest['hits'] + latest['misses'] < cache_info['hits'] + cache_info['misses']:
+            self.cache_infos[pid] = cache_info
+
+    def to_json(self):
+        elapsed = time.perf_counter() - self.start
+        latencies = sorted(self.latencies)
+        summary = {
+            'files': self.files,
+            'valid': self.valid,
+            'invalid': self.files - self.valid - self.errors,
+            'errors': self.errors,
+            'seconds': elapsed,
+            'files_per_second': self.files / elapsed if elapsed > 0 else None,
+            'mb_per_second': self.bytes / elapsed / 1e6 if elapsed > 0 else None,
+        }
+        for percentile in Percentiles:
+            summary['latency_p{}_ms'.format(percentile)] = get_percentile(latencies, percentile)
+        summary['latency_max_ms'] = latencies[-1] if latencies else None
+        summary['certificate_cache_hits'] = sum(info['hits'] for info in self.cache_infos.values())
+        summary['certificate_cache_misses'] = sum(info['misses'] for info in self.cache_infos.values())
+        return summary
+
+
+def verify_files(paths,
+                 output,
+                 trust=None,
+                 jobs=None,
+                 batch_size=Default_batch_size,
+                 cache_size=Default_cache_size,
+                 level='full'):
+    '''Verify files on a pool of jobs processes and write a JSON line
+    per file to output, in completion order.
+    trust: list of PEM or DER bytes of trust anchors. They are parsed
+        here once, and the workers only load their DER certificates.
+    level: one of Verification_levels.
+    return: Summary of the run.
+
+    At most 4 batches per process are in flight, so the paths are
+    consumed as the work progresses.
+    '''
+    from cryptography.hazmat.primitives.serialization import Encoding
+
+    trust_ders = None
+    if trust:
+        trust_ders = [certificate.public_bytes(Encoding.DER)
+                      for data in trust for certificate in load_certificates(data)]
+
+    summary = Summary()
+    jobs = jobs or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=jobs,
+                             initializer=_init_worker,
+                             initargs=(trust_ders, cache_size)) as executor:
+        pending = set()
+        batches = iter_batches(paths, batch_size)
+        while True:
+            for batch in batches:
+                pending.add(executor.submit(_verify_batch, batch, level))
+                if len(pending) >= 4 * jobs:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pid, cache_info, records = future.result()
+                summary.add_cache_info(pid, cache_info)
+                for record in records:
+                    summary.add(record)
+                    output.write(json.dumps(record) + '\n')
+            output.flush()
+    return summary
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(
+        prog='c2pa verify',
+        description='Verify the C2PA Manifest Stores of JPEG files, '
+                    'and write a JSON line per file.')
+    ap.add_argument(
+        'paths',
+        nargs='*',
+        help='Files, or directories searched for {} files.'.format('/'.join(Jpeg_extensions)))
+    ap.add_argument(
+        '--files-from',
+        default=None,
+        help='File listing a path per line, - for stdin.')
+    ap.add_argument(
+        '--level',
+        default='full',
+        choices=Verification_levels,
+        help='Verification level: structure decodes the Claims and their signature headers, '
+             'signature verifies the Claim Signatures, assertions hashes the Assertions '
+             'and full the asset. Default: full')
+    ap.add_argument(
+        '--trust',
+        action='append',
+        default=[],
+        help='PEM or DER file of trust anchors. Use multiple times for multiple files. '
+             'Default: the trust of signers is not checked.')
+    ap.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=None,
+        help='Number of processes. Default: number of CPUs')
+    ap.add_argument(
+        '--batch-size',
+        type=int,
+        default=Default_batch_size,
+        help='Files per task. Default: {}'.format(Default_batch_size))
+    ap.add_argument(
+        '--cache-size',
+        type=int,
+        default=Default_cache_size,
+        help='Certificates and chains cached by each process. Default: {}'.format(Default_cache_size))
+    ap.add_argument(
+        '-o', '--output',
+        default='-',
+        help='JSONL output filepath. Default: stdout')
+    args = ap.parse_args(argv)
+    if not args.paths and args.files_from is None:
+        ap.error('no files to verify, give paths or --files-from')
+    return args
+
+
+def main(argv=None):
+    '''Return 0 if all files are valid, 1 otherwise.
+    '''
+    args = parse_args(argv)
+
+    trust = []
+    for filepath in args.trust:
+        with open(filepath, 'rb') as f:
+            trust.append(f.read())
+
+    files_from = None
+    if args.files_from == '-':
+        files_from = sys.stdin
+    elif args.files_from is not None:
+        files_from = open(args.files_from, 'r')
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        summary = verify_files(iter_paths(args.paths, files_from),
+                               output,
+                               trust=trust,
+                               jobs=args.jobs,
+                               batch_size=args.batch_size,
+                               cache_size=args.cache_size,
+                               level=args.level)
+    finally:
+        if files_from not in (None, sys.stdin):
+            files_from.close()
+        if output is not sys.stdout:
+            output.close()
+
+    summary = summary.to_json()
+    print(json.dumps(summary), file=sys.stderr)
+    return 0 if summary['files'] == summary['valid'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,252 @@
+# Copyright 2020 Numbers Co., Ltd.
+#
+# This file is part of pyc2pa.
+#
+# pyc2pa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# pyc2pa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with pyc2pa.  If not, see <http://www.gnu.org/licenses/>.
+
+import html
+import re
+
+from c2pa.jpeg import Jpeg_markers
+from c2pa.jpeg import Xmp_extension_namespace
+from c2pa.jpeg import Xmp_namespace
+from c2pa.jpeg import create_jpeg_segment
+from c2pa.jpeg import get_jpeg_segments
+from c2pa.jpeg import get_xmp_segments
+from c2pa.jpeg import iter_spliced
+
+'''XMP packet reading and editing in JPEG files,
+Adobe XMP Specification Part 3.
+
+Simple properties are read from the XMP APP1 segments only, including
+Extended XMP, without parsing the rest of the metadata. Only the APP1
+segment of the XMP packet is rewritten, or inserted if there is none,
+as an edit which can be spliced with other segment edits.
+'''
+
+# Namespaces by the prefixes used in tag names, e.g. Xmp.dcterms.provenance
+Xmp_namespaces = {
+    'rdf'       : 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
+    'dc'        : 'http://purl.org/dc/elements/1.1/',
+    'dcterms'   : 'http://purl.org/dc/terms/',
+    'xmp'       : 'http://ns.adobe.com/xap/1.0/',
+    'xmpMM'     : 'http://ns.adobe.com/xap/1.0/mm/',
+    'xmpNote'   : 'http://ns.adobe.com/xmp/note/',
+    'photoshop' : 'http://ns.adobe.com/photoshop/1.0/',
+}
+
+# Extended XMP chunk: GUID (32B) + full length (4B) + offset (4B) + data
+Extended_xmp_header_size = 40
+
+Xmp_packet_template = (
+    '<?xpacket begin="\ufeff" id="W5M0MpCehiHzreSzNTczkc9d"?>\n'
+    '<x:xmpmeta xmlns:x="adobe:ns:meta/">\n'
+    ' <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">\n'
+    ' </rdf:RDF>\n'
+    '</x:xmpmeta>\n'
+    '<?xpacket end="w"?>'
+)
+
+# Whitespace added to new packets, so that later edits fit in place
+Xmp_padding_size = 2048
+
+_xpacket_end = re.compile(rb'<\?xpacket\s+end=')
+
+
+def get_provenance(manifest_label):
+    return 'self#jumbf=c2pa/{}/c2pa.claim'.format(manifest_label)
+
+
+def get_namespace_prefix(packet, namespace):
+    '''Return the prefix bound to namespace in packet (str), or None.
+    '''
+    match = re.search(r'xmlns:([\w.-]+)\s*=\s*(["\']){}\2'.format(re.escape(namespace)), packet)
+    return match.group(1) if match else None
+
+
+def get_xmp_property(packet, namespace, name):
+    '''Return the value (str) of the simple property namespace:name
+    in packet (str), or None if it is not set.
+    '''
+    prefix = get_namespace_prefix(packet, namespace)
+    if prefix is None:
+        return None
+    qname = re.escape('{}:{}'.format(prefix, name))
+    # attribute form: prefix:name="value"
+    match = re.search(r'\s{}\s*=\s*(["\'])(.*?)\1'.format(qname), packet, re.DOTALL)
+    if match:
+        return html.unescape(match.group(2))
+    # element form: <prefix:name>value</prefix:name>
+    match = re.search(r'<{0}(?:\s[^>]*)?>([^<]*)</{0}>'.format(qname), packet)
+    if match:
+        return html.unescape(match.group(1))
+    return None
+
+
+def get_extended_xmp(data_bytes, segments, guid):
+    '''Reassemble the Extended XMP packet (bytes) of GUID (str)
+    from its APP1 chunks, or return None if it is missing or incomplete.
+
+    The full length declared by the chunks is only trusted once they
+    are known to cover it, so that it never sizes a larger allocation
+    than the data of the file.
+    '''
+    guid = guid.encode('ascii')
+    full_length = None
+    chunks = []
+    for segment in get_xmp_segments(data_bytes, segments, Xmp_extension_namespace):
+        chunk = segment.get_payload(data_bytes)[len(Xmp_extension_namespace):]
+        if bytes(chunk[:32]) != guid:
+            continue
+        length = int.from_bytes(chunk[32:36], byteorder='big')
+        if full_length is None:
+            full_length = length
+        elif length != full_length:
+            return None
+        offset = int.from_bytes(chunk[36:40], byteorder='big')
+        chunks.append((offset, chunk[Extended_xmp_header_size:]))
+    if full_length is None:
+        return None
+
+    # the chunks must cover [0, full_length) without going past it
+    covered = 0
+    for offset, data in sorted(chunks, key=lambda item: item[0]):
+        if offset > covered or offset + len(data) > full_length:
+            return None
+        covered = max(covered, offset + len(data))
+    if covered < full_length:
+        return None
+
+    packet = bytearray(full_length)
+    for offset, data in chunks:
+        packet[offset:offset + len(data)] = data
+    return bytes(packet)
+
+
+def read_xmp_property(data_bytes, namespace, name, segments=None):
+    '''Return the value (str) of a simple XMP property of a JPEG file,
+    or None. Only the XMP APP1 segments are read.
+    '''
+    if segments is None:
+        segments = get_jpeg_segments(data_bytes)
+    xmp_segments = get_xmp_segments(data_bytes, segments)
+    if len(xmp_segments) == 0:
+        return None
+
+    payload = xmp_segments[0].get_payload(data_bytes)[len(Xmp_namespace):]
+    packet = bytes(payload).decode('utf-8', errors='replace')
+    value = get_xmp_property(packet, namespace, name)
+    if value is None:
+        # properties may be moved to the Extended XMP packet
+        guid = get_xmp_property(packet, Xmp_namespaces['xmpNote'], 'HasExtendedXMP')
+        if guid is not None:
+            extended = get_extended_xmp(data_bytes, segments, guid)
+            if extended is not None:
+                value = get_xmp_property(extended.decode('utf-8', errors='replace'), namespace, name)
+    return value
+
+
+def set_xmp_property(packet, namespace, name, value):
+    '''Return packet (str) with the simple property namespace:name set to
+    value, either replaced where it is or added in a new rdf:Description.
+    '''
+    # html rather than xml.sax.saxutils, which imports urllib
+    value = html.escape(value)
+    prefix = get_namespace_prefix(packet, namespace)
+    if prefix is not None:
+        qname = re.escape('{}:{}'.format(prefix, name))
+        # attribute form: prefix:name="value"
+        attribute = re.compile(r'(\s{}\s*=\s*)(["\'])(.*?)\2'.format(qname), re.DOTALL)
+        if attribute.search(packet):
+            return attribute.sub(lambda m: '{}"{}"'.format(m.group(1), value), packet, count=1)
+        # element form: <prefix:name>value</prefix:name>
+        element = re.compile(r'(<{0}>)([^<]*)(</{0}>)'.format(qname))
+        if element.search(packet):
+            return element.sub(lambda m: m.group(1) + value + m.group(3), packet, count=1)
+
+    rdf_prefix = get_namespace_prefix(packet, Xmp_namespaces['rdf'])
+    end = packet.rfind('</{}:RDF>'.format(rdf_prefix))
+    if rdf_prefix is None or end < 0:
+        raise ValueError('Invalid XMP packet: rdf:RDF not found')
+    prefix = {v: k for k, v in Xmp_namespaces.items()}.get(namespace, 'ns1')
+    description = '  <{0}:Description {0}:about="" xmlns:{1}="{2}" {1}:{3}="{4}"/>\n '.format(
+        rdf_prefix, prefix, namespace, name, value)
+    return packet[:end] + description + packet[end:]
+
+
+def fit_padding(packet, size):
+    '''Return packet (bytes) resized to size by adjusting the whitespace
+    padding before the xpacket trailer, or unchanged if it does not fit.
+    '''
+    match = _xpacket_end.search(packet)
+    if match is None:
+        return packet
+    trailer = match.start()
+    content = packet[:trailer].rstrip(b' \t\r\n')
+    padding_size = size - len(content) - (len(packet) - trailer)
+    if padding_size < 1:
+        return packet
+    # the padding ends with a newline before the trailer
+    return content + b' ' * (padding_size - 1) + b'\n' + packet[trailer:]
+
+
+def create_xmp_packet(namespace, name, value):
+    packet = set_xmp_property(Xmp_packet_template, namespace, name, value).encode('utf-8')
+    return fit_padding(packet, len(packet) + Xmp_padding_size)
+
+
+def plan_xmp_edit(data_bytes, namespace, name, value, segments=None):
+    '''Plan setting an XMP property of a JPEG file.
+    return: (start, end, segment) edit of iter_spliced replacing the XMP
+        APP1 segment by segment, or inserting it after the leading
+        APP0 (JFIF), APP1 (Exif) and APP11 (JUMBF) segments if there is none.
+        If the packet padding allows, the segment keeps its size.
+    '''
+    if segments is None:
+        segments = get_jpeg_segments(data_bytes)
+    if len(segments) == 0:
+        raise ValueError('Not a JPEG file')
+
+    xmp_segments = get_xmp_segments(data_bytes, segments)
+    if len(xmp_segments) > 0:
+        segment = xmp_segments[0]
+        old_packet = bytes(segment.get_payload(data_bytes)[len(Xmp_namespace):])
+        packet = set_xmp_property(old_packet.decode('utf-8'), namespace, name, value).encode('utf-8')
+        packet = fit_padding(packet, len(old_packet))
+        return segment.offset, segment.end, create_jpeg_segment(Jpeg_markers['APP1'], Xmp_namespace + packet)
+
+    offset = segments[0].end
+    for segment in segments[1:]:
+        if segment.marker not in (Jpeg_markers['APP0'], Jpeg_markers['APP1'], Jpeg_markers['APP11']):
+            break
+        offset = segment.end
+    packet = create_xmp_packet(namespace, name, value)
+    return offset, offset, create_jpeg_segment(Jpeg_markers['APP1'], Xmp_namespace + packet)
+
+
+def plan_provenance_edit(data_bytes, manifest_label, segments=None):
+    '''Plan setting Xmp.dcterms.provenance to the Claim of the Manifest.
+    '''
+    return plan_xmp_edit(data_bytes,
+                         Xmp_namespaces['dcterms'],
+                         'provenance',
+                         get_provenance(manifest_label),
+                         segments=segments)
+
+
+def set_provenance(data_bytes, manifest_label, segments=None):
+    '''Return data_bytes with Xmp.dcterms.provenance set.
+    '''
+    edit = plan_provenance_edit(data_bytes, manifest_label, segments=segments)
+    return b''.join(iter_spliced(data_bytes, [edit]))
@@ -31,15 +31,20 @@ setup(
         'py-multibase>=1.0.3',
         'pycryptodome>=3.9.9',
         'pymultihash>=0.8.2',
-        'py3exiv2>=0.9.3',
         'endesive>=2.0.2',
         'cbor>=1.0.0',
+        'cryptography>=40.0.0',
     ],
+    extras_require={
+        'fast': ['cbor2>=5.4.0'],
+        'hsm': ['python-pkcs11>=0.7.0'],
+    },
     python_requires='>=3',
     entry_points={
         'console_scripts': [
             'cai_tool=c2pa.cai_tool:main',
             'c2pa=c2pa.starling:main',
+            'c2pa-verify=c2pa.verify_tool:main',
         ]
     },
     test_suite='tests'
@@ -0,0 +1,14 @@
+import os
+
+from c2pa.jpeg import Jpeg_markers
+from c2pa.jpeg import create_jpeg_segment
+
+
+def create_jpeg():
+    '''Return a minimal JPEG file with random scan data.
+    '''
+    return (b'\xff\xd8'
+            + create_jpeg_segment(Jpeg_markers['APP0'], b'JFIF\x00\x01\x01')
+            + create_jpeg_segment(Jpeg_markers['SOS'], b'\x01\x01\x00\x00\x3f\x00')
+            + os.urandom(4096).replace(b'\xff', b'\x00')
+            + b'\xff\xd9')
@@ -0,0 +1,50 @@
+import os
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+
+from c2pa.codec import get_codec
+from c2pa.core import C2paAssertionStore
+from c2pa.core import C2paClaim
+from c2pa.core import compute_hash
+from c2pa.jumbf import create_cbor_superbox
+from c2pa.jumbf import create_codestream_superbox
+from c2pa.jumbf import create_json_superbox
+
+
+class TestC2paClaim(unittest.TestCase):
+    def setUp(self):
+        self.assertions = [create_cbor_superbox(os.urandom(size), 'c2pa.depthmap.{}'.format(i))
+                           for i, size in enumerate([1024 * 1024, 16, 300 * 1024, 0])]
+        self.assertions.append(create_codestream_superbox(os.urandom(1024), 'c2pa.thumbnail.claim.jpeg'))
+        self.assertions.append(create_json_superbox(b'{"foo": "bar"}', 'stds.schema-org.CreativeWork'))
+        self.assertion_store = C2paAssertionStore(self.assertions)
+
+    def create_claim(self, executor=None):
+        return C2paClaim(self.assertion_store, 'manifest', 'media.jpg').create_claim(
+            self.assertion_store, 'manifest', 'media.jpg', executor=executor)
+
+    def test_assertion_hashes(self):
+        claim = self.create_claim()
+        for assertion, hashed_uri in zip(self.assertions, claim['assertions']):
+            self.assertTrue(hashed_uri['url'].endswith(assertion.description_box.db_label))
+            self.assertEqual(hashed_uri['hash'],
+                             compute_hash(assertion.content_boxes[0].convert_bytes()[8:]))
+
+    def test_executor(self):
+        expected = self.create_claim()
+        for assertion in self.assertions:
+            # drop the cached digests
+            assertion.content_boxes[0].payload = assertion.content_boxes[0].payload
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            self.assertEqual(self.create_claim(executor), expected)
+
+    def test_canonical_claim(self):
+        claim_box = C2paClaim(self.assertion_store, 'manifest', 'media.jpg')
+        payload = claim_box.content_boxes[0].payload
+        codec = get_codec()
+        self.assertEqual(payload, codec.dumps(codec.loads(payload), canonical=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
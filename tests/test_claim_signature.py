@@ -0,0 +1,77 @@
+import os
+import unittest
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+
+from c2pa.codec import get_codec
+from c2pa.core import C2paClaimSignature
+from c2pa.signer import PlaceholderSigner
+from c2pa.signer import Signer
+from c2pa.signer import SigningPool
+
+
+Keys_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'Keys')
+
+
+class TestC2paClaimSignature(unittest.TestCase):
+    def setUp(self):
+        with open(os.path.join(Keys_dir, 'demo2_user1.p12'), 'rb') as f:
+            self.p12 = f.read()
+        self.signer = Signer.from_pkcs12(self.p12, b'1234')
+        self.claim = b'claim'
+
+    def decode(self, payload):
+        codec = get_codec()
+        tag, message = codec.untag(codec.loads(payload))
+        self.assertEqual(tag, 18)
+        return message
+
+    def test_exact_size(self):
+        signature = C2paClaimSignature(self.claim, signer=self.signer)
+        payload = signature.content_boxes[0].payload
+        message = self.decode(payload)
+
+        # no padding: the payload is the COSE_Sign1 only
+        self.assertEqual(len(get_codec().dumps(get_codec().tag(18, message))), len(payload))
+        self.assertEqual(len(message[3]), self.signer.signature_size)
+        self.assertEqual(payload[signature.signature_offset:], message[3])
+
+    def test_placeholder_signer(self):
+        placeholder = C2paClaimSignature(self.claim, signer=PlaceholderSigner(self.signer))
+        signature = C2paClaimSignature(self.claim, signer=self.signer)
+        self.assertEqual(placeholder.get_size(), signature.get_size())
+        self.assertEqual(self.decode(placeholder.content_boxes[0].payload)[3],
+                         bytes(self.signer.signature_size))
+
+    def test_reserve_size(self):
+        signature = C2paClaimSignature(self.claim, signer=self.signer, reserve_size=8192)
+        payload = signature.content_boxes[0].payload
+        self.assertEqual(len(payload), 8192)
+        self.assertEqual(len(self.decode(payload)[3]), self.signer.signature_size)
+
+        with self.assertRaises(ValueError):
+            C2paClaimSignature(self.claim, signer=self.signer, reserve_size=256)
+
+    def test_patch_signature(self):
+        with SigningPool(self.p12, password=b'1234', max_workers=1) as pool:
+            signature = C2paClaimSignature(self.claim, signer=pool)
+            # the size is final before the signature is done
+            size = signature.get_size()
+            signature.future.result()
+        self.assertEqual(signature.get_size(), size)
+
+        message = self.decode(signature.content_boxes[0].payload)
+        sig_structure = signature.create_sig_structure(self.claim, self.signer)
+        self.signer.certificates[0].public_key().verify(
+            message[3],
+            sig_structure,
+            padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=32),
+            hashes.SHA256())
+
+        with self.assertRaises(ValueError):
+            signature.patch_signature(b'\x00' * 16)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+
+from c2pa.codec import CborCodec
+from c2pa.codec import Cbor_backends
+from c2pa.codec import get_codec
+from c2pa.jumbf import json_to_cbor_bytes
+
+
+class TestCborCodec(unittest.TestCase):
+    def setUp(self):
+        self.codecs = []
+        for backend in Cbor_backends:
+            try:
+                self.codecs.append(get_codec(backend))
+            except ImportError:
+                pass
+        self.claim = {
+            'dc:title': 'foo.jpg',
+            'assertions': [{'url': 'self#jumbf=c2pa', 'alg': 'sha256', 'hash': b'\x00' * 32}],
+            'alg': 'sha256',
+            1: -37,
+        }
+
+    def test_default_codec(self):
+        codec = get_codec()
+        self.assertIn(codec.name, Cbor_backends)
+        self.assertIs(get_codec(), codec)
+        self.assertEqual(json_to_cbor_bytes({'foo': 'bar'}), b'\xa1cfoocbar')
+
+    def test_incomplete_backend(self):
+        class DumpsOnlyCodec(CborCodec):
+            def dumps(self, obj, canonical=False):
+                return b''
+
+        with self.assertRaises(TypeError):
+            DumpsOnlyCodec()
+
+    def test_roundtrip(self):
+        for codec in self.codecs:
+            data = codec.dumps(self.claim)
+            self.assertEqual(codec.loads(data), self.claim)
+            self.assertEqual(codec.loads(memoryview(data)), self.claim)
+
+    def test_canonical(self):
+        claim = {'bb': 1, 'a': {'cc': 2, 'b': 3}, 'c': 4}
+        testing_data = b'\xa3aa\xa2ab\x03bcc\x02ac\x04bbb\x01'
+        for codec in self.codecs:
+            self.assertEqual(codec.dumps(claim, canonical=True), testing_data)
+
+    def test_tag(self):
+        message = [b'\xa1\x018$', {'x5chain': b'cert'}, None, b'signature']
+        for codec in self.codecs:
+            data = codec.dumps(codec.tag(18, message))
+            self.assertEqual(data[:1], b'\xd2')
+            tag, value = codec.untag(codec.loads(data))
+            self.assertEqual(tag, 18)
+            self.assertEqual(value[0], message[0])
+            self.assertEqual(value[1]['x5chain'], b'cert')
+            self.assertEqual(value[2:], message[2:])
+            self.assertEqual(codec.untag(message), (None, message))
+
+    def test_backends_agree(self):
+        encoded = [codec.dumps(self.claim) for codec in self.codecs]
+        self.assertEqual(len(set(encoded)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
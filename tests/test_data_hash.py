@@ -0,0 +1,70 @@
+import hashlib
+import io
+import mmap
+import os
+import tempfile
+import unittest
+
+from c2pa.codec import get_codec
+from c2pa.data_hash import DataHash
+from c2pa.data_hash import hash_data
+from c2pa.data_hash import iter_ranges
+
+
+class TestHashData(unittest.TestCase):
+    def setUp(self):
+        self.data = os.urandom(3 * 1024 * 1024 + 5)
+        self.exclusions = [(1024, 4096), (2 * 1024 * 1024, 10)]
+        self.expected = hashlib.sha256(
+            self.data[:1024] +
+            self.data[1024 + 4096:2 * 1024 * 1024] +
+            self.data[2 * 1024 * 1024 + 10:]).digest()
+
+    def test_iter_ranges(self):
+        self.assertEqual(list(iter_ranges(100, [])), [(0, 100)])
+        self.assertEqual(list(iter_ranges(100, [(0, 10), (50, 10)])), [(10, 50), (60, 100)])
+        self.assertEqual(list(iter_ranges(100, [(90, 20)])), [(0, 90)])
+        self.assertEqual(list(iter_ranges(100, [(5, 10), (10, 10)])), [(0, 5), (20, 100)])
+
+    def test_bytes(self):
+        self.assertEqual(hash_data(self.data), hashlib.sha256(self.data).digest())
+        self.assertEqual(hash_data(self.data, self.exclusions), self.expected)
+
+    def test_file(self):
+        self.assertEqual(hash_data(io.BytesIO(self.data), self.exclusions, chunk_size=1000),
+                         self.expected)
+
+    def test_mmap(self):
+        with tempfile.TemporaryFile() as f:
+            f.write(self.data)
+            f.flush()
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                self.assertEqual(hash_data(m, self.exclusions), self.expected)
+
+    def test_truncated_file(self):
+        class ShortFile(io.BytesIO):
+            def seek(self, offset, whence=0):
+                # pretend to be larger than the actual data
+                return super(ShortFile, self).seek(offset, whence) + (10 if whence == 2 else 0)
+
+        with self.assertRaises(ValueError):
+            hash_data(ShortFile(self.data))
+
+
+class TestDataHash(unittest.TestCase):
+    def test_fixed_size(self):
+        data_hash = DataHash(start=2, digest=bytes(32))
+        size = data_hash.box.get_size()
+        for length in [0, 23, 24, 255, 65535, 65536, 2**32, 2**64 - 1]:
+            data_hash.set_length(length)
+            self.assertEqual(data_hash.box.get_size(), size)
+
+            obj = get_codec().loads(data_hash.box.content_boxes[0].payload)
+            self.assertEqual(obj['exclusions'], [{'start': 2, 'length': length}])
+            self.assertEqual(obj['alg'], 'sha256')
+            self.assertEqual(obj['hash'], bytes(32))
+        self.assertEqual(data_hash.box.description_box.db_label, 'c2pa.hash.data')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import os
+import threading
+import unittest
+
+from unittest import mock
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.serialization import Encoding
+
+from c2pa.hsm import Pkcs11Signer
+from c2pa.hsm import get_mechanism
+from c2pa.hsm import pkcs11
+from c2pa.signer import Cose_algorithms
+from c2pa.signer import Signer
+
+'''Tests against a PKCS#11 token, skipped unless PKCS11_MODULE is set.
+
+With SoftHSM:
+    softhsm2-util --init-token --free --label pyc2pa --pin 1234 --so-pin 1234
+    PKCS11_MODULE=/usr/lib/softhsm/libsofthsm2.so python -m unittest tests.test_hsm
+'''
+
+Module = os.environ.get('PKCS11_MODULE')
+Token_label = os.environ.get('PKCS11_TOKEN', 'pyc2pa')
+Pin = os.environ.get('PKCS11_PIN', '1234')
+Key_label = 'pyc2pa-test'
+
+Keys_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'Keys')
+
+
+@unittest.skipIf(pkcs11 is None, 'python-pkcs11 is not installed')
+class TestMechanisms(unittest.TestCase):
+    def test_all_algorithms(self):
+        for alg in Cose_algorithms:
+            mechanism, param = get_mechanism(alg)
+            self.assertIsNotNone(mechanism)
+
+
+@unittest.skipIf(pkcs11 is None, 'python-pkcs11 is not installed')
+class TestSessionPool(unittest.TestCase):
+    def test_close_on_error(self):
+        token = mock.Mock()
+        sessions = [mock.Mock() for i in range(3)]
+        token.open.side_effect = sessions
+        # the key is missing from the third session
+        sessions[2].get_key.side_effect = pkcs11.NoSuchKey()
+        with mock.patch('c2pa.hsm.pkcs11.lib') as lib:
+            lib.return_value.get_token.return_value = token
+            with self.assertRaises(pkcs11.NoSuchKey):
+                Pkcs11Signer('module.so', 'token', '1234', key_label='key', pool_size=4)
+        for session in sessions:
+            session.close.assert_called_once_with()
+        self.assertEqual(token.open.call_count, 3)
+
+
+@unittest.skipIf(pkcs11 is None or Module is None, 'PKCS11_MODULE is not set')
+class TestPkcs11Signer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from pkcs11 import Attribute
+        from pkcs11.util.rsa import decode_rsa_private_key
+
+        with open(os.path.join(Keys_dir, 'demo2_user1.p12'), 'rb') as f:
+            cls.software_signer = Signer.from_pkcs12(f.read(), b'1234')
+        key_der = cls.software_signer.private_key.private_bytes(
+            Encoding.DER,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption())
+        cls.certificate = cls.software_signer.certificates[0].public_bytes(Encoding.PEM)
+
+        # import the demo key into the token
+        attrs = decode_rsa_private_key(key_der)
+        attrs[Attribute.LABEL] = Key_label
+        attrs[Attribute.TOKEN] = True
+        token = pkcs11.lib(Module).get_token(token_label=Token_label)
+        with token.open(rw=True, user_pin=Pin) as session:
+            cls.key = session.create_object(attrs)
+
+    @classmethod
+    def tearDownClass(cls):
+        token = pkcs11.lib(Module).get_token(token_label=Token_label)
+        with token.open(rw=True, user_pin=Pin) as session:
+            for key in session.get_objects({pkcs11.Attribute.LABEL: Key_label}):
+                key.destroy()
+
+    def create_signer(self, **kwargs):
+        return Pkcs11Signer(Module, Token_label, Pin,
+                            key_label=Key_label,
+                            certificate=self.certificate,
+                            **kwargs)
+
+    def verify(self, data, signature):
+        self.software_signer.certificates[0].public_key().verify(
+            signature,
+            data,
+            padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=32),
+            hashes.SHA256())
+
+    def test_sign(self):
+        with self.create_signer(pool_size=1) as signer:
+            self.assertEqual(signer.alg, 'PS256')
+            self.assertEqual(signer.protected_header, self.software_signer.protected_header)
+            self.assertEqual(signer.x5chain, self.software_signer.x5chain[0])
+            self.verify(b'claim', signer.sign(b'claim'))
+
+    def test_concurrent_sign(self):
+        results = {}
+
+        def sign(signer, i):
+            data = b'claim %d' % i
+            results[data] = signer.sign(data)
+
+        with self.create_signer(pool_size=4) as signer:
+            threads = [threading.Thread(target=sign, args=(signer, i)) for i in range(16)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(results), 16)
+        for data, signature in results.items():
+            self.verify(data, signature)
+
+
+if __name__ == '__main__':
+    unittest.main()
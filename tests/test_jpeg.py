@@ -0,0 +1,139 @@
+import errno
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+from c2pa.jpeg import Jpeg_markers
+from c2pa.jpeg import Xmp_namespace
+from c2pa.jpeg import copy_range
+from c2pa.jpeg import create_jpeg_segment
+from c2pa.jpeg import get_app11_segments
+from c2pa.jpeg import get_output_offset
+from c2pa.jpeg import get_jpeg_segments
+from c2pa.jpeg import get_xmp_segments
+from c2pa.jpeg import iter_spliced
+from c2pa.jpeg import write_spliced
+from c2pa.jumbf import App11Box
+from c2pa.jumbf import create_json_superbox
+from c2pa.jumbf import get_app11_marker_segment_headers
+
+
+def create_segment(marker, payload):
+    return (marker.to_bytes(2, byteorder='big')
+            + (2 + len(payload)).to_bytes(2, byteorder='big')
+            + payload)
+
+
+class TestJpegSegments(unittest.TestCase):
+    def setUp(self):
+        app11_box = App11Box()
+        app11_box.payload = create_json_superbox(b'x' * 70000, 'starling').convert_bytes()
+        self.app11_bytes = app11_box.convert_bytes()
+
+        # scan data containing App11 marker patterns
+        self.scan_data = b'\x12\xff\xeb\x00\x10JP\x00\x01' * 1000
+        self.data_bytes = (
+            b'\xff\xd8'
+            + create_segment(Jpeg_markers['APP0'], b'JFIF\x00\x01\x01')
+            + self.app11_bytes
+            + create_segment(Jpeg_markers['APP1'], Xmp_namespace + b'<x:xmpmeta/>')
+            + b'\xff\xff'  # fill bytes
+            + create_segment(0xFFDB, b'\x00' * 65)
+            + create_segment(Jpeg_markers['SOS'], b'\x01\x01\x00\x00\x3f\x00')
+            + self.scan_data
+            + b'\xff\xd9'
+        )
+
+    def test_get_jpeg_segments(self):
+        segments = get_jpeg_segments(self.data_bytes)
+        markers = [segment.marker for segment in segments]
+
+        self.assertEqual(markers, [0xFFD8, 0xFFE0, 0xFFEB, 0xFFEB, 0xFFE1, 0xFFDB, 0xFFDA])
+        self.assertEqual(segments[2].offset, 2 + 2 + 9)
+        self.assertEqual(segments[2].size, 65535 + 2)
+        self.assertEqual(segments[-1].end, len(self.data_bytes) - len(self.scan_data) - 2)
+
+        self.assertEqual(len(get_app11_segments(segments)), 2)
+        xmp_segments = get_xmp_segments(self.data_bytes, segments)
+        self.assertEqual(len(xmp_segments), 1)
+        self.assertTrue(bytes(xmp_segments[0].get_payload(self.data_bytes)).endswith(b'<x:xmpmeta/>'))
+
+    def test_not_jpeg(self):
+        self.assertEqual(get_jpeg_segments(b'\x89PNG\r\n'), [])
+
+    def test_malformed(self):
+        data_bytes = b'\xff\xd8' + create_jpeg_segment(Jpeg_markers['APP0'], b'JFIF\x00')
+        with self.assertWarns(UserWarning):
+            segments = get_jpeg_segments(data_bytes[:-2])
+        self.assertEqual(len(segments), 1)
+        with self.assertWarns(UserWarning):
+            segments = get_jpeg_segments(data_bytes + b'\x00\x00')
+        self.assertEqual(len(segments), 2)
+
+    def test_app11_marker_segment_headers(self):
+        headers = get_app11_marker_segment_headers(self.data_bytes)
+
+        self.assertEqual(sorted(headers), [1, 2])
+        self.assertEqual(headers[1]['offset'], 2 + 2 + 9)
+        self.assertEqual(headers[2]['tbox'], 'jumb')
+
+
+class TestSplice(unittest.TestCase):
+    def test_iter_spliced(self):
+        data_bytes = b'0123456789'
+        edits = [(2, 2, b'ab'), (5, 7, [b'c', b'de']), (2, 2, b'f'), (9, 10, b'')]
+        self.assertEqual(b''.join(iter_spliced(data_bytes, edits)), b'01abf234cde78')
+        self.assertEqual(get_output_offset(edits, 0), 2)
+        self.assertEqual(get_output_offset(edits, 2), 4)
+        self.assertEqual(get_output_offset(edits, 1), 8)
+        self.assertEqual(get_output_offset(edits, 3), 13)
+
+    def test_overlapping_edits(self):
+        with self.assertRaises(ValueError):
+            list(iter_spliced(b'0123456789', [(2, 5, b''), (4, 6, b'')]))
+
+
+class TestSpliceFile(unittest.TestCase):
+    def setUp(self):
+        self.data_bytes = os.urandom(100000)
+        self.src = tempfile.TemporaryFile()
+        self.src.write(self.data_bytes)
+        self.src.flush()
+        self.dst = tempfile.TemporaryFile()
+
+    def tearDown(self):
+        self.src.close()
+        self.dst.close()
+
+    def read_output(self):
+        self.dst.seek(0)
+        return self.dst.read()
+
+    def test_write_spliced(self):
+        edits = [(2, 2, [b'ab', b'cd']), (50000, 50010, b'ef'), (99990, 100000, b'')]
+        written = write_spliced(self.src.fileno(), self.dst.fileno(), edits)
+        expected = b''.join(iter_spliced(self.data_bytes, edits))
+        self.assertEqual(written, len(expected))
+        self.assertEqual(self.read_output(), expected)
+
+    def test_copy_fallbacks(self):
+        # the kernel can not copy the files, e.g. across file systems
+        errors = [OSError(errno.EXDEV, 'copy_file_range'), OSError(errno.ENOSYS, 'sendfile')]
+        with mock.patch.object(os, 'copy_file_range', side_effect=errors[0], create=True), \
+                mock.patch.object(os, 'sendfile', side_effect=errors[1], create=True):
+            self.assertEqual(copy_range(self.src.fileno(), self.dst.fileno(), 10, 90000, chunk_size=4096), 90000)
+        self.assertEqual(self.read_output(), self.data_bytes[10:90010])
+
+        with mock.patch.object(os, 'copy_file_range', side_effect=OSError(errno.EIO, 'I/O'), create=True):
+            with self.assertRaises(OSError):
+                copy_range(self.src.fileno(), self.dst.fileno(), 0, 10)
+
+    def test_truncated_file(self):
+        with self.assertRaises(ValueError):
+            copy_range(self.src.fileno(), self.dst.fileno(), 99000, 2000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,14 +1,27 @@
+import hashlib
 import io
 import json
+import mmap
+import os
+import tempfile
+import tracemalloc
 import unittest
 
 from c2pa.jumbf import App11Box
 from c2pa.jumbf import Box
 from c2pa.jumbf import ContentBox
 from c2pa.jumbf import DescriptionBox
+from c2pa.jumbf import SegmentedView
 from c2pa.jumbf import SuperBox
+from c2pa.jumbf import Jumbf_content_types
 
+from c2pa.jumbf import create_box_header
+from c2pa.jumbf import create_codestream_superbox
 from c2pa.jumbf import create_json_superbox
+from c2pa.jumbf import get_app11_marker_segment_headers
+from c2pa.jumbf import get_box_size
+from c2pa.jumbf import parse_box
+from c2pa.jumbf import reassemble_app11_payload
 
 
 class TestBox(unittest.TestCase):
@@ -51,6 +64,18 @@ class TestDescriptionBox(unittest.TestCase):
 
         self.assertEqual(box.t_box, testing_t_box)
 
+    def test_content_type(self):
+        box = DescriptionBox(content_type=Jumbf_content_types['cbor'], label='starling')
+        hex_box = DescriptionBox(content_type=Jumbf_content_types['cbor'].hex(), label='starling')
+
+        self.assertEqual(box.db_type_code, Jumbf_content_types['cbor'])
+        self.assertEqual(hex_box.db_type, Jumbf_content_types['cbor'].hex())
+        self.assertEqual(box.convert_bytes(), hex_box.convert_bytes())
+
+    def test_slots(self):
+        for box in [Box(), ContentBox(), DescriptionBox(), SuperBox(), App11Box()]:
+            self.assertFalse(hasattr(box, '__dict__'))
+
 
 class TestSuperBox(unittest.TestCase):
     def test_convert_bytes(self):
@@ -76,6 +101,162 @@ class TestSuperBox(unittest.TestCase):
         s_box = create_json_superbox(b'foobar', 'starling')
         print(s_box.convert_bytes().hex())
 
+    def test_nested_superbox(self):
+        inner_boxes = [create_json_superbox(b'foo', 'first'),
+                       create_json_superbox(b'x' * 70000, 'second')]
+
+        s_box = SuperBox()
+        s_box.description_box = DescriptionBox(label='outer')
+        s_box.content_boxes.extend(inner_boxes)
+
+        payload = s_box.description_box.convert_bytes()
+        for inner_box in inner_boxes:
+            payload += inner_box.convert_bytes()
+        testing_data = (8 + len(payload)).to_bytes(4, byteorder='big') + b'jumb' + payload
+
+        self.assertEqual(s_box.get_size(), len(testing_data))
+        self.assertEqual(s_box.convert_bytes(), testing_data)
+
+
+class TestBoxCache(unittest.TestCase):
+    def setUp(self):
+        self.s_box = SuperBox()
+        self.s_box.description_box = DescriptionBox(label='outer')
+        self.s_box.content_boxes.append(create_json_superbox(b'foo', 'inner'))
+
+    def test_cached_bytes(self):
+        box_bytes = self.s_box.convert_bytes()
+        self.assertIs(self.s_box.convert_bytes(), box_bytes)
+        self.assertEqual(self.s_box.get_size(), len(box_bytes))
+
+    def test_single_copy(self):
+        s_box = create_json_superbox(os.urandom(8 * 1024 * 1024), 'large')
+        tracemalloc.start()
+        try:
+            box_bytes = s_box.convert_bytes()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        # the payload is copied into the cached bytes only
+        self.assertLess(peak, 1.5 * len(box_bytes))
+
+    def test_invalidate_payload(self):
+        box_bytes = self.s_box.convert_bytes()
+        self.s_box.content_boxes[0].content_boxes[0].payload = b'foobar'
+
+        self.assertEqual(self.s_box.get_size(), len(box_bytes) + 3)
+        self.assertIn(b'foobar', self.s_box.convert_bytes())
+
+    def test_invalidate_label(self):
+        self.s_box.convert_bytes()
+        self.s_box.content_boxes[0].description_box.db_label = 'renamed'
+
+        self.assertIn(b'renamed\x00', self.s_box.convert_bytes())
+
+    def test_invalidate_children(self):
+        box_bytes = self.s_box.convert_bytes()
+        new_box = create_json_superbox(b'bar', 'second')
+        self.s_box.content_boxes.append(new_box)
+
+        l_box = (len(box_bytes) + new_box.get_size()).to_bytes(4, byteorder='big')
+        self.assertEqual(self.s_box.convert_bytes(),
+                         l_box + box_bytes[4:] + new_box.convert_bytes())
+
+        self.s_box.content_boxes = []
+        self.assertEqual(self.s_box.get_size(), 8 + self.s_box.description_box.get_size())
+
+
+class TestPayloadDigest(unittest.TestCase):
+    def test_content_box(self):
+        c_box = ContentBox()
+        c_box.payload = os.urandom(300 * 1024)
+        self.assertEqual(c_box.get_payload_digest(),
+                         hashlib.sha256(c_box.convert_bytes()[8:]).digest())
+        self.assertEqual(c_box.get_payload_digest('sha512'),
+                         hashlib.sha512(c_box.payload).digest())
+
+    def test_superbox(self):
+        s_box = create_json_superbox(b'{"foo": "bar"}', 'inner')
+        self.assertEqual(s_box.get_payload_digest(),
+                         hashlib.sha256(s_box.convert_bytes()[8:]).digest())
+
+    def test_cached_digest(self):
+        c_box = ContentBox()
+        c_box.payload = memoryview(b'foo')
+        digest = c_box.get_payload_digest()
+        self.assertIs(c_box.get_payload_digest(), digest)
+
+        c_box.payload = b'bar'
+        self.assertEqual(c_box.get_payload_digest(), hashlib.sha256(b'bar').digest())
+
+
+class TestWriteTo(unittest.TestCase):
+    def test_box_write_to(self):
+        s_box = create_json_superbox(b'x' * 100000, 'starling')
+        f = io.BytesIO()
+        written = s_box.write_to(f, chunk_size=4096)
+
+        self.assertEqual(written, s_box.get_size())
+        self.assertEqual(f.getvalue(), s_box.convert_bytes())
+        self.assertTrue(all(len(chunk) <= 4096 for chunk in s_box.iter_chunks(4096)))
+
+    def test_app11_write_to(self):
+        s_box = create_json_superbox(b'x' * 200000, 'starling')
+        testing_data = App11Box()
+        testing_data.payload = s_box.convert_bytes()
+        testing_data = testing_data.convert_bytes()
+
+        app11_box = App11Box()
+        app11_box.box = s_box
+        f = io.BytesIO()
+        written = app11_box.write_to(f, chunk_size=4096)
+
+        self.assertEqual(written, len(testing_data))
+        self.assertEqual(f.getvalue(), testing_data)
+        self.assertEqual(app11_box.convert_bytes(), testing_data)
+
+        app11_box = App11Box()
+        app11_box.payload = s_box.convert_bytes()
+        f = io.BytesIO()
+        app11_box.write_to(f)
+
+        self.assertEqual(f.getvalue(), testing_data)
+
+
+class TestApp11Segments(unittest.TestCase):
+    def test_get_size(self):
+        for body_size in [0, 1, 65517 - 1, 65517, 65517 + 1, 3 * 65517]:
+            app11_box = App11Box()
+            app11_box.payload = ContentBox().convert_bytes() + b'x' * body_size
+            segments = -(-body_size // 65517) or 1
+
+            self.assertEqual(app11_box.get_segment_number(), segments)
+            self.assertEqual(app11_box.get_size(), len(app11_box.convert_bytes()))
+            self.assertEqual(app11_box.get_size(), body_size + segments * 20)
+
+    def test_iter_segments(self):
+        app11_box = App11Box()
+        app11_box.payload = create_json_superbox(b'x' * 150000, 'starling').convert_bytes()
+        pieces = list(app11_box.iter_segments())
+
+        # header and payload slice for each segment
+        self.assertEqual(len(pieces), 6)
+        self.assertIsInstance(pieces[1], memoryview)
+        self.assertIs(pieces[1].obj, app11_box.payload)
+        self.assertEqual(b''.join(pieces), app11_box.convert_bytes())
+
+    def test_writev(self):
+        app11_box = App11Box()
+        app11_box.box = create_json_superbox(b'x' * 150000, 'starling')
+
+        with tempfile.TemporaryFile() as f:
+            written = app11_box.writev(f.fileno())
+            os.lseek(f.fileno(), 0, os.SEEK_SET)
+            data_bytes = f.read()
+
+        self.assertEqual(written, app11_box.get_size())
+        self.assertEqual(data_bytes, app11_box.convert_bytes())
+
 
 class TestApp11Box(unittest.TestCase):
     def test_convert_bytes(self):
@@ -113,5 +294,128 @@ class TestApp11Box(unittest.TestCase):
         self.assertEqual(app11_box.convert_bytes(), bytes.fromhex(testing_data))
 
 
+class TestBoxView(unittest.TestCase):
+    def setUp(self):
+        self.thumbnail = b'\xff\xd8' + b'x' * 150000
+        self.s_box = SuperBox()
+        self.s_box.description_box = DescriptionBox(label='c2pa')
+        self.s_box.content_boxes.append(create_json_superbox(b'{"foo":"bar"}', 'starling'))
+        self.s_box.content_boxes.append(create_codestream_superbox(self.thumbnail, 'thumbnail'))
+
+    def test_parse_box(self):
+        data_bytes = self.s_box.convert_bytes()
+        box = parse_box(data_bytes)
+
+        self.assertTrue(box.is_superbox)
+        self.assertEqual(box.label, 'c2pa')
+        self.assertEqual(box.size, len(data_bytes))
+        self.assertEqual([b.label for b in box.content_boxes], ['starling', 'thumbnail'])
+        self.assertEqual(box.get('starling').description_box.db_type,
+                         self.s_box.content_boxes[0].description_box.db_type)
+        self.assertEqual(bytes(box.find('starling').content_boxes[0].payload), b'{"foo":"bar"}')
+
+        bidb = box.find('/thumbnail').content_boxes[1]
+        self.assertEqual(bidb.box_type, 'bidb')
+        self.assertEqual(bidb.payload, self.thumbnail)
+        # payload is a view of the original buffer
+        self.assertIs(bidb.payload.obj, data_bytes)
+        self.assertIsNone(box.find('starling/missing'))
+
+    def test_parse_invalid_box(self):
+        data_bytes = self.s_box.convert_bytes()
+        with self.assertRaises(ValueError):
+            parse_box(data_bytes[:-1])
+
+    def test_reassemble_app11_payload(self):
+        app11_box = App11Box()
+        app11_box.box = self.s_box
+        data_bytes = b'\xff\xd8' + app11_box.convert_bytes() + b'\xff\xd9'
+
+        headers = get_app11_marker_segment_headers(data_bytes)
+        self.assertEqual(len(headers), 3)
+
+        payload = reassemble_app11_payload(data_bytes, headers)
+        self.assertIsInstance(payload, SegmentedView)
+        self.assertEqual(payload, self.s_box.convert_bytes())
+        self.assertEqual(parse_box(payload).get('thumbnail').label, 'thumbnail')
+
+    def test_segmented_view(self):
+        data_bytes = b'0123456789'
+        view = SegmentedView([memoryview(data_bytes)[0:3], memoryview(b''), memoryview(data_bytes)[3:10]])
+        self.assertEqual(len(view), 10)
+        self.assertEqual(view[4], ord('4'))
+        self.assertEqual(view[-1], ord('9'))
+        # slices of a single part are memoryviews of it
+        self.assertIsInstance(view[4:8], memoryview)
+        self.assertEqual(bytes(view[4:8]), b'4567')
+        self.assertIsInstance(view[1:5], SegmentedView)
+        self.assertEqual(bytes(view[1:5]), b'1234')
+        self.assertEqual(bytes(view[2:][1:]), b'3456789')
+        self.assertEqual(bytes(view[5:5]), b'')
+        self.assertEqual(int.from_bytes(view[2:4], byteorder='big'), int.from_bytes(b'23', byteorder='big'))
+        with self.assertRaises(IndexError):
+            view[10]
+
+
+class TestXLBox(unittest.TestCase):
+    def test_box_header(self):
+        self.assertEqual(get_box_size(100), 108)
+        self.assertEqual(create_box_header(b'jumb', 108), b'\x00\x00\x00\x6cjumb')
+
+        size = get_box_size(2 ** 32)
+        self.assertEqual(size, 2 ** 32 + 16)
+        self.assertEqual(create_box_header(b'jumb', size),
+                         b'\x00\x00\x00\x01jumb' + size.to_bytes(8, byteorder='big'))
+
+    def test_large_payload(self):
+        # sparse file, the payload is never loaded into memory
+        with tempfile.TemporaryFile() as f:
+            f.truncate(2 ** 32)
+            try:
+                payload = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OverflowError, OSError, ValueError):
+                self.skipTest('Can not map a 4 GB file')
+
+            s_box = create_codestream_superbox(payload, 'thumbnail')
+            bidb_box = s_box.content_boxes[1]
+            self.assertEqual(bidb_box.get_size(), 2 ** 32 + 16)
+            self.assertEqual(bytes(next(bidb_box.iter_chunks())),
+                             b'\x00\x00\x00\x01bidb' + (2 ** 32 + 16).to_bytes(8, byteorder='big'))
+
+            size = s_box.get_size()
+            self.assertEqual(size, s_box.description_box.get_size()
+                             + s_box.content_boxes[0].get_size() + 2 ** 32 + 32)
+
+            app11_box = App11Box()
+            app11_box.box = s_box
+            segments = app11_box.iter_segments()
+            first_segment = bytes(next(segments))
+            self.assertEqual(app11_box.get_segment_number(), -(-(size - 16) // 65509))
+            self.assertEqual(app11_box.get_size(), size - 16 + app11_box.get_segment_number() * 28)
+            self.assertEqual(first_segment[2:4], b'\xff\xff')
+            self.assertEqual(first_segment[12:], create_box_header(b'jumb', size))
+            payload.close()
+
+    def test_parse_xlbox(self):
+        s_box = create_json_superbox(b'x' * 70000, 'starling')
+        payload = s_box.convert_bytes()[8:]
+        data_bytes = create_box_header(b'jumb', 1) + (16 + len(payload)).to_bytes(8, byteorder='big') + payload
+
+        box = parse_box(data_bytes)
+        self.assertEqual(box.header_size, 16)
+        self.assertEqual(box.size, len(data_bytes))
+        self.assertEqual(box.label, 'starling')
+
+        app11_box = App11Box()
+        app11_box.payload = data_bytes
+        app11_bytes = b'\xff\xd8' + app11_box.convert_bytes()
+        self.assertEqual(app11_box.get_segment_number(), 2)
+        self.assertEqual(len(app11_bytes), 2 + len(data_bytes) + 16 + 2 * 12)
+
+        headers = get_app11_marker_segment_headers(app11_bytes)
+        self.assertEqual(headers[2]['xlbox'], len(data_bytes))
+        self.assertEqual(reassemble_app11_payload(app11_bytes, headers), data_bytes)
+
+
 if __name__ == '__main__':
     unittest.main()
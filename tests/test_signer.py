@@ -0,0 +1,178 @@
+import datetime
+import os
+import unittest
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric import ed25519
+from cryptography.hazmat.primitives.asymmetric import padding
+from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+from cryptography.hazmat.primitives.serialization import Encoding
+
+from c2pa.codec import get_codec
+from c2pa.signer import Cose_algorithms
+from c2pa.signer import Signer
+from c2pa.signer import SigningPool
+from c2pa.signer import verify_signature
+
+
+Keys_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'Keys')
+
+
+def read_key_file(filename):
+    with open(os.path.join(Keys_dir, filename), 'rb') as f:
+        return f.read()
+
+
+def create_certificate(private_key):
+    name = x509.Name([x509.NameAttribute(x509.NameOID.COMMON_NAME, 'pyc2pa test')])
+    now = datetime.datetime.utcnow()
+    algorithm = None if isinstance(private_key, ed25519.Ed25519PrivateKey) else hashes.SHA256()
+    return x509.CertificateBuilder() \
+        .subject_name(name) \
+        .issuer_name(name) \
+        .public_key(private_key.public_key()) \
+        .serial_number(x509.random_serial_number()) \
+        .not_valid_before(now) \
+        .not_valid_after(now + datetime.timedelta(days=1)) \
+        .sign(private_key, algorithm)
+
+
+class TestSigner(unittest.TestCase):
+    def setUp(self):
+        self.p12 = read_key_file('demo2_user1.p12')
+        self.signer = Signer.from_pkcs12(self.p12, b'1234')
+
+    def verify(self, signer, data, signature):
+        signer.certificates[0].public_key().verify(
+            signature,
+            data,
+            padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=32),
+            hashes.SHA256())
+
+    def test_pkcs12(self):
+        self.assertEqual(len(self.signer.certificates), 2)
+        self.assertEqual(self.signer.x5chain[0],
+                         self.signer.certificates[0].public_bytes(Encoding.DER))
+        self.assertEqual(get_codec().loads(self.signer.protected_header), {1: -37})
+
+        data = b'Signature1'
+        self.verify(self.signer, data, self.signer.sign(data))
+
+    def test_pem_and_der(self):
+        private_key = self.signer.private_key
+        certificate = self.signer.certificates[0]
+
+        key_pem = private_key.private_bytes(Encoding.PEM,
+                                            serialization.PrivateFormat.PKCS8,
+                                            serialization.NoEncryption())
+        key_der = private_key.private_bytes(Encoding.DER,
+                                            serialization.PrivateFormat.PKCS8,
+                                            serialization.NoEncryption())
+        cert_pem = certificate.public_bytes(Encoding.PEM)
+        cert_der = certificate.public_bytes(Encoding.DER)
+
+        for signer in [Signer.from_pem(key_pem, cert_pem),
+                       Signer.from_der(key_der, cert_der),
+                       Signer.load(key_pem, cert_pem),
+                       Signer.load(key_der, cert_der),
+                       Signer.load(self.p12, password=b'1234')]:
+            self.assertIsInstance(signer.certificates[0], x509.Certificate)
+            self.assertEqual(signer.certificates[0], certificate)
+            self.verify(signer, b'claim', signer.sign(b'claim'))
+
+        self.assertEqual(Signer.from_pem(key_pem, cert_pem).x5chain, cert_der)
+
+    def test_signing_pool(self):
+        sig_structures = [b'claim %d' % i for i in range(8)]
+        with SigningPool(self.p12, password=b'1234', max_workers=2) as pool:
+            self.assertEqual(pool.x5chain, self.signer.x5chain)
+            self.assertEqual(pool.protected_header, self.signer.protected_header)
+
+            futures = [pool.submit(data) for data in sig_structures]
+            for data, future in zip(sig_structures, futures):
+                self.verify(self.signer, data, future.result())
+
+    def test_no_certificate(self):
+        with self.assertRaises(ValueError):
+            Signer(self.signer.private_key, [])
+
+
+class TestSignerAlgorithms(unittest.TestCase):
+    def create_signer(self, private_key, alg=None):
+        return Signer(private_key, [create_certificate(private_key)], alg=alg)
+
+    def test_ecdsa(self):
+        for curve, alg, hash_algorithm, size in [(ec.SECP256R1(), 'ES256', hashes.SHA256(), 32),
+                                                 (ec.SECP384R1(), 'ES384', hashes.SHA384(), 48),
+                                                 (ec.SECP521R1(), 'ES512', hashes.SHA512(), 66)]:
+            signer = self.create_signer(ec.generate_private_key(curve))
+            self.assertEqual(signer.alg, alg)
+            self.assertEqual(get_codec().loads(signer.protected_header),
+                             {1: Cose_algorithms[alg]})
+
+            # COSE signatures are r || s instead of DER
+            signature = signer.sign(b'claim')
+            self.assertEqual(len(signature), 2 * size)
+            r = int.from_bytes(signature[:size], byteorder='big')
+            s = int.from_bytes(signature[size:], byteorder='big')
+            signer.certificates[0].public_key().verify(
+                encode_dss_signature(r, s), b'claim', ec.ECDSA(hash_algorithm))
+
+    def test_eddsa(self):
+        signer = self.create_signer(ed25519.Ed25519PrivateKey.generate())
+        self.assertEqual(signer.alg, 'EdDSA')
+        self.assertEqual(get_codec().loads(signer.protected_header), {1: -8})
+        signer.certificates[0].public_key().verify(signer.sign(b'claim'), b'claim')
+
+    def test_rsa_pss(self):
+        p12 = read_key_file('demo2_user1.p12')
+        for alg, hash_algorithm in [('PS384', hashes.SHA384()), ('PS512', hashes.SHA512())]:
+            signer = Signer.from_pkcs12(p12, b'1234', alg=alg)
+            self.assertEqual(get_codec().loads(signer.protected_header),
+                             {1: Cose_algorithms[alg]})
+            signer.certificates[0].public_key().verify(
+                signer.sign(b'claim'),
+                b'claim',
+                padding.PSS(mgf=padding.MGF1(hash_algorithm),
+                            salt_length=hash_algorithm.digest_size),
+                hash_algorithm)
+
+    def test_signature_size(self):
+        for private_key in [ec.generate_private_key(ec.SECP256R1()),
+                            ec.generate_private_key(ec.SECP521R1()),
+                            ed25519.Ed25519PrivateKey.generate()]:
+            signer = self.create_signer(private_key)
+            for i in range(8):
+                self.assertEqual(len(signer.sign(b'claim %d' % i)), signer.signature_size)
+
+        signer = Signer.from_pkcs12(read_key_file('demo2_user1.p12'), b'1234')
+        self.assertEqual(signer.signature_size, signer.private_key.key_size // 8)
+        self.assertEqual(len(signer.sign(b'claim')), signer.signature_size)
+
+    def test_key_mismatch(self):
+        with self.assertRaises(ValueError):
+            self.create_signer(ec.generate_private_key(ec.SECP256R1()), alg='ES384')
+        with self.assertRaises(ValueError):
+            self.create_signer(ed25519.Ed25519PrivateKey.generate(), alg='PS256')
+
+    def test_verify_signature(self):
+        signers = [self.create_signer(ec.generate_private_key(ec.SECP256R1())),
+                   self.create_signer(ec.generate_private_key(ec.SECP521R1())),
+                   self.create_signer(ed25519.Ed25519PrivateKey.generate()),
+                   Signer.from_pkcs12(read_key_file('demo2_user1.p12'), b'1234', alg='PS384')]
+        for signer in signers:
+            public_key = signer.certificates[0].public_key()
+            signature = signer.sign(b'claim')
+            self.assertTrue(verify_signature(public_key, signer.alg, b'claim', signature))
+            self.assertFalse(verify_signature(public_key, signer.alg, b'claim!', signature))
+            self.assertFalse(verify_signature(public_key, signer.alg, b'claim', signature[:-1]))
+
+        with self.assertRaises(ValueError):
+            verify_signature(signers[0].certificates[0].public_key(), 'PS256', b'claim', signature)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+import unittest
+
+from c2pa.signer import Cose_algorithms
+from c2pa.starling import Cose_algorithm_names
+
+Root_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Imported on first use only, see benchmarks/bench_startup.py
+Deferred_modules = [
+    'c2pa.core',
+    'c2pa.hsm',
+    'c2pa.signer',
+    'c2pa.verify',
+    'cbor',
+    'cbor2',
+    'concurrent.futures.process',
+    'cryptography',
+    'multibase',
+    'multihash',
+    'pkcs11',
+    'pytz',
+    'urllib.request',
+    'xml.sax',
+]
+
+
+def get_imported_modules(code):
+    '''Return the modules imported by running code in a new interpreter.
+    '''
+    env = dict(os.environ, PYTHONPATH=Root_dir)
+    result = subprocess.run(
+        [sys.executable, '-c', code + '\nimport sys\nprint(" ".join(sys.modules))'],
+        env=env, check=True, stdout=subprocess.PIPE)
+    return set(result.stdout.decode('utf-8').split())
+
+
+class TestStartup(unittest.TestCase):
+    def assertNotImported(self, modules):
+        imported = sorted(m for m in Deferred_modules if m in modules)
+        self.assertEqual(imported, [])
+
+    def test_import_starling(self):
+        self.assertNotImported(get_imported_modules('import c2pa.starling'))
+
+    def test_help(self):
+        code = ('import sys\n'
+                'sys.argv = ["c2pa", "--help"]\n'
+                'from c2pa.starling import main\n'
+                'try:\n'
+                '    main()\n'
+                'except SystemExit:\n'
+                '    pass')
+        self.assertNotImported(get_imported_modules(code))
+
+    def test_algorithm_names(self):
+        self.assertEqual(Cose_algorithm_names, list(Cose_algorithms))
+
+
+if __name__ == '__main__':
+    unittest.main()
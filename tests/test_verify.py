@@ -0,0 +1,303 @@
+import json
+import os
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+
+from unittest import mock
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.serialization import Encoding
+
+from c2pa.codec import get_codec
+from c2pa.jumbf import get_app11_marker_segment_headers
+from c2pa.jumbf import json_to_bytes
+from c2pa.jumbf import json_to_cbor_bytes
+from c2pa.signer import Signer
+from c2pa.signer import load_certificates
+from c2pa.starling import Starling
+from c2pa.starling import inject_file
+from c2pa.verify import CertificateCache
+from c2pa.verify import Verifier
+from c2pa.verify import get_uri_labels
+
+from helpers import create_jpeg
+
+Keys_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'Keys')
+
+
+def get_codes(manifest):
+    return [status.code for status in manifest.statuses]
+
+
+class TestVerifier(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(os.path.join(Keys_dir, 'demo2_user1.p12'), 'rb') as f:
+            cls.signer = Signer.from_pkcs12(f.read(), b'1234')
+
+    def setUp(self):
+        self.verifier = Verifier()
+        self.data_bytes = self.inject(create_jpeg())
+
+    def inject(self, data_bytes, signer=None):
+        assertions = {
+            'stds.schema-org.CreativeWork': {
+                'type': '.json',
+                'data_bytes': json_to_bytes({'author': 'pyc2pa'}),
+            },
+        }
+        starling = Starling(data_bytes, 'test.jpg', assertions, 'numbersprotocol', 'pyc2pa',
+                            signer=signer or self.signer)
+        return starling.c2pa_injection()
+
+    def test_valid(self):
+        result = self.verifier.verify(self.data_bytes)
+        self.assertTrue(result.valid)
+        self.assertEqual(len(result.manifests), 1)
+        manifest = result.active_manifest
+        self.assertTrue(manifest.active)
+        self.assertEqual(manifest.alg, 'PS256')
+        self.assertEqual(get_codes(manifest), ['claimSignature.validated',
+                                               'assertion.hashedURI.match',
+                                               'assertion.hashedURI.match',
+                                               'assertion.dataHash.match'])
+        # structured results are serializable
+        self.assertTrue(json.loads(json.dumps(result.to_json()))['valid'])
+
+    def test_multiple_manifests(self):
+        result = self.verifier.verify(self.inject(self.data_bytes))
+        self.assertTrue(result.valid)
+        self.assertEqual(len(result.manifests), 2)
+        # only the active Manifest is bound to the asset as it is
+        self.assertFalse(result.manifests[0].active)
+        self.assertNotIn('assertion.dataHash.match', get_codes(result.manifests[0]))
+        self.assertIn('assertion.dataHash.match', get_codes(result.manifests[1]))
+        self.assertTrue(all(manifest.valid for manifest in result.manifests))
+
+    def test_no_manifest(self):
+        result = self.verifier.verify(create_jpeg())
+        self.assertFalse(result.valid)
+        self.assertIsNone(result.active_manifest)
+        self.assertEqual([status.code for status in result.statuses], ['manifest.missing'])
+
+    def test_edited_image(self):
+        data_bytes = bytearray(self.data_bytes)
+        data_bytes[-10] ^= 0x01
+        manifest = self.verifier.verify(data_bytes).active_manifest
+        self.assertFalse(manifest.valid)
+        self.assertIn('claimSignature.validated', get_codes(manifest))
+        self.assertEqual([status.code for status in manifest.failures], ['assertion.dataHash.mismatch'])
+
+    def test_edited_assertion(self):
+        data_bytes = self.data_bytes.replace(b'pyc2pa"}', b'PYC2PA"}')
+        manifest = self.verifier.verify(data_bytes).active_manifest
+        self.assertEqual([status.code for status in manifest.failures], ['assertion.hashedURI.mismatch'])
+        self.assertTrue(manifest.failures[0].url.endswith('/stds.schema-org.CreativeWork'))
+
+    def test_edited_claim(self):
+        # the title is in the Claim only
+        data_bytes = self.data_bytes.replace(b'test.jpg', b'TEST.jpg')
+        manifest = self.verifier.verify(data_bytes).active_manifest
+        self.assertEqual([status.code for status in manifest.failures], ['claimSignature.mismatch'])
+
+    def test_malformed_store(self):
+        # break the LBox of the Manifest inside the store
+        offset = self.data_bytes.find(b'jumb', self.data_bytes.find(b'jumb') + 4) - 4
+        data_bytes = bytearray(self.data_bytes)
+        data_bytes[offset:offset + 4] = (2**32 - 1).to_bytes(4, byteorder='big')
+        result = self.verifier.verify(data_bytes)
+        self.assertFalse(result.valid)
+        codes = [status.code for status in result.statuses]
+        for manifest in result.manifests:
+            codes += get_codes(manifest)
+        self.assertIn('manifest.malformed', codes)
+
+    def test_unsupported_key(self):
+        # the rsaEncryption OID of the x5chain keys becomes an unknown one
+        rsa_oid = bytes.fromhex('06092a864886f70d010101')
+        data_bytes = self.data_bytes.replace(rsa_oid, rsa_oid[:-1] + b'\x63')
+        manifest = self.verifier.verify(data_bytes).active_manifest
+        self.assertFalse(manifest.valid)
+        self.assertEqual([status.code for status in manifest.failures], ['algorithm.unsupported'])
+
+    def test_malformed_signature(self):
+        codec = get_codec()
+        for protected_header, x5chain, code in [
+                (codec.dumps({1: [-37]}), None, 'claimSignature.mismatch'),
+                (codec.dumps({1: {'alg': -37}}), None, 'claimSignature.mismatch'),
+                (None, [42], 'signingCredential.invalid'),
+                (None, 'x5chain', 'signingCredential.invalid')]:
+            signer = Signer(self.signer.private_key, self.signer.certificates)
+            signer.protected_header = protected_header or signer.protected_header
+            signer.x5chain = x5chain or signer.x5chain
+            manifest = self.verifier.verify(self.inject(create_jpeg(), signer=signer)).active_manifest
+            self.assertFalse(manifest.valid)
+            self.assertEqual([status.code for status in manifest.failures], [code])
+
+    def test_trust(self):
+        with open(os.path.join(Keys_dir, 'demo2_ca.crt.pem'), 'rb') as f:
+            trust_anchors = load_certificates(f.read())
+        manifest = Verifier(trust_anchors).verify(self.data_bytes).active_manifest
+        self.assertTrue(manifest.valid)
+        self.assertIn('signingCredential.trusted', get_codes(manifest))
+
+        # the signer certificate itself may be the anchor
+        manifest = Verifier(self.signer.certificates[:1]).verify(self.data_bytes).active_manifest
+        self.assertIn('signingCredential.trusted', get_codes(manifest))
+
+        # an x5chain without the CA is issued by the anchor
+        signer = Signer(self.signer.private_key, self.signer.certificates[:1])
+        data_bytes = self.inject(create_jpeg(), signer=signer)
+        manifest = Verifier(trust_anchors).verify(data_bytes).active_manifest
+        self.assertIn('signingCredential.trusted', get_codes(manifest))
+
+        manifest = Verifier([]).verify(self.data_bytes).active_manifest
+        self.assertFalse(manifest.valid)
+        self.assertEqual([status.code for status in manifest.failures], ['signingCredential.untrusted'])
+
+    def test_certificate_cache(self):
+        with open(os.path.join(Keys_dir, 'demo2_ca.crt.pem'), 'rb') as f:
+            trust_anchors = load_certificates(f.read())
+        cache = CertificateCache()
+        verifier = Verifier(trust_anchors, certificate_cache=cache)
+        verifier.verify(self.data_bytes)
+        # 2 certificates of the x5chain and the chain
+        self.assertEqual(cache.cache_info(), {'hits': 0, 'misses': 3, 'maxsize': 256, 'currsize': 3})
+
+        for i in range(3):
+            self.assertTrue(verifier.verify(self.data_bytes).valid)
+        self.assertEqual(cache.cache_info()['hits'], 9)
+        self.assertEqual(cache.cache_info()['misses'], 3)
+
+        # chain results are not shared by Verifiers with other anchors
+        result = Verifier([], certificate_cache=cache).verify(self.data_bytes)
+        self.assertEqual([status.code for status in result.active_manifest.failures],
+                         ['signingCredential.untrusted'])
+        self.assertEqual(cache.cache_info()['misses'], 4)
+
+        cache.clear()
+        self.assertEqual(cache.cache_info(), {'hits': 0, 'misses': 0, 'maxsize': 256, 'currsize': 0})
+
+    def test_certificate_cache_eviction(self):
+        cache = CertificateCache(maxsize=2)
+        ders = [certificate.public_bytes(Encoding.DER) for certificate in self.signer.certificates]
+        fingerprint, certificate, public_key = cache.get_certificate(ders[0])
+        self.assertEqual(certificate, self.signer.certificates[0])
+        self.assertEqual(fingerprint, certificate.fingerprint(hashes.SHA256()))
+        self.assertIs(cache.get_certificate(ders[0])[1], certificate)
+
+        cache.get_certificate(ders[1])
+        cache.get_chain_result('chain', lambda: 'result')
+        self.assertEqual(cache.cache_info()['currsize'], 2)
+        # the least recently used one was evicted
+        self.assertIsNot(cache.get_certificate(ders[0])[1], certificate)
+        self.assertEqual(cache.cache_info()['hits'], 1)
+
+        with self.assertRaises(ValueError):
+            cache.get_certificate(b'not a certificate')
+
+    def test_levels(self):
+        data_bytes = bytearray(self.data_bytes.replace(b'pyc2pa"}', b'PYC2PA"}'))
+        data_bytes[-10] ^= 0x01
+        expected = {
+            'structure': ([], []),
+            'signature': (['claimSignature.validated'], []),
+            'assertions': (['claimSignature.validated', 'assertion.hashedURI.match'],
+                           ['assertion.hashedURI.mismatch']),
+            'full': (['claimSignature.validated', 'assertion.hashedURI.match'],
+                     ['assertion.hashedURI.mismatch', 'assertion.dataHash.mismatch']),
+        }
+        for level, (successes, failures) in expected.items():
+            result = self.verifier.verify(data_bytes, level=level)
+            self.assertEqual(result.level, level)
+            manifest = result.active_manifest
+            self.assertEqual([s.code for s in manifest.statuses if s.success], successes)
+            self.assertEqual([s.code for s in manifest.failures], failures)
+            self.assertEqual(result.valid, len(failures) == 0)
+
+        with self.assertRaises(ValueError):
+            self.verifier.verify(self.data_bytes, level='fast')
+
+    def test_cheap_levels_do_not_hash(self):
+        with mock.patch('c2pa.verify.hash_data', side_effect=AssertionError), \
+                mock.patch('c2pa.verify.hashlib.new', side_effect=AssertionError):
+            for level in ['structure', 'signature']:
+                self.assertTrue(self.verifier.verify(self.data_bytes, level=level).valid)
+
+    def test_segmented_store(self):
+        # the depth map spans many App11 segments
+        depth_map = os.urandom(2 * 1024 * 1024)
+        assertions = {'c2pa.depthmap': {'type': '.cbor', 'data_bytes': json_to_cbor_bytes({'map': depth_map})}}
+        starling = Starling(create_jpeg(), 'test.jpg', assertions, 'numbersprotocol', 'pyc2pa',
+                            signer=self.signer)
+        data_bytes = starling.c2pa_injection()
+        self.assertGreater(len(get_app11_marker_segment_headers(data_bytes)), 30)
+        self.assertTrue(self.verifier.verify(data_bytes).valid)
+
+        # the cheap levels neither copy nor hash the depth map
+        with mock.patch('c2pa.verify.get_parts', side_effect=AssertionError):
+            for level in ['structure', 'signature']:
+                tracemalloc.start()
+                try:
+                    result = self.verifier.verify(data_bytes, level=level)
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+                self.assertTrue(result.valid)
+                self.assertLess(peak, len(depth_map) // 8)
+
+        data_bytes = data_bytes.replace(depth_map[1000:1100], bytes(100))
+        self.assertTrue(self.verifier.verify(data_bytes, level='signature').valid)
+        manifest = self.verifier.verify(data_bytes, level='assertions').active_manifest
+        self.assertEqual([status.code for status in manifest.failures], ['assertion.hashedURI.mismatch'])
+
+    def test_inject_file(self):
+        root = tempfile.mkdtemp()
+        try:
+            paths = [os.path.join(root, name) for name in ['in.jpg', 'out.jpg', 'out2.jpg']]
+            with open(paths[0], 'wb') as f:
+                f.write(create_jpeg())
+            assertions = {'stds.schema-org.CreativeWork': {'type': '.json', 'data_bytes': json_to_bytes({})}}
+            written = inject_file(paths[0], paths[1], assertions, 'numbersprotocol', 'pyc2pa',
+                                  signer=self.signer, media_name='test.jpg')
+            # a second Manifest is appended to the store of the output
+            inject_file(paths[1], paths[2], assertions, 'numbersprotocol', 'pyc2pa', signer=self.signer)
+
+            with open(paths[1], 'rb') as f:
+                data_bytes = f.read()
+            self.assertEqual(written, len(data_bytes))
+            self.assertTrue(self.verifier.verify(data_bytes).valid)
+            with open(paths[2], 'rb') as f:
+                result = self.verifier.verify(f.read())
+            self.assertTrue(result.valid)
+            self.assertEqual(len(result.manifests), 2)
+
+            with self.assertRaises(ValueError):
+                inject_file(paths[0], paths[0], assertions, 'numbersprotocol', 'pyc2pa', signer=self.signer)
+
+            # a failed write leaves no partial output
+            with mock.patch('c2pa.starling.write_spliced', side_effect=OSError(28, 'No space left')):
+                with self.assertRaises(OSError):
+                    inject_file(paths[0], paths[1], assertions, 'numbersprotocol', 'pyc2pa', signer=self.signer)
+            self.assertFalse(os.path.exists(paths[1]))
+            # the output is not opened, and nothing is removed
+            with self.assertRaises(IsADirectoryError):
+                inject_file(paths[0], root, assertions, 'numbersprotocol', 'pyc2pa', signer=self.signer)
+            self.assertTrue(os.path.isdir(root))
+            with self.assertRaises(FileNotFoundError):
+                inject_file(paths[0], os.path.join(root, 'missing', 'out.jpg'), assertions,
+                            'numbersprotocol', 'pyc2pa', signer=self.signer)
+        finally:
+            shutil.rmtree(root)
+
+    def test_uri_labels(self):
+        self.assertEqual(get_uri_labels('self#jumbf=c2pa/a:b/c2pa.claim'), ['c2pa', 'a:b', 'c2pa.claim'])
+        self.assertEqual(get_uri_labels('self#jumbf=/c2pa/a'), ['c2pa', 'a'])
+        self.assertIsNone(get_uri_labels('https://example.com/c2pa'))
+        self.assertIsNone(get_uri_labels(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from c2pa.jumbf import json_to_bytes
+from c2pa.signer import Signer
+from c2pa.starling import Starling
+from c2pa.verify_tool import get_percentile
+from c2pa.verify_tool import iter_batches
+from c2pa.verify_tool import iter_paths
+from c2pa.verify_tool import main
+from c2pa.verify_tool import verify_files
+
+from helpers import create_jpeg
+
+Root_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+Keys_dir = os.path.join(Root_dir, 'data', 'Keys')
+
+
+class TestVerifyTool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with open(os.path.join(Keys_dir, 'demo2_user1.p12'), 'rb') as f:
+            signer = Signer.from_pkcs12(f.read(), b'1234')
+        with open(os.path.join(Keys_dir, 'demo2_ca.crt.pem'), 'rb') as f:
+            cls.trust = [f.read()]
+
+        cls.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(cls.root, 'sub'))
+        assertions = {'stds.schema-org.CreativeWork': {'type': '.json', 'data_bytes': json_to_bytes({})}}
+        cls.valid_paths = []
+        for i in range(5):
+            path = os.path.join(cls.root, 'sub' if i % 2 else '', '{}.jpg'.format(i))
+            starling = Starling(create_jpeg(), 'test.jpg', assertions, 'numbersprotocol', 'pyc2pa',
+                                signer=signer)
+            with open(path, 'wb') as f:
+                f.write(starling.c2pa_injection())
+            cls.valid_paths.append(path)
+        cls.invalid_path = os.path.join(cls.root, 'sub', 'plain.JPEG')
+        with open(cls.invalid_path, 'wb') as f:
+            f.write(create_jpeg())
+        with open(os.path.join(cls.root, 'notes.txt'), 'w') as f:
+            f.write('not an image')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.root)
+
+    def test_iter_paths(self):
+        paths = list(iter_paths([self.root]))
+        self.assertEqual(sorted(paths), sorted(self.valid_paths + [self.invalid_path]))
+        files_from = io.StringIO('a.jpg\n\nb.jpg\r\n')
+        self.assertEqual(list(iter_paths(['c.png'], files_from)), ['c.png', 'a.jpg', 'b.jpg'])
+
+    def test_iter_batches(self):
+        self.assertEqual(list(iter_batches(range(5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(iter_batches([], 2)), [])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(get_percentile(values, 50), 50)
+        self.assertEqual(get_percentile(values, 99), 99)
+        self.assertEqual(get_percentile([3.0], 90), 3.0)
+        self.assertIsNone(get_percentile([], 50))
+
+    def test_verify_files(self):
+        output = io.StringIO()
+        paths = iter_paths([self.root, os.path.join(self.root, 'missing.jpg')])
+        summary = verify_files(paths, output, trust=self.trust, jobs=2, batch_size=2).to_json()
+
+        records = {record['path']: record for record in map(json.loads, output.getvalue().splitlines())}
+        self.assertEqual(len(records), 7)
+        for path in self.valid_paths:
+            self.assertTrue(records[path]['valid'])
+            codes = [status['code'] for status in records[path]['manifests'][-1]['statuses']]
+            self.assertIn('signingCredential.trusted', codes)
+        self.assertFalse(records[self.invalid_path]['valid'])
+        self.assertIn('error', records[os.path.join(self.root, 'missing.jpg')])
+
+        self.assertEqual(summary['files'], 7)
+        self.assertEqual(summary['valid'], 5)
+        self.assertEqual(summary['invalid'], 1)
+        self.assertEqual(summary['errors'], 1)
+        self.assertIsNotNone(summary['latency_p99_ms'])
+        # every file has the same x5chain
+        self.assertGreater(summary['certificate_cache_hits'], 0)
+        self.assertLessEqual(summary['certificate_cache_misses'], 2 * 3)
+
+    def test_main(self):
+        output = os.path.join(self.root, 'results.jsonl')
+        self.assertEqual(main(self.valid_paths + ['-j', '1', '-o', output]), 0)
+        with open(output) as f:
+            self.assertEqual(len(f.readlines()), 5)
+        self.assertEqual(main([self.invalid_path, '-j', '1', '-o', output]), 1)
+
+    def test_malformed_app11_output(self):
+        # corrupt the TBox of the first App11 segment
+        path = os.path.join(self.root, 'malformed.jpg')
+        with open(self.valid_paths[0], 'rb') as f:
+            data_bytes = bytearray(f.read())
+        offset = data_bytes.find(b'\xff\xeb')
+        data_bytes[offset + 16:offset + 20] = b'xumb'
+        with open(path, 'wb') as f:
+            f.write(data_bytes)
+        try:
+            result = subprocess.run(
+                [sys.executable, '-m', 'c2pa.verify_tool', path, self.valid_paths[1], '-j', '1'],
+                env=dict(os.environ, PYTHONPATH=Root_dir), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        finally:
+            os.remove(path)
+        # warnings go to stderr, stdout is JSON lines only
+        records = [json.loads(line) for line in result.stdout.decode('utf-8').splitlines()]
+        self.assertEqual(len(records), 2)
+        self.assertEqual(result.returncode, 1)
+        self.assertIn(b'TBox (xumb)', result.stderr)
+
+    def test_level(self):
+        # only the image data is edited
+        path = os.path.join(self.root, 'edited.jpg')
+        with open(self.valid_paths[0], 'rb') as f:
+            data_bytes = bytearray(f.read())
+        data_bytes[-10] ^= 0x01
+        with open(path, 'wb') as f:
+            f.write(data_bytes)
+        output = os.path.join(self.root, 'results.jsonl')
+        try:
+            self.assertEqual(main([path, '-j', '1', '-o', output, '--level', 'assertions']), 0)
+            self.assertEqual(main([path, '-j', '1', '-o', output]), 1)
+            with open(output) as f:
+                self.assertEqual(json.loads(f.readline())['level'], 'full')
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
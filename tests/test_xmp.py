@@ -0,0 +1,167 @@
+import hashlib
+import tracemalloc
+import unittest
+
+from c2pa.core import get_xmp_tag
+from c2pa.jpeg import Jpeg_markers
+from c2pa.jpeg import Xmp_extension_namespace
+from c2pa.jpeg import Xmp_namespace
+from c2pa.jpeg import create_jpeg_segment
+from c2pa.jpeg import get_jpeg_segments
+from c2pa.jpeg import get_xmp_segments
+from c2pa.xmp import Xmp_namespaces
+from c2pa.xmp import fit_padding
+from c2pa.xmp import get_xmp_property
+from c2pa.xmp import plan_provenance_edit
+from c2pa.xmp import read_xmp_property
+from c2pa.xmp import set_provenance
+from c2pa.xmp import set_xmp_property
+
+
+# XMP packet as written by exiv2
+Exiv2_packet = (
+    '<?xpacket begin="\ufeff" id="W5M0MpCehiHzreSzNTczkc9d"?>\n'
+    '<x:xmpmeta xmlns:x="adobe:ns:meta/" x:xmptk="XMP Core 4.4.0-Exiv2">\n'
+    ' <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">\n'
+    '  <rdf:Description rdf:about=""\n'
+    '    xmlns:dcterms="http://purl.org/dc/terms/"\n'
+    '   dcterms:provenance="self#jumbf=c2pa/old/c2pa.claim"/>\n'
+    ' </rdf:RDF>\n'
+    '</x:xmpmeta>\n'
+    + ' ' * 200 + '\n'
+    '<?xpacket end="w"?>'
+).encode('utf-8')
+
+
+def create_jpeg(*segments):
+    return (b'\xff\xd8'
+            + create_jpeg_segment(Jpeg_markers['APP0'], b'JFIF\x00\x01\x01')
+            + b''.join(segments)
+            + create_jpeg_segment(Jpeg_markers['SOS'], b'\x01\x01\x00\x00\x3f\x00')
+            + b'\x12\x34'
+            + b'\xff\xd9')
+
+
+def get_packet(data_bytes):
+    segments = get_xmp_segments(data_bytes, get_jpeg_segments(data_bytes))
+    return bytes(segments[0].get_payload(data_bytes)[len(Xmp_namespace):])
+
+
+class TestXmp(unittest.TestCase):
+    def test_insert_packet(self):
+        data_bytes = create_jpeg()
+        updated = set_provenance(data_bytes, 'manifest')
+
+        markers = [segment.marker for segment in get_jpeg_segments(updated)]
+        self.assertEqual(markers, [0xFFD8, 0xFFE0, 0xFFE1, 0xFFDA])
+        self.assertIn(b'dcterms:provenance="self#jumbf=c2pa/manifest/c2pa.claim"', get_packet(updated))
+        self.assertTrue(updated.endswith(data_bytes[2 + 11:]))
+
+    def test_replace_attribute(self):
+        xmp_segment = create_jpeg_segment(Jpeg_markers['APP1'], Xmp_namespace + Exiv2_packet)
+        data_bytes = create_jpeg(xmp_segment)
+
+        start, end, segment = plan_provenance_edit(data_bytes, 'manifest')
+        self.assertEqual(data_bytes[start:end], xmp_segment)
+        # the packet padding absorbs the longer label
+        self.assertEqual(len(segment), len(xmp_segment))
+
+        packet = get_packet(set_provenance(data_bytes, 'manifest'))
+        self.assertIn(b'dcterms:provenance="self#jumbf=c2pa/manifest/c2pa.claim"', packet)
+        self.assertNotIn(b'/old/', packet)
+        self.assertIn(b'x:xmptk="XMP Core 4.4.0-Exiv2"', packet)
+
+    def test_element_and_escape(self):
+        packet = ('<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF xmlns:rdf="{}">'
+                  '<rdf:Description xmlns:dc="{}"><dc:provenance>old</dc:provenance>'
+                  '</rdf:Description></rdf:RDF></x:xmpmeta>').format(
+                      Xmp_namespaces['rdf'], Xmp_namespaces['dcterms'])
+        updated = set_xmp_property(packet, Xmp_namespaces['dcterms'], 'provenance', 'a"<b')
+        self.assertIn('<dc:provenance>a&quot;&lt;b</dc:provenance>', updated)
+
+    def test_add_property(self):
+        packet = ('<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF xmlns:rdf="{}">'
+                  '<rdf:Description rdf:about="" xmlns:dc="http://purl.org/dc/elements/1.1/"/>'
+                  '</rdf:RDF></x:xmpmeta>').format(Xmp_namespaces['rdf'])
+        updated = set_xmp_property(packet, Xmp_namespaces['dcterms'], 'provenance', 'value')
+        self.assertIn('xmlns:dcterms="http://purl.org/dc/terms/" dcterms:provenance="value"/>', updated)
+        self.assertTrue(updated.endswith('</rdf:RDF></x:xmpmeta>'))
+
+        with self.assertRaises(ValueError):
+            set_xmp_property('<x:xmpmeta/>', Xmp_namespaces['dcterms'], 'provenance', 'value')
+
+    def test_fit_padding(self):
+        self.assertEqual(len(fit_padding(Exiv2_packet, len(Exiv2_packet) + 100)), len(Exiv2_packet) + 100)
+        self.assertEqual(len(fit_padding(Exiv2_packet, len(Exiv2_packet) - 150)), len(Exiv2_packet) - 150)
+        # not enough padding
+        self.assertEqual(fit_padding(Exiv2_packet, 10), Exiv2_packet)
+
+
+class TestXmpReader(unittest.TestCase):
+    def test_no_xmp(self):
+        data_bytes = create_jpeg()
+        self.assertIsNone(read_xmp_property(data_bytes, Xmp_namespaces['dcterms'], 'provenance'))
+        self.assertEqual(get_xmp_tag(data_bytes), '')
+        self.assertEqual(get_xmp_tag(b'\x89PNG\r\n'), '')
+
+    def test_read_attribute(self):
+        data_bytes = create_jpeg(create_jpeg_segment(Jpeg_markers['APP1'], Xmp_namespace + Exiv2_packet))
+        self.assertEqual(get_xmp_tag(data_bytes), 'self#jumbf=c2pa/old/c2pa.claim')
+        self.assertEqual(get_xmp_tag(data_bytes, 'Xmp.dc.title'), '')
+        self.assertEqual(get_xmp_tag(set_provenance(data_bytes, 'a&b')),
+                         'self#jumbf=c2pa/a&b/c2pa.claim')
+
+        with self.assertRaises(ValueError):
+            get_xmp_tag(data_bytes, 'Xmp.unknown.provenance')
+
+    def test_read_element(self):
+        packet = ('<rdf:Description xmlns:dc="{}"><dc:provenance rdf:parseType="Literal">'
+                  'a &amp; b</dc:provenance></rdf:Description>').format(Xmp_namespaces['dcterms'])
+        self.assertEqual(get_xmp_property(packet, Xmp_namespaces['dcterms'], 'provenance'), 'a & b')
+
+    def test_extended_xmp(self):
+        extended = ('<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF xmlns:rdf="{}">'
+                    '<rdf:Description rdf:about="" xmlns:dcterms="{}" dcterms:provenance="{}"/>'
+                    '</rdf:RDF></x:xmpmeta>').format(
+                        Xmp_namespaces['rdf'], Xmp_namespaces['dcterms'], 'x' * 100).encode('utf-8')
+        guid = hashlib.md5(extended).hexdigest().upper()
+        standard = ('<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF xmlns:rdf="{}">'
+                    '<rdf:Description rdf:about="" xmlns:xmpNote="{}" xmpNote:HasExtendedXMP="{}"/>'
+                    '</rdf:RDF></x:xmpmeta>').format(
+                        Xmp_namespaces['rdf'], Xmp_namespaces['xmpNote'], guid).encode('utf-8')
+
+        def create_chunk(offset, size):
+            return create_jpeg_segment(
+                Jpeg_markers['APP1'],
+                Xmp_extension_namespace + guid.encode('ascii')
+                + len(extended).to_bytes(4, byteorder='big')
+                + offset.to_bytes(4, byteorder='big')
+                + extended[offset:offset + size])
+
+        # chunks may come in any order
+        data_bytes = create_jpeg(create_jpeg_segment(Jpeg_markers['APP1'], Xmp_namespace + standard),
+                                 create_chunk(100, len(extended)),
+                                 create_chunk(0, 100))
+        self.assertEqual(get_xmp_tag(data_bytes), 'x' * 100)
+
+        incomplete = create_jpeg(create_jpeg_segment(Jpeg_markers['APP1'], Xmp_namespace + standard),
+                                 create_chunk(0, 100))
+        self.assertEqual(get_xmp_tag(incomplete), '')
+
+        # the declared length of a chunk does not size the packet
+        oversized = create_jpeg(create_jpeg_segment(Jpeg_markers['APP1'], Xmp_namespace + standard),
+                                create_jpeg_segment(Jpeg_markers['APP1'],
+                                                    Xmp_extension_namespace + guid.encode('ascii')
+                                                    + (2 ** 31).to_bytes(4, byteorder='big')
+                                                    + bytes(4) + extended[:10]))
+        tracemalloc.start()
+        try:
+            self.assertEqual(get_xmp_tag(oversized), '')
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertLess(peak, 1024 * 1024)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,17 +1,23 @@
-import re
 import sys
 
+from c2pa.jpeg import Jpeg_markers
+from c2pa.jpeg import get_jpeg_segments
+
 
 img = sys.argv[1]
 
 f = open(img, 'rb').read()
 
-marker = b'\xff\xeb'
-
-offsets = [m.start() for m in re.finditer(marker, f)]
+segments = get_jpeg_segments(f)
 
 final_lbox = 0
-for offset in offsets:
+for segment in segments:
+    offset = segment.offset
+    if segment.marker != Jpeg_markers['APP11']:
+        print('# Offset: {0}, Marker: {1}, Length: {2}'.format(
+            offset, hex(segment.marker), segment.length))
+        continue
+
     Le = int.from_bytes(f[offset + 2: offset + 4], byteorder='big')
     En = int.from_bytes(f[offset + 6: offset + 8], byteorder='big')
     Z = int.from_bytes(f[offset + 8: offset + 12], byteorder='big')